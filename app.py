@@ -1,138 +1,101 @@
-from datetime import datetime 
-import os
-import re
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from flask import Flask, Response, request
+# Primero: el presupuesto de arranque se mide desde esta importación
+from arranque import arranque
+from functools import lru_cache
+from flask import Flask, Response, jsonify, request
 from twilio.twiml.messaging_response import MessagingResponse  # type: ignore
-from openai import OpenAI
 from dotenv import load_dotenv
+from bd import cursor_bd, obtener_pool, sesion_bd
+from diario_mensajes import diario
+from escritor_intereses import intereses
+from idempotencia import procesados
+from indice_catalogo import obtener_indice
+from ingesta import ingresar_mensaje_cliente
+from intenciones import detectar_intencion
+from llm import ErrorLLM, llm, respuesta_de_respaldo
+from metricas import error, etapa, exportar, fuente_respuesta, peticion, recolectar
+from prompts import recortar_historial
+from respuestas_async import (
+    MENSAJE_ERROR,
+    RESPUESTA_ASINCRONA,
+    PoolRespuestas,
+    enviar_whatsapp,
+)
+from respuestas_directas import respuesta_directa
+from sesiones import crear_sesiones
+from sinonimos import normalizador, reemplazar_sinonimos
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+app = Flask(__name__)
+# Historial por número, sin el prompt de sistema (se antepone al llamar a OpenAI)
+conversaciones = crear_sesiones()
+recolectar("sesiones", "almacen", "conversaciones", conversaciones.estadisticas)
+recolectar("mensajes", "escritor", "mensajes", diario.estadisticas)
+recolectar("idempotencia", "webhook", "whatsapp", procesados.estadisticas)
+recolectar("pool_bd", "pool", "principal", lambda: obtener_pool().estado())
 
-with open("contexto.txt", "r", encoding="utf-8") as f:
-    contexto_negocio = f.read()
 
-app = Flask(__name__)
-conversaciones = {}
-
-# === SINÓNIMOS ===
-SINONIMOS = {
-    "libretas": "cuaderno",
-    "libreta": "cuaderno",
-    "adhesivos": "stickers",
-    "pegatinas": "stickers",
-    "adhesivo": "stickers",
-    "lapiceros": "lápices de colores",
-    "lapicero": "lápices de colores",
-    "respuesto de hojas": "hojas",
-    "respuestos": "hojas",
-    "respuesto": "hojas",
-    "hojitas": "hojas",
-    "marcador": "marcadores",
-    "marcadores stabilo": "bolígrafos",
-    "lapiceras": "bolígrafos",
-    "lapicera": "bolígrafos",
-    "corrector": "correctores",
-    "goma": "correctores",
-    "estuche": "estucheras",
-    "cartuchera": "estucheras",
-    "porta lápiz": "estucheras",
-    "porta lapiz": "estucheras",
-}
-
-
-def conectar_bd():
-    return psycopg2.connect(os.getenv("DATABASE_URL"), cursor_factory=RealDictCursor)
-
-
-def reemplazar_sinonimos(texto):
-    texto = texto.lower()
-    for sin, real in SINONIMOS.items():
-        texto = re.sub(rf"\b{re.escape(sin)}\b", real, texto)
-    return texto
+@lru_cache(maxsize=1)
+def contexto_negocio():
+    with open("contexto.txt", "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# === CALENTAMIENTO (/healthz) ===
+def _recargar_sinonimos():
+    try:
+        normalizador.recargar_desde_bd()
+    except Exception as e:
+        print(
+            "⚠️ No se pudo leer la tabla Sinonimo, se usan los sinónimos por defecto:",
+            e,
+        )
+
+
+def _probar_bd():
+    with cursor_bd() as cur:
+        cur.execute("SELECT 1;")
+
+
+PASOS_CALENTAMIENTO = [
+    ("bd", _probar_bd),
+    ("sinonimos", _recargar_sinonimos),
+    ("contexto", contexto_negocio),
+    ("indice", obtener_indice),
+    ("llm", lambda: llm.cliente),
+]
 
 
 # === GUARDAR Y VINCULAR CHAT / MENSAJE / INTERÉS ===
-def obtener_chat_id(telefono):
-    conn = conectar_bd()
-    cur = conn.cursor()
-
-    # Buscar cliente y chat abierto
-    cur.execute(
-        """
-        SELECT c.id AS chat_id, cl.nombre
-        FROM Chat c
-        JOIN Cliente cl ON c.cliente_id = cl.id
-        WHERE cl.telefono = %s AND c.estado = 'abierto'
-        ORDER BY c.fecha_inicio DESC LIMIT 1;
-    """,
-        (telefono,),
-    )
-    chat = cur.fetchone()
+@etapa("guardar_mensaje")
+def guardar_mensaje(chat_id, contenido, emisor="cliente", tipo="texto"):
+    # Se escribe por lotes en segundo plano (ver diario_mensajes.py)
+    diario.guardar(chat_id, contenido, emisor=emisor, tipo=tipo)
 
-    if chat:
-        conn.close()
-        return chat["chat_id"], chat["nombre"]
 
-    # Crear cliente si no existe
-    cur.execute("SELECT id, nombre FROM Cliente WHERE telefono = %s;", (telefono,))
-    cliente = cur.fetchone()
-    if not cliente:
+@etapa("historial")
+def reconstruir_historial(chat_id, incluir_sistema=True):
+    with cursor_bd() as cur, diario.lectura():
         cur.execute(
             """
-            INSERT INTO Cliente (nombre, telefono) VALUES (%s, %s) RETURNING id;
+            SELECT emisor, contenido,
+                   EXTRACT(EPOCH FROM fecha_envio::timestamptz)::float AS ts
+            FROM Mensaje
+            WHERE chat_id = %s
+            ORDER BY fecha_envio ASC;
         """,
-            ("Invitado", telefono),
+            (chat_id,),
         )
-        cliente_id = cur.fetchone()["id"]
-        nombre_cliente = "Invitado"
-    else:
-        cliente_id = cliente["id"]
-        nombre_cliente = cliente["nombre"]
-
-    # Crear nuevo chat
-    cur.execute(
-        "INSERT INTO Chat (cliente_id) VALUES (%s) RETURNING id;", (cliente_id,)
-    )
-    chat_id = cur.fetchone()["id"]
-    conn.commit()
-    conn.close()
-    return chat_id, nombre_cliente
+        mensajes = cur.fetchall()
+        pendientes = [e._asdict() for e in diario.pendientes(chat_id)]
+    # Lo que el diario aún no escribió se intercala por fecha: el mensaje del
+    # cliente se inserta al ingresar y puede ser posterior a la última
+    # respuesta, que sigue en el diario
+    mensajes = sorted(mensajes + pendientes, key=lambda m: m["ts"])
 
-
-def guardar_mensaje(chat_id, contenido, emisor="cliente", tipo="texto"):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO Mensaje (chat_id, emisor, tipo, contenido)
-        VALUES (%s, %s, %s, %s);
-    """,
-        (chat_id, emisor, tipo, contenido),
-    )
-    conn.commit()
-    conn.close()
-
-
-def reconstruir_historial(chat_id):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT emisor, contenido
-        FROM Mensaje
-        WHERE chat_id = %s
-        ORDER BY fecha_envio ASC;
-    """,
-        (chat_id,),
-    )
-    mensajes = cur.fetchall()
-    conn.close()
-
-    historial = [{"role": "system", "content": contexto_negocio}]
+    historial = []
+    if incluir_sistema:
+        historial.append({"role": "system", "content": contexto_negocio()})
 
     for m in mensajes:
         if m["emisor"] == "cliente":
@@ -144,193 +107,170 @@ def reconstruir_historial(chat_id):
 
 
 def registrar_interes(chat_id, producto_id):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO InteresProductoChat (chat_id, producto_id)
-        VALUES (%s, %s);
-    """,
-        (chat_id, producto_id),
-    )
-    conn.commit()
-    conn.close()
-
-
-def ya_saludo_hoy(chat_id):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT contenido, fecha_envio::date
-        FROM Mensaje
-        WHERE chat_id = %s AND emisor = 'sistema'
-        ORDER BY fecha_envio DESC
-        LIMIT 1;
-    """,
-        (chat_id,),
-    )
-    mensaje = cur.fetchone()
-    conn.close()
-
-    if not mensaje:
-        return False
-
-    hoy = datetime.now().date()
-    return mensaje["fecha_envio"] == hoy and "hola" in mensaje["contenido"].lower()
+    # Se escribe por lotes en segundo plano (ver escritor_intereses.py)
+    intereses.registrar(chat_id, producto_id)
 
 
 # === CONSULTA INTELIGENTE A BD ===
+@etapa("consultar_producto")
 def consultar_producto(pregunta, chat_id=None):
-    conn = conectar_bd()
-    cur = conn.cursor()
     pregunta = reemplazar_sinonimos(pregunta)
+    indice = obtener_indice()
+    intencion = detectar_intencion(pregunta, indice)
+    # Una categoría mencionada, aunque no se pida la lista, se responde con ella
+    if intencion.tipo is None and intencion.categoria_id is not None:
+        intencion = intencion._replace(tipo="categoria", confianza=1.0)
+
+    if chat_id:
+        if intencion.productos:
+            for producto_id in intencion.productos:
+                if indice.productos[producto_id].precio is not None:
+                    registrar_interes(chat_id, producto_id)
+        elif intencion.tipo == "categoria":
+            for p in indice.productos_de_categoria(intencion.categoria_id):
+                registrar_interes(chat_id, p.id)
+
+    # Precio, stock, categorías y promociones con plantillas (None: al LLM)
+    return respuesta_directa(intencion)
+
+
+def responder_mensaje(
+    numero_completo, chat_id, nombre_cliente, saludo_hecho, incoming_msg
+):
+    # Una sola conexión del pool para las consultas previas; se devuelve antes
+    # de llamar al LLM, que puede tardar segundos
+    with sesion_bd():
+        # Reconstrucción persistente (también cuando la caché expulsó la sesión)
+        if conversaciones.get(numero_completo) is None:
+            historial = reconstruir_historial(chat_id, incluir_sistema=False)
+            conversaciones[numero_completo] = historial
+            if not saludo_hecho:
+                saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
+                guardar_mensaje(chat_id, saludo, emisor="sistema")
+                print("👋 Se envió saludo inicial.")
+                fuente_respuesta("saludo")
+                return saludo
 
-    productos = [
-        "ABT Pro",
-        "Cuaderno A4",
-        "Cuaderno Infinito A4",
-        "Cuaderno Infinito A5",
-        "Libro Stickers Vinta",
-        "Nota Transparente Grande",
-        "Nota Transparente Mediana",
-        "Pad 200 hojas",
-        "Pigma Micropen",
-        "Repuesto A5",
-        "Sticker Imágenes",
-        "Sticker Princesas",
-        "Sticker Vintage",
-        "Stickers Retro",
-        "Tablero Poccaco",
-    ]
-
-    for nombre in productos:
-        if nombre.lower() in pregunta:
-            cur.execute(
-                """
-                SELECT p.id, p.nombre, p.stock, pp.monto
-                FROM Producto p
-                JOIN PrecioProducto pp ON p.id = pp.producto_id
-                WHERE p.nombre = %s AND pp.lista_precio_id = 1;
-            """,
-                (nombre,),
-            )
-            resultado = cur.fetchone()
-            if resultado:
-                if chat_id:
-                    registrar_interes(chat_id, resultado["id"])
-                conn.close()
-                return f"{resultado['nombre']}: Bs. {resultado['monto']}, stock disponible: {resultado['stock']}"
-            else:
-                conn.close()
-                return f"No se encontró información para {nombre}."
-
-    # Categoría específica
-    cur.execute("SELECT id, nombre FROM Categoria;")
-    categorias = cur.fetchall()
-    for cat in categorias:
-        if cat["nombre"].lower() in pregunta:
-            cur.execute(
-                """
-                SELECT nombre, id FROM Producto
-                WHERE categoria_id = %s;
-            """,
-                (cat["id"],),
+        # Consultar si se puede responder desde la BD
+        respuesta_bd = consultar_producto(incoming_msg, chat_id=chat_id)
+    if respuesta_bd:
+        guardar_mensaje(chat_id, respuesta_bd, emisor="sistema")
+        print("📦 Se respondió desde base de datos.")
+        fuente_respuesta("plantilla")
+        return respuesta_bd
+    else:
+        print("🔍 No se encontró respuesta en BD. Enviando a OpenAI...")
+
+    conversaciones.agregar(numero_completo, {"role": "user", "content": incoming_msg})
+
+    try:
+        with etapa("llm"):
+            # Sistema + pregunta actual + los turnos que entren en el presupuesto
+            mensajes = recortar_historial(
+                {"role": "system", "content": contexto_negocio()},
+                conversaciones[numero_completo],
+                incoming_msg,
+                modelo="gpt-3.5-turbo",
             )
-            productos_cat = cur.fetchall()
-            conn.close()
-            if productos_cat:
-                nombres = [p["nombre"] for p in productos_cat]
-                if chat_id:
-                    for p in productos_cat:
-                        registrar_interes(chat_id, p["id"])
-                return (
-                    f"Los productos en la categoría {cat['nombre']} son:\n- "
-                    + "\n- ".join(nombres)
-                )
-            else:
-                return f"No hay productos en la categoría {cat['nombre']}."
-
-    # Resumen de categorías
-    if "categoría" in pregunta or "categorias" in pregunta:
-        cur.execute(
-            """
-            SELECT c.nombre, COUNT(p.id) as cantidad
-            FROM Categoria c
-            LEFT JOIN Producto p ON p.categoria_id = c.id
-            GROUP BY c.nombre;
-        """
-        )
-        lista = cur.fetchall()
-        conn.close()
-        return "\n".join([f"{c['nombre']}: {c['cantidad']} productos" for c in lista])
+            reply = llm.completar(model="gpt-3.5-turbo", messages=mensajes)
+        print("🤖 Respuesta generada por OpenAI.")
+        fuente_respuesta("llm")
+    except ErrorLLM as e:
+        with etapa("respaldo"):
+            reply = respuesta_de_respaldo(reemplazar_sinonimos(incoming_msg))
+        print("🛟 OpenAI no respondió, se usó el catálogo:", e)
+        fuente_respuesta("respaldo")
+
+    if not reply:
+        reply = "Lo siento, no entendí tu mensaje. ¿Podrías reformularlo?"
+
+    conversaciones.agregar(numero_completo, {"role": "assistant", "content": reply})
+    guardar_mensaje(chat_id, reply, emisor="sistema")
+    return reply
 
-    conn.close()
-    return None
+
+def responder_en_segundo_plano(*args):
+    # args[0] es el número. En el proceso sus mensajes ya van a un solo
+    # worker; el bloqueo los ordena frente a otros procesos
+    with peticion("segundo_plano"), conversaciones.bloqueo(args[0]):
+        return responder_mensaje(*args)
+
+
+respuestas = PoolRespuestas(responder_en_segundo_plano)
 
 
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp():
-    try:
-        numero_completo = request.values.get("From", "")  # Ej: whatsapp:+591...
-        user_number = numero_completo.replace("whatsapp:", "")
-        incoming_msg = request.values.get("Body", "").strip()
+    message_sid = request.values.get("MessageSid")
+    destino, origen = request.values.get("From", ""), request.values.get("To")
+    resp = MessagingResponse()
+    # El MessageSid de Twilio sirve de id de la petición en los logs JSON
+    with peticion("whatsapp", message_sid):
+        try:
+            # Un reintento de Twilio recibe la respuesta original sin recalcularla;
+            # si se cansa de esperar, la respuesta sale luego por la API REST
+            reply = procesados.procesar(
+                message_sid,
+                _whatsapp,
+                entregar=lambda texto: enviar_whatsapp(destino, texto, origen),
+            )
+        except Exception as e:
+            print("❌ Error en /whatsapp:", e)
+            error("whatsapp", str(e), fallida=True)
+            reply = MENSAJE_ERROR
+        if reply:
+            resp.message(reply)
+        return Response(str(resp), content_type="application/xml")
 
-        resp = MessagingResponse()
-        msg = resp.message()
 
-        print(f"📩 Mensaje recibido de {user_number}: {incoming_msg}")
+def _whatsapp():
+    """Respuesta al mensaje de la petición en curso ("" si va en segundo plano)."""
+    numero_completo = request.values.get("From", "")  # Ej: whatsapp:+591...
+    user_number = numero_completo.replace("whatsapp:", "")
+    incoming_msg = request.values.get("Body", "").strip()
 
-        chat_id, nombre_cliente = obtener_chat_id(user_number)
-        guardar_mensaje(chat_id, incoming_msg, emisor="cliente")
+    print(f"📩 Mensaje recibido de {user_number}: {incoming_msg}")
 
-        # Reconstrucción persistente
-        if numero_completo not in conversaciones:
-            historial = reconstruir_historial(chat_id)
-            conversaciones[numero_completo] = historial
-            if not ya_saludo_hoy(chat_id):
-                saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
-                guardar_mensaje(chat_id, saludo, emisor="sistema")
-                msg.body(saludo)
-                print("👋 Se envió saludo inicial.")
-                return Response(str(resp), content_type="application/xml")
-
-        # Consultar si se puede responder desde la BD
-        respuesta_bd = consultar_producto(incoming_msg, chat_id=chat_id)
-        if respuesta_bd:
-            guardar_mensaje(chat_id, respuesta_bd, emisor="sistema")
-            msg.body(respuesta_bd)
-            print("📦 Se respondió desde base de datos.")
-            return Response(str(resp), content_type="application/xml")
-        else:
-            print("🔍 No se encontró respuesta en BD. Enviando a OpenAI...")
-
-        conversaciones[numero_completo].append(
-            {"role": "user", "content": incoming_msg}
+    # Sin sesion_bd() aquí: cada paso toma la conexión solo mientras la usa,
+    # así una respuesta lenta del LLM no deja el pool sin conexiones
+    with etapa("ingreso"):
+        chat_id, nombre_cliente, saludo_hecho = ingresar_mensaje_cliente(
+            user_number, incoming_msg
         )
+    args = (
+        numero_completo,
+        chat_id,
+        nombre_cliente,
+        saludo_hecho,
+        incoming_msg,
+    )
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", messages=conversaciones[numero_completo]
-        )
-        reply = response.choices[0].message.content.strip()
+    # Modo asíncrono: se confirma a Twilio ya y se responde por la API REST
+    if RESPUESTA_ASINCRONA and respuestas.encolar(
+        numero_completo, request.values.get("To"), *args
+    ):
+        print("📨 Mensaje encolado para respuesta en segundo plano.")
+        return ""
 
-        if not reply:
-            reply = "Lo siento, no entendí tu mensaje. ¿Podrías reformularlo?"
+    with conversaciones.bloqueo(numero_completo):
+        reply = responder_mensaje(*args)
 
-        conversaciones[numero_completo].append({"role": "assistant", "content": reply})
-        guardar_mensaje(chat_id, reply, emisor="sistema")
-        msg.body(reply)
-        print("🤖 Respuesta generada por OpenAI.")
-        return Response(str(resp), content_type="application/xml")
+    return reply
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(exportar(), content_type="text/plain; version=0.0.4")
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    cuerpo, codigo = arranque.salud()
+    return jsonify(cuerpo), codigo
 
-    except Exception as e:
-        print("❌ Error en /whatsapp:", e)
-        resp = MessagingResponse()
-        msg = resp.message(
-            "Ocurrió un error al procesar tu mensaje. Intenta nuevamente."
-        )
-        return Response(str(resp), content_type="application/xml")
 
+arranque.importado()
+arranque.calentar_en_segundo_plano(PASOS_CALENTAMIENTO)
 
 if __name__ == "__main__":
     app.run(debug=True)
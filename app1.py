@@ -1,657 +1,441 @@
+# Primero: el presupuesto de arranque se mide desde esta importación
+from arranque import arranque
 import os
-import re
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from flask import Flask, Response, request
+import threading
+from flask import Flask, Response, jsonify, request
 from twilio.twiml.messaging_response import MessagingResponse
-from openai import OpenAI
 from dotenv import load_dotenv
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
-from chromadb import PersistentClient
+from bd import cursor_bd, obtener_pool, sesion_bd
+from cache_embeddings import CacheEmbeddings
+from cache_respuestas import CacheRespuestas
+from carrito import carritos
+from catalogo import al_cambiar, obtener_catalogo
+from diario_mensajes import diario
+from idempotencia import procesados
+from indice_catalogo import obtener_indice
+from ingesta import ingresar_mensaje_cliente
+from intenciones import detectar_intencion
+from llm import ErrorLLM, llm, respuesta_de_respaldo
+from metricas import (
+    error,
+    etapa,
+    exportar,
+    fuente_respuesta,
+    peticion,
+    recolectar,
+)
+from prompts import (
+    PROMPT_PRESUPUESTO,
+    ajustar_lineas,
+    contar_mensajes,
+    puntajes_productos,
+    relevancia,
+)
+from recuperacion import RecuperadorHibrido
+from respuestas_async import (
+    MENSAJE_ERROR,
+    RESPUESTA_ASINCRONA,
+    PoolRespuestas,
+    enviar_whatsapp,
+)
+from respuestas_directas import respuesta_directa
+from sesiones import crear_sesiones
+from sinonimos import normalizador, reemplazar_sinonimos
 
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 app = Flask(__name__)
-conversaciones = {}
+conversaciones = crear_sesiones()
+# Respuestas a preguntas generales; se vacía cada vez que cambia el catálogo
+respuestas_generales = CacheRespuestas()
+al_cambiar(respuestas_generales.invalidar)
 
 # === CONFIGURACIÓN DE CHROMADB ===
-embed_fn = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"), model_name="text-embedding-3-small"
-)
-chroma = PersistentClient(path="chroma_db")
-collection = chroma.get_or_create_collection(
-    name="productos_marketing", embedding_function=embed_fn
-)
+# El backend de embedding se elige con EMBEDDING_BACKEND (ver embeddings.py).
+# Importar chromadb y abrir la colección tarda: se hace al primer uso (o en el
+# calentamiento), no al importar la app en cada worker.
+_recuperador = None
+_recuperador_lock = threading.Lock()
 
-# === SINÓNIMOS ===
-SINONIMOS = {
-    "libretas": "cuaderno",
-    "libreta": "cuaderno",
-    "adhesivos": "stickers",
-    "pegatinas": "stickers",
-    "adhesivo": "stickers",
-    "lapiceros": "lápices de colores",
-    "lapicero": "lápices de colores",
-    "respuesto de hojas": "hojas",
-    "respuestos": "hojas",
-    "respuesto": "hojas",
-    "hojitas": "hojas",
-    "marcador": "marcadores",
-    "marcadores stabilo": "bolígrafos",
-    "lapiceras": "bolígrafos",
-    "lapicera": "bolígrafos",
-    "corrector": "correctores",
-    "goma": "correctores",
-    "estuche": "estucheras",
-    "cartuchera": "estucheras",
-    "porta lápiz": "estucheras",
-    "porta lapiz": "estucheras",
-}
-
-
-def conectar_bd():
-    return psycopg2.connect(os.getenv("DATABASE_URL"), cursor_factory=RealDictCursor)
-
-
-def reemplazar_sinonimos(texto):
-    texto = texto.lower()
-    for sin, real in SINONIMOS.items():
-        texto = re.sub(rf"\\b{re.escape(sin)}\\b", real, texto)
-    return texto
 
+def obtener_recuperador():
+    global _recuperador
+    if _recuperador is None:
+        with _recuperador_lock:
+            if _recuperador is None:
+                from chromadb import PersistentClient
 
-def obtener_chat_id(telefono):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT c.id AS chat_id, cl.nombre
-        FROM Chat c
-        JOIN Cliente cl ON c.cliente_id = cl.id
-        WHERE cl.telefono = %s AND c.estado = 'abierto'
-        ORDER BY c.fecha_inicio DESC LIMIT 1;
-        """,
-        (telefono,),
-    )
-    chat = cur.fetchone()
-
-    if chat:
-        conn.close()
-        return chat["chat_id"], chat["nombre"]
-
-    cur.execute("SELECT id, nombre FROM Cliente WHERE telefono = %s;", (telefono,))
-    cliente = cur.fetchone()
-    if not cliente:
-        cur.execute(
-            """
-            INSERT INTO Cliente (nombre, telefono) VALUES (%s, %s) RETURNING id;
-            """,
-            ("Invitado", telefono),
-        )
-        cliente_id = cur.fetchone()["id"]
-        nombre_cliente = "Invitado"
-    else:
-        cliente_id = cliente["id"]
-        nombre_cliente = cliente["nombre"]
+                from embeddings import abrir_coleccion
 
-    cur.execute(
-        "INSERT INTO Chat (cliente_id) VALUES (%s) RETURNING id;", (cliente_id,)
-    )
-    chat_id = cur.fetchone()["id"]
-    conn.commit()
-    conn.close()
-    return chat_id, nombre_cliente
+                chroma = PersistentClient(path=os.getenv("CHROMA_RUTA", "chroma_db"))
+                coleccion, embed_fn, modelo = abrir_coleccion(
+                    chroma, "productos_marketing"
+                )
+                _recuperador = RecuperadorHibrido(
+                    coleccion, CacheEmbeddings(embed_fn, modelo)
+                )
+    return _recuperador
 
 
-def guardar_mensaje(chat_id, contenido, emisor="cliente", tipo="texto"):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO Mensaje (chat_id, emisor, tipo, contenido)
-        VALUES (%s, %s, %s, %s);
-        """,
-        (chat_id, emisor, tipo, contenido),
-    )
-    conn.commit()
-    conn.close()
-
-
-def ya_saludo_hoy(chat_id):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT contenido, fecha_envio::date
-        FROM Mensaje
-        WHERE chat_id = %s AND emisor = 'sistema'
-        ORDER BY fecha_envio DESC LIMIT 1;
-        """,
-        (chat_id,),
-    )
-    mensaje = cur.fetchone()
-    conn.close()
-    if not mensaje:
-        return False
-    return (
-        mensaje["fecha_envio"] == datetime.now().date()
-        and "hola" in mensaje["contenido"].lower()
-    )
+def _estadisticas_embeddings():
+    if _recuperador is None:
+        return {"inicializada": 0}
+    return _recuperador.embeddings.estadisticas()
 
 
-def buscar_productos_embedding(pregunta):
-    resultados = collection.query(query_texts=[pregunta], n_results=3)
-    docs = resultados.get("documents", [[]])[0]
-    return docs
+# === MÉTRICAS (/metrics) ===
+recolectar("sesiones", "almacen", "conversaciones", conversaciones.estadisticas)
+recolectar("cache", "cache", "respuestas_generales", respuestas_generales.estadisticas)
+recolectar("cache", "cache", "embeddings_consultas", _estadisticas_embeddings)
+recolectar("carritos", "escritor", "carritos", carritos.estadisticas)
+recolectar("mensajes", "escritor", "mensajes", diario.estadisticas)
+recolectar("idempotencia", "webhook", "whatsapp", procesados.estadisticas)
+recolectar("pool_bd", "pool", "principal", lambda: obtener_pool().estado())
 
 
-def agregar_producto_carrito_en_memoria(
-    user_number, producto_id, nombre_producto, precio, cantidad=1
-):
-    if user_number not in conversaciones:
-        conversaciones[user_number] = {"nombre_cliente": "Invitado", "carrito": {}}
+# === CALENTAMIENTO (/healthz) ===
+def _recargar_sinonimos():
+    try:
+        normalizador.recargar_desde_bd()
+    except Exception as e:
+        print(
+            "⚠️ No se pudo leer la tabla Sinonimo, se usan los sinónimos por defecto:",
+            e,
+        )
 
-    carrito = conversaciones[user_number]["carrito"]
 
-    if producto_id in carrito:
-        # Si el producto ya está en el carrito, actualizamos la cantidad
-        carrito[producto_id]["cantidad"] += cantidad
-    else:
-        # Si el producto no está en el carrito, lo agregamos
-        carrito[producto_id] = {
-            "nombre": nombre_producto,
-            "precio": precio,
-            "cantidad": cantidad,
-        }
+def _probar_bd():
+    with cursor_bd() as cur:
+        cur.execute("SELECT 1;")
+
+
+PASOS_CALENTAMIENTO = [
+    ("bd", _probar_bd),
+    ("sinonimos", _recargar_sinonimos),
+    ("catalogo", obtener_catalogo),
+    ("indice", obtener_indice),
+    ("recuperador", lambda: obtener_recuperador().calentar()),
+    ("llm", lambda: llm.cliente),
+]
 
+
+@etapa("guardar_mensaje")
+def guardar_mensaje(chat_id, contenido, emisor="cliente", tipo="texto"):
+    # Se escribe por lotes en segundo plano (ver diario_mensajes.py)
+    diario.guardar(chat_id, contenido, emisor=emisor, tipo=tipo)
+
+
+@etapa("recuperacion")
+def buscar_productos_embedding(pregunta, intencion=None):
+    # Búsqueda híbrida (BM25 + Chroma); sin agotados ni otras categorías,
+    # salvo que el cliente nombre un producto concreto
+    indice = obtener_indice()
+    intencion = intencion or detectar_intencion(pregunta, indice)
+    categoria = indice.categorias.get(intencion.categoria_id)
+    resultados = obtener_recuperador().buscar(
+        pregunta,
+        categoria=categoria.nombre if categoria else None,
+        solo_con_stock=not intencion.productos,
+    )
+    return [r.documento for r in resultados]
+
+
+def agregar_producto_carrito(user_number, producto_id, nombre_producto, cantidad=1):
+    # El precio no se guarda: se calcula al ver el carrito con el vigente
+    carritos.agregar(user_number, producto_id, cantidad)
     return f"Producto {nombre_producto} agregado al carrito. Cantidad: {cantidad}."
 
 
-def ver_carrito_en_memoria(user_number):
-    if user_number not in conversaciones or not conversaciones[user_number]["carrito"]:
+def ver_carrito(user_number):
+    resumen = carritos.resumen(user_number)
+    if not resumen.lineas:
         return "Tu carrito está vacío."
 
-    carrito = conversaciones[user_number]["carrito"]
-    total = 0
     carrito_resumen = "Productos en tu carrito:\n"
+    for linea in resumen.lineas:
+        if linea.precio is None:
+            carrito_resumen += (
+                f"- {linea.nombre} (Cantidad: {linea.cantidad}, sin precio vigente)\n"
+            )
+            continue
+        promocion = (
+            f", {linea.promocion}: -Bs. {linea.descuento:.2f}" if linea.promocion else ""
+        )
+        carrito_resumen += f"- {linea.nombre} (Cantidad: {linea.cantidad}, Precio: Bs. {linea.precio}{promocion}, Subtotal: Bs. {linea.subtotal:.2f})\n"
 
-    for producto_id, producto in carrito.items():
-        subtotal = producto["precio"] * producto["cantidad"]
-        carrito_resumen += f"- {producto['nombre']} (Cantidad: {producto['cantidad']}, Precio: Bs. {producto['precio']}, Subtotal: Bs. {subtotal})\n"
-        total += subtotal
-
-    carrito_resumen += f"\nTotal: Bs. {total:.2f}"
+    carrito_resumen += f"\nTotal: Bs. {resumen.total:.2f}"
     return carrito_resumen
 
-def eliminar_producto_carrito_en_memoria(user_number, producto_id):
-    if user_number not in conversaciones or producto_id not in conversaciones[user_number]["carrito"]:
-        return "Este producto no está en tu carrito."
 
-    nombre_producto = conversaciones[user_number]["carrito"][producto_id]["nombre"]
-    del conversaciones[user_number]["carrito"][producto_id]
+def eliminar_producto_carrito(user_number, producto_id):
+    if producto_id not in carritos.items(user_number):
+        return "Este producto no está en tu carrito."
 
+    carritos.quitar(user_number, producto_id)
+    producto = obtener_catalogo().productos.get(producto_id)
+    nombre_producto = producto.nombre if producto else producto_id
     return f"Producto {nombre_producto} eliminado del carrito."
 
 
 def detectar_pregunta_general(texto):
-    texto = texto.lower()
-    if re.search(r"\b(productos|tienen|hay)\b", texto) and re.search(
-        r"\b(stickers?|cuadernos?|marcadores?|hojas|micropen|bolígrafos?|estucheras?|correctores?)\b",
-        texto,
-    ):
-        for sin, real in SINONIMOS.items():
-            texto = texto.replace(sin, real)
-        return "categoria"
-    elif re.search(r"(qué|que)\s+(productos|tienen|hay)", texto):
-        return "productos"
-    elif "categoría" in texto or "categorias" in texto:
-        return "categorias"
-    elif "promoción" in texto or "promociones" in texto:
-        return "promociones"
-    return None
-
-    # def responder_general(tipo):
-    conn = conectar_bd()
-    cur = conn.cursor()
+    # Ver intenciones.py: patrón precompilado + slots del índice del catálogo
+    return detectar_intencion(texto).tipo
 
-    if tipo == "productos":
-        cur.execute("SELECT nombre FROM Producto ORDER BY nombre;")
-        productos = [p["nombre"] for p in cur.fetchall()]
-        return "Actualmente contamos con los siguientes productos:\n- " + "\n- ".join(
-            productos
-        )
 
-    elif tipo == "categorias":
-        cur.execute(
-            """
-            SELECT c.nombre, COUNT(p.id) as cantidad
-            FROM Categoria c
-            LEFT JOIN Producto p ON p.categoria_id = c.id
-            GROUP BY c.nombre ORDER BY c.nombre;
-        """
-        )
-        categorias = cur.fetchall()
-        return "Nuestras categorías disponibles son:\n" + "\n".join(
-            [f"- {c['nombre']} ({c['cantidad']} productos)" for c in categorias]
-        )
+@etapa("respuesta_general")
+def responder_general_con_ia(tipo, filtro_categoria=None, consulta=""):
+    catalogo = obtener_catalogo()
+    modelo = "gpt-4o-mini"  # antes "gpt-3.5-turbo"
+    # (texto, puntaje, grupo): si no entra todo, se prioriza lo relevante a la
+    # consulta y el resto se resume por grupo (ver prompts.ajustar_lineas)
+    lineas = []
 
-    elif tipo == "promociones":
-        cur.execute(
-            """
-            SELECT nombre, porcentaje_descuento, fecha_fin
-            FROM Promocion
-            WHERE fecha_fin >= CURRENT_DATE
-            ORDER BY fecha_fin;
-        """
-        )
-        promos = cur.fetchall()
-        if promos:
-            return "Estas son nuestras promociones activas:\n" + "\n".join(
-                [
-                    f"- {p['nombre']} ({p['porcentaje_descuento']}% hasta {p['fecha_fin']})"
-                    for p in promos
-                ]
+    if tipo == "productos":
+        puntajes = puntajes_productos(catalogo, consulta) if consulta else {}
+        if filtro_categoria:
+            filtro = filtro_categoria.lower()
+            productos = sorted(
+                (
+                    p
+                    for p in catalogo.productos.values()
+                    if p.categoria and filtro in p.categoria.lower()
+                ),
+                key=lambda p: p.nombre,
             )
         else:
-            return "En este momento no contamos con promociones activas."
-
-    conn.close()
-    return "Lo siento, no encontré información."
-
-    # def responder_general_con_ia(tipo):
-    conn = conectar_bd()
-    cur = conn.cursor()
-
-    contexto = ""
-
-    if tipo == "productos":
-        cur.execute(
-            """
-            SELECT p.nombre, p.stock, COALESCE(pp.monto, 0) AS precio, c.nombre AS categoria
-            FROM Producto p
-            JOIN Categoria c ON p.categoria_id = c.id
-            LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id AND pp.lista_precio_id = 1
-            ORDER BY c.nombre, p.nombre;
-        """
-        )
-        productos = cur.fetchall()
+            productos = [
+                p for p in catalogo.productos_ordenados() if p.categoria is not None
+            ]
         for p in productos:
-            contexto += f"- {p['nombre']} (Categoría: {p['categoria']}, Precio: Bs. {p['precio']}, Stock: {p['stock']})\n"
+            if filtro_categoria:
+                texto = f"- {p.nombre} (Precio: Bs. {p.precio or 0}, Stock: {p.stock})\n"
+            else:
+                texto = f"- {p.nombre} (Categoría: {p.categoria}, Precio: Bs. {p.precio or 0}, Stock: {p.stock})\n"
+            # Ante empate (o sin consulta) van primero los que tienen stock
+            puntaje = puntajes.get(p.id, 0.0) + (0.001 if p.stock else 0.0)
+            lineas.append((texto, puntaje, p.categoria))
 
     elif tipo == "categorias":
-        cur.execute(
-            """
-            SELECT c.nombre, COUNT(p.id) as cantidad
-            FROM Categoria c
-            LEFT JOIN Producto p ON p.categoria_id = c.id
-            GROUP BY c.nombre
-            ORDER BY c.nombre;
-        """
-        )
-        categorias = cur.fetchall()
-        for c in categorias:
-            contexto += f"- {c['nombre']}: {c['cantidad']} productos\n"
-
-    elif tipo == "promociones":
-        cur.execute(
-            """
-            SELECT pr.id, pr.nombre, pr.porcentaje_descuento, pr.fecha_fin
-            FROM Promocion pr
-            WHERE pr.fecha_fin >= CURRENT_DATE
-            ORDER BY pr.fecha_fin;
-        """
-        )
-        promociones = cur.fetchall()
-
-        for promo in promociones:
-            contexto += f"📣 {promo['nombre']} ({promo['porcentaje_descuento']}% hasta {promo['fecha_fin']}):\n"
-            cur.execute(
-                """
-                SELECT p.nombre
-                FROM ProductoPromocion pp
-                JOIN Producto p ON p.id = pp.producto_id
-                WHERE pp.promocion_id = %s;
-            """,
-                (promo["id"],),
+        for c in catalogo.categorias_ordenadas():
+            lineas.append(
+                (f"- {c.nombre}: {len(c.productos)} productos\n", 0.0, "categorías")
             )
-            productos = cur.fetchall()
-            for p in productos:
-                contexto += f"   - {p['nombre']}\n"
-
-        if not promociones:
-            contexto = "Actualmente no hay promociones activas."
-
-    conn.close()
 
-    prompt = f"""
+    elif tipo == "promociones":
+        for promo in catalogo.promociones_ordenadas():
+            texto = f"📣 {promo.nombre} ({promo.porcentaje_descuento}% hasta {promo.fecha_fin}):\n"
+            for producto_id in promo.productos:
+                producto = catalogo.productos.get(producto_id)
+                if producto:
+                    texto += f"   - {producto.nombre}\n"
+            lineas.append((texto, relevancia(texto, consulta), "promociones"))
+
+    prompt = """
 Eres un asistente amigable de una tienda de papelería. Responde con tono cálido y profesional lo siguiente, basado en la información de abajo:
 
 {contexto}
 
 La respuesta debe ser clara, en español, con viñetas o listas si es necesario. No inventes nada fuera de lo mostrado.
     """.strip()
-
-    respuesta = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "Eres un asistente conversacional experto en ventas de papelería.",
-            },
-            {"role": "user", "content": prompt},
+    sistema = "Eres un asistente conversacional experto en ventas de papelería."
+    fijos = contar_mensajes(
+        [
+            {"role": "system", "content": sistema},
+            {"role": "user", "content": prompt.format(contexto="")},
         ],
+        modelo,
     )
-    return respuesta.choices[0].message.content.strip()
-
-    # @app.route("/whatsapp", methods=["POST"])
-    # def whatsapp():
-    try:
-        numero_completo = request.values.get("From", "")
-        user_number = numero_completo.replace("whatsapp:", "")
-        incoming_msg = request.values.get("Body", "").strip()
+    contexto = ajustar_lineas(lineas, PROMPT_PRESUPUESTO - fijos, modelo)
+    if tipo == "promociones" and not lineas:
+        contexto = "Actualmente no hay promociones activas."
+    prompt = prompt.format(contexto=contexto)
 
-        resp = MessagingResponse()
-        msg = resp.message()
+    clave = respuestas_generales.clave(tipo, filtro_categoria, contexto, modelo)
+    cacheada = respuestas_generales.get(clave)
+    if cacheada is not None:
+        fuente_respuesta("cache")
+        return cacheada
 
-        chat_id, nombre_cliente = obtener_chat_id(user_number)
-        guardar_mensaje(chat_id, incoming_msg, emisor="cliente")
+    try:
+        texto = llm.completar(
+            model=modelo,
+            messages=[
+                {"role": "system", "content": sistema},
+                {"role": "user", "content": prompt},
+            ],
+        )
+    except ErrorLLM as e:
+        # Respaldo determinista: el mismo contexto sin redactar (no se cachea)
+        print("🛟 OpenAI no respondió, se usó el catálogo:", e)
+        fuente_respuesta("respaldo")
+        return f"Esta es la información que tenemos:\n{contexto}"
+    fuente_respuesta("llm")
+    if texto:
+        respuestas_generales.guardar(clave, texto)
+    return texto
 
-        if numero_completo not in conversaciones:
-            conversaciones[numero_completo] = []
-            if not ya_saludo_hoy(chat_id):
-                saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
-                guardar_mensaje(chat_id, saludo, emisor="sistema")
-                msg.body(saludo)
-                return Response(str(resp), content_type="application/xml")
 
-        consulta = reemplazar_sinonimos(incoming_msg)
-        contexto = buscar_productos_embedding(consulta)
 
+def responder_mensaje(
+    numero_completo, chat_id, nombre_cliente, saludo_hecho, incoming_msg
+):
+    if conversaciones.get(numero_completo) is None:
+        conversaciones[numero_completo] = []
+        if not saludo_hecho:
+            saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
+            guardar_mensaje(chat_id, saludo, emisor="sistema")
+            fuente_respuesta("saludo")
+            return saludo
+
+    # Una sola conexión del pool (si el catálogo se recarga) para intención y
+    # plantilla; se devuelve antes de llamar al LLM, que puede tardar segundos
+    with sesion_bd():
+        with etapa("intencion"):
+            consulta = reemplazar_sinonimos(incoming_msg)
+            indice = obtener_indice()
+            intencion = detectar_intencion(consulta, indice)
+            categoria = indice.categorias.get(intencion.categoria_id)
+
+        # Precio, stock, categorías y promociones salen del catálogo sin el LLM
+        with etapa("plantilla"):
+            reply = respuesta_directa(intencion)
+    if reply is not None:
+        fuente_respuesta("plantilla")
+    elif intencion.tipo in ("productos", "categorias", "promociones"):
+        reply = responder_general_con_ia(intencion.tipo, consulta=consulta)
+    elif intencion.tipo == "categoria" and categoria is not None:
+        reply = responder_general_con_ia(
+            "productos", filtro_categoria=categoria.nombre, consulta=consulta
+        )
+    else:
+        contexto = buscar_productos_embedding(consulta, intencion)
         prompt = (
             "Responde como un vendedor de papelería basado en los siguientes productos encontrados:\n\n"
             + "\n---\n".join(contexto)
             + f"\n\nCliente: {incoming_msg}\nRespuesta:"
         )
-
-        conversaciones[numero_completo].append(
-            {"role": "user", "content": incoming_msg}
-        )
-
-        respuesta = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un asistente de ventas de productos de papelería.",
-                },
-                {"role": "user", "content": prompt},
-            ],
+        conversaciones.agregar(
+            numero_completo, {"role": "user", "content": incoming_msg}
         )
-
-        reply = respuesta.choices[0].message.content.strip()
+        try:
+            with etapa("llm"):
+                reply = llm.completar(
+                    # model="gpt-3.5-turbo",
+                    model="gpt-4o-mini",
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Eres un asistente de ventas de productos de papelería.",
+                        },
+                        {"role": "user", "content": prompt},
+                    ],
+                )
+            fuente_respuesta("llm")
+        except ErrorLLM as e:
+            print("🛟 OpenAI no respondió, se usó el catálogo:", e)
+            with etapa("respaldo"):
+                reply = respuesta_de_respaldo(consulta)
+            fuente_respuesta("respaldo")
         if not reply:
             reply = "Lo siento, no entendí tu mensaje. ¿Podrías reformularlo?"
 
-        guardar_mensaje(chat_id, reply, emisor="sistema")
-        msg.body(reply)
-        return Response(str(resp), content_type="application/xml")
+    guardar_mensaje(chat_id, reply, emisor="sistema")
+    return reply
 
-    except Exception as e:
-        print("❌ Error:", e)
-        resp = MessagingResponse()
-        msg = resp.message(
-            "Ocurrió un error al procesar tu mensaje. Intenta nuevamente."
-        )
-        return Response(str(resp), content_type="application/xml")
 
+def responder_en_segundo_plano(*args):
+    # args[0] es el número. En el proceso sus mensajes ya van a un solo
+    # worker; el bloqueo los ordena frente a otros procesos
+    with peticion("segundo_plano"), conversaciones.bloqueo(args[0]):
+        return responder_mensaje(*args)
 
-def responder_general_con_ia(tipo, filtro_categoria=None):
-    conn = conectar_bd()
-    cur = conn.cursor()
-    contexto = ""
-
-    if tipo == "productos" and filtro_categoria:
-        cur.execute(
-            """
-            SELECT p.nombre, p.stock, COALESCE(pp.monto, 0) AS precio
-            FROM Producto p
-            JOIN Categoria c ON p.categoria_id = c.id
-            LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id AND pp.lista_precio_id = 1
-            WHERE LOWER(c.nombre) LIKE %s
-            ORDER BY p.nombre;
-        """,
-            (f"%{filtro_categoria}%",),
-        )
-        productos = cur.fetchall()
-        for p in productos:
-            contexto += (
-                f"- {p['nombre']} (Precio: Bs. {p['precio']}, Stock: {p['stock']})\n"
-            )
 
-    elif tipo == "productos":
-        cur.execute(
-            """
-            SELECT p.nombre, p.stock, COALESCE(pp.monto, 0) AS precio, c.nombre AS categoria
-            FROM Producto p
-            JOIN Categoria c ON p.categoria_id = c.id
-            LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id AND pp.lista_precio_id = 1
-            ORDER BY c.nombre, p.nombre;
-        """
-        )
-        productos = cur.fetchall()
-        for p in productos:
-            contexto += f"- {p['nombre']} (Categoría: {p['categoria']}, Precio: Bs. {p['precio']}, Stock: {p['stock']})\n"
+respuestas = PoolRespuestas(responder_en_segundo_plano)
 
-    elif tipo == "categorias":
-        cur.execute(
-            """
-            SELECT c.nombre, COUNT(p.id) as cantidad
-            FROM Categoria c
-            LEFT JOIN Producto p ON p.categoria_id = c.id
-            GROUP BY c.nombre
-            ORDER BY c.nombre;
-        """
-        )
-        categorias = cur.fetchall()
-        for c in categorias:
-            contexto += f"- {c['nombre']}: {c['cantidad']} productos\n"
 
-    elif tipo == "promociones":
-        cur.execute(
-            """
-            SELECT pr.id, pr.nombre, pr.porcentaje_descuento, pr.fecha_fin
-            FROM Promocion pr
-            WHERE pr.fecha_fin >= CURRENT_DATE
-            ORDER BY pr.fecha_fin;
-        """
-        )
-        promociones = cur.fetchall()
-
-        for promo in promociones:
-            contexto += f"📣 {promo['nombre']} ({promo['porcentaje_descuento']}% hasta {promo['fecha_fin']}):\n"
-            cur.execute(
-                """
-                SELECT p.nombre
-                FROM ProductoPromocion pp
-                JOIN Producto p ON p.id = pp.producto_id
-                WHERE pp.promocion_id = %s;
-            """,
-                (promo["id"],),
+@app.route("/whatsapp", methods=["POST"])
+def whatsapp():
+    message_sid = request.values.get("MessageSid")
+    destino, origen = request.values.get("From", ""), request.values.get("To")
+    resp = MessagingResponse()
+    # El MessageSid de Twilio sirve de id de la petición en los logs JSON
+    with peticion("whatsapp", message_sid):
+        try:
+            # Un reintento de Twilio recibe la respuesta original sin recalcularla;
+            # si se cansa de esperar, la respuesta sale luego por la API REST
+            reply = procesados.procesar(
+                message_sid,
+                _whatsapp,
+                entregar=lambda texto: enviar_whatsapp(destino, texto, origen),
             )
-            productos = cur.fetchall()
-            for p in productos:
-                contexto += f"   - {p['nombre']}\n"
-        if not promociones:
-            contexto = "Actualmente no hay promociones activas."
-
-    conn.close()
-
-    prompt = f"""
-Eres un asistente amigable de una tienda de papelería. Responde con tono cálido y profesional lo siguiente, basado en la información de abajo:
+        except Exception as e:
+            print("❌ Error en /whatsapp:", e)
+            error("whatsapp", str(e), fallida=True)
+            reply = MENSAJE_ERROR
+        if reply:
+            resp.message(reply)
+        return Response(str(resp), content_type="application/xml")
 
-{contexto}
 
-La respuesta debe ser clara, en español, con viñetas o listas si es necesario. No inventes nada fuera de lo mostrado.
-    """.strip()
+def _whatsapp():
+    """Respuesta al mensaje de la petición en curso ("" si va en segundo plano)."""
+    numero_completo = request.values.get("From", "")
+    user_number = numero_completo.replace("whatsapp:", "")
+    incoming_msg = request.values.get("Body", "").strip()
 
-    respuesta = client.chat.completions.create(
-        # model="gpt-3.5-turbo",
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": "Eres un asistente conversacional experto en ventas de papelería.",
-            },
-            {"role": "user", "content": prompt},
-        ],
+    # Sin sesion_bd() aquí: cada paso toma la conexión solo mientras la usa,
+    # así una respuesta lenta del LLM no deja el pool sin conexiones
+    with etapa("ingreso"):
+        chat_id, nombre_cliente, saludo_hecho = ingresar_mensaje_cliente(
+            user_number, incoming_msg
+        )
+    args = (
+        numero_completo,
+        chat_id,
+        nombre_cliente,
+        saludo_hecho,
+        incoming_msg,
     )
-    return respuesta.choices[0].message.content.strip()
 
-    # @app.route("/whatsapp", methods=["POST"])
-    # def whatsapp():
-    try:
-        numero_completo = request.values.get("From", "")
-        user_number = numero_completo.replace("whatsapp:", "")
-        incoming_msg = request.values.get("Body", "").strip()
-
-        resp = MessagingResponse()
-        msg = resp.message()
-
-        chat_id, nombre_cliente = obtener_chat_id(user_number)
-        guardar_mensaje(chat_id, incoming_msg, emisor="cliente")
-
-        if numero_completo not in conversaciones:
-            conversaciones[numero_completo] = []
-            if not ya_saludo_hoy(chat_id):
-                saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
-                guardar_mensaje(chat_id, saludo, emisor="sistema")
-                msg.body(saludo)
-                return Response(str(resp), content_type="application/xml")
-
-        consulta = reemplazar_sinonimos(incoming_msg)
-        tipo_pregunta = detectar_pregunta_general(consulta)
-
-        # Preguntas generales: productos, categorías o promociones
-        if tipo_pregunta in ["productos", "categorias", "promociones"]:
-            respuesta_texto = responder_general_con_ia(tipo_pregunta)
-        else:
-            # Preguntas específicas: usar ChromaDB
-            contexto = buscar_productos_embedding(consulta)
-            prompt = (
-                "Responde como un vendedor de papelería basado en los siguientes productos encontrados:\n\n"
-                + "\n---\n".join(contexto)
-                + f"\n\nCliente: {incoming_msg}\nRespuesta:"
-            )
+    # Modo asíncrono: se confirma a Twilio ya y se responde por la API REST
+    if RESPUESTA_ASINCRONA and respuestas.encolar(
+        numero_completo, request.values.get("To"), *args
+    ):
+        return ""
 
-            conversaciones[numero_completo].append(
-                {"role": "user", "content": incoming_msg}
-            )
+    with conversaciones.bloqueo(numero_completo):
+        reply = responder_mensaje(*args)
 
-            respuesta = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un asistente de ventas de productos de papelería.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-            )
+    return reply
 
-            respuesta_texto = respuesta.choices[0].message.content.strip()
-            if not respuesta_texto:
-                respuesta_texto = (
-                    "Lo siento, no entendí tu mensaje. ¿Podrías reformularlo?"
-                )
 
-        guardar_mensaje(chat_id, respuesta_texto, emisor="sistema")
-        msg.body(respuesta_texto)
-        return Response(str(resp), content_type="application/xml")
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(exportar(), content_type="text/plain; version=0.0.4")
 
-    except Exception as e:
-        print("❌ Error:", e)
-        resp = MessagingResponse()
-        msg = resp.message(
-            "Ocurrió un error al procesar tu mensaje. Intenta nuevamente."
-        )
-        return Response(str(resp), content_type="application/xml")
 
+@app.route("/estadisticas", methods=["GET"])
+def estadisticas():
+    return jsonify(
+        {
+            "conversaciones": conversaciones.estadisticas(),
+            "respuestas_generales": respuestas_generales.estadisticas(),
+            "embeddings_consultas": _estadisticas_embeddings(),
+            "llm": llm.estadisticas(),
+            "carritos": carritos.estadisticas(),
+            "idempotencia": procesados.estadisticas(),
+        }
+    )
 
-@app.route("/whatsapp", methods=["POST"])
-def whatsapp():
-    try:
-        numero_completo = request.values.get("From", "")
-        user_number = numero_completo.replace("whatsapp:", "")
-        incoming_msg = request.values.get("Body", "").strip()
-
-        resp = MessagingResponse()
-        msg = resp.message()
-
-        chat_id, nombre_cliente = obtener_chat_id(user_number)
-        guardar_mensaje(chat_id, incoming_msg, emisor="cliente")
-
-        if numero_completo not in conversaciones:
-            conversaciones[numero_completo] = []
-            if not ya_saludo_hoy(chat_id):
-                saludo = f"¡Hola {nombre_cliente}! 😊 ¿En qué podemos ayudarte hoy?"
-                guardar_mensaje(chat_id, saludo, emisor="sistema")
-                msg.body(saludo)
-                return Response(str(resp), content_type="application/xml")
-
-        consulta = reemplazar_sinonimos(incoming_msg)
-        intencion = detectar_pregunta_general(consulta)
-
-        if intencion == "productos":
-            reply = responder_general_con_ia("productos")
-        elif intencion == "categorias":
-            reply = responder_general_con_ia("categorias")
-        elif intencion == "promociones":
-            reply = responder_general_con_ia("promociones")
-        elif intencion == "categoria":
-            match = re.search(r"\bde\s+(\w+)|\ben\s+(\w+)", consulta)
-            categoria = match.group(1) if match else consulta.split()[-1]
-            reply = responder_general_con_ia("productos", filtro_categoria=categoria)
-        else:
-            contexto = buscar_productos_embedding(consulta)
-            prompt = (
-                "Responde como un vendedor de papelería basado en los siguientes productos encontrados:\n\n"
-                + "\n---\n".join(contexto)
-                + f"\n\nCliente: {incoming_msg}\nRespuesta:"
-            )
-            conversaciones[numero_completo].append(
-                {"role": "user", "content": incoming_msg}
-            )
-            respuesta = client.chat.completions.create(
-                # model="gpt-3.5-turbo",
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un asistente de ventas de productos de papelería.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-            )
-            reply = respuesta.choices[0].message.content.strip()
-            if not reply:
-                reply = "Lo siento, no entendí tu mensaje. ¿Podrías reformularlo?"
 
-        guardar_mensaje(chat_id, reply, emisor="sistema")
-        msg.body(reply)
-        return Response(str(resp), content_type="application/xml")
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    cuerpo, codigo = arranque.salud()
+    return jsonify(cuerpo), codigo
 
-    except Exception as e:
-        print("❌ Error:", e)
-        resp = MessagingResponse()
-        msg = resp.message(
-            "Ocurrió un error al procesar tu mensaje. Intenta nuevamente."
-        )
-        return Response(str(resp), content_type="application/xml")
 
+arranque.importado()
+arranque.calentar_en_segundo_plano(PASOS_CALENTAMIENTO)
 
 if __name__ == "__main__":
     app.run(debug=True)
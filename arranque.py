@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Se mide desde que la app importa este módulo (su primera importación)
+_INICIO = time.perf_counter()
+
+# === CONFIGURACIÓN ===
+# Con ARRANQUE_SEGUNDO_PLANO=0 el calentamiento se hace al importar la app
+# (bloquea, como antes); útil con gunicorn --preload o para depurar
+ARRANQUE_SEGUNDO_PLANO = os.getenv("ARRANQUE_SEGUNDO_PLANO", "1") == "1"
+# Presupuesto en segundos para importar la app y para quedar lista
+ARRANQUE_PRESUPUESTO_IMPORTACION = float(
+    os.getenv("ARRANQUE_PRESUPUESTO_IMPORTACION", 1.5)
+)
+ARRANQUE_PRESUPUESTO_LISTA = float(os.getenv("ARRANQUE_PRESUPUESTO_LISTA", 10))
+
+
+class Arranque:
+    """Calentamiento de la app y estado para /healthz.
+
+    Los recursos pesados (catálogo, índice, Chroma, cliente del LLM) se
+    crean al primer uso; ``calentar`` los fuerza en un hilo aparte antes de
+    que llegue tráfico, midiendo cada paso. Mientras tanto /healthz responde
+    503 para que el balanceador no mande peticiones a una instancia fría.
+    """
+
+    def __init__(self, inicio=_INICIO):
+        self.inicio = inicio
+        self.importacion = None
+        self.lista_en = None
+        self.pasos = {}  # nombre -> segundos
+        self.fallos = {}  # nombre -> error
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def importado(self):
+        """Marca el fin de la importación de la app."""
+        self.importacion = time.perf_counter() - self.inicio
+        if self.importacion > ARRANQUE_PRESUPUESTO_IMPORTACION:
+            print(
+                f"⚠️ Importar la app tomó {self.importacion:.2f}s "
+                f"(presupuesto {ARRANQUE_PRESUPUESTO_IMPORTACION}s)"
+            )
+
+    def calentar(self, pasos):
+        """Ejecuta ``pasos`` (lista de ``(nombre, funcion)``) en orden.
+
+        Un paso que falla queda registrado y no detiene a los demás: el
+        recurso se volverá a intentar al primer uso.
+        """
+        for nombre, funcion in pasos:
+            comienzo = time.perf_counter()
+            try:
+                funcion()
+            except Exception as e:
+                with self._lock:
+                    self.fallos[nombre] = str(e)
+                print(f"⚠️ Calentamiento: falló {nombre}:", e)
+            finally:
+                with self._lock:
+                    self.pasos[nombre] = time.perf_counter() - comienzo
+        with self._lock:
+            self.lista_en = time.perf_counter() - self.inicio
+        resumen = ", ".join(f"{n} {s:.2f}s" for n, s in self.pasos.items())
+        print(f"🔥 App lista en {self.lista_en:.2f}s ({resumen})")
+        if self.lista_en > ARRANQUE_PRESUPUESTO_LISTA:
+            print(
+                f"⚠️ La app tardó más que el presupuesto "
+                f"({ARRANQUE_PRESUPUESTO_LISTA}s) en quedar lista"
+            )
+
+    def calentar_en_segundo_plano(self, pasos):
+        if not ARRANQUE_SEGUNDO_PLANO:
+            self.calentar(pasos)
+            return
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(
+                target=self.calentar, args=(pasos,), name="calentamiento", daemon=True
+            )
+            self._hilo.start()
+
+    @property
+    def lista(self):
+        return self.lista_en is not None
+
+    def salud(self):
+        """``(cuerpo, código HTTP)`` para /healthz.
+
+        Un paso fallido no deja la instancia fuera ("degradada" sigue en 200):
+        el recurso se reintenta al primer uso, como sin calentamiento.
+        """
+        with self._lock:
+            if not self.lista:
+                estado = "calentando"
+            else:
+                estado = "degradada" if self.fallos else "lista"
+            cuerpo = {
+                "estado": estado,
+                "importacion_s": self.importacion,
+                "lista_s": self.lista_en,
+                "pasos_s": dict(self.pasos),
+                "fallos": dict(self.fallos),
+            }
+        return cuerpo, 200 if self.lista else 503
+
+
+arranque = Arranque()
@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+
+from metricas import contar_consulta
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# === CONFIGURACIÓN DEL POOL ===
+POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+# Segundos que se espera por una conexión libre antes de fallar
+POOL_ESPERA = float(os.getenv("DB_POOL_ESPERA", 5))
+# Conexiones inactivas más tiempo que esto se cierran y se reabren
+POOL_MAX_INACTIVA = float(os.getenv("DB_POOL_MAX_INACTIVA", 300))
+# Vida máxima de una conexión, para repartir carga tras un failover
+POOL_MAX_VIDA = float(os.getenv("DB_POOL_MAX_VIDA", 3600))
+# Si la conexión estuvo quieta más de esto, se verifica con SELECT 1
+POOL_VERIFICAR_TRAS = float(os.getenv("DB_POOL_VERIFICAR_TRAS", 30))
+
+
+class PoolAgotado(Exception):
+    pass
+
+
+class CursorMedido(RealDictCursor):
+    """RealDictCursor que cuenta cada consulta en la petición en curso."""
+
+    def execute(self, query, vars=None):
+        contar_consulta()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        contar_consulta()
+        return super().executemany(query, vars_list)
+
+
+class _Entrada:
+    __slots__ = ("conn", "creada", "ultimo_uso")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.creada = time.monotonic()
+        self.ultimo_uso = self.creada
+
+
+class PoolConexiones:
+    """Pool de conexiones psycopg2 seguro entre hilos.
+
+    Limita las conexiones abiertas a ``maximo``, verifica las que llevan
+    tiempo sin usarse y recicla las inactivas o demasiado viejas.
+    """
+
+    def __init__(
+        self,
+        dsn,
+        minimo=POOL_MIN,
+        maximo=POOL_MAX,
+        espera=POOL_ESPERA,
+        max_inactiva=POOL_MAX_INACTIVA,
+        max_vida=POOL_MAX_VIDA,
+        verificar_tras=POOL_VERIFICAR_TRAS,
+    ):
+        if maximo < 1 or minimo > maximo:
+            raise ValueError("Tamaño de pool inválido")
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.espera = espera
+        self.max_inactiva = max_inactiva
+        self.max_vida = max_vida
+        self.verificar_tras = verificar_tras
+        self._libres = []
+        self._prestadas = {}
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(maximo)
+        self._cerrado = False
+        self.conexiones_creadas = 0
+
+        for _ in range(minimo):
+            self._libres.append(self._crear())
+
+    def _crear(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=CursorMedido)
+        with self._lock:
+            self.conexiones_creadas += 1
+        return _Entrada(conn)
+
+    def _vencida(self, entrada, ahora):
+        return (
+            entrada.conn.closed
+            or ahora - entrada.ultimo_uso > self.max_inactiva
+            or ahora - entrada.creada > self.max_vida
+        )
+
+    def _sana(self, entrada):
+        try:
+            with entrada.conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            entrada.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _cerrar_silencioso(entrada):
+        try:
+            entrada.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def obtener(self):
+        if self._cerrado:
+            raise PoolAgotado("El pool de conexiones está cerrado")
+        if not self._cupos.acquire(timeout=self.espera):
+            raise PoolAgotado(
+                f"No hay conexiones libres tras {self.espera}s (máximo {self.maximo})"
+            )
+        try:
+            while True:
+                with self._lock:
+                    entrada = self._libres.pop() if self._libres else None
+                if entrada is None:
+                    entrada = self._crear()
+                    break
+                ahora = time.monotonic()
+                if self._vencida(entrada, ahora):
+                    self._cerrar_silencioso(entrada)
+                    continue
+                if ahora - entrada.ultimo_uso > self.verificar_tras and not self._sana(
+                    entrada
+                ):
+                    self._cerrar_silencioso(entrada)
+                    continue
+                break
+        except Exception:
+            self._cupos.release()
+            raise
+
+        with self._lock:
+            self._prestadas[id(entrada.conn)] = entrada
+        return entrada.conn
+
+    def devolver(self, conn, descartar=False):
+        with self._lock:
+            entrada = self._prestadas.pop(id(conn), None)
+        if entrada is None:
+            raise ValueError("La conexión no pertenece a este pool")
+        try:
+            if not descartar and not conn.closed:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            else:
+                descartar = True
+        except psycopg2.Error:
+            descartar = True
+
+        if descartar or self._cerrado:
+            self._cerrar_silencioso(entrada)
+        else:
+            entrada.ultimo_uso = time.monotonic()
+            with self._lock:
+                self._libres.append(entrada)
+        self._cupos.release()
+
+    def cerrar(self):
+        self._cerrado = True
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for entrada in libres:
+            self._cerrar_silencioso(entrada)
+
+    def estado(self):
+        with self._lock:
+            return {
+                "libres": len(self._libres),
+                "prestadas": len(self._prestadas),
+                "maximo": self.maximo,
+                "creadas": self.conexiones_creadas,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_conexion_actual = ContextVar("conexion_bd", default=None)
+
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones(DATABASE_URL)
+    return _pool
+
+
+def conectar_bd():
+    """Conexión suelta fuera del pool, para los scripts por lotes."""
+    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+@contextmanager
+def sesion_bd():
+    """Presta una única conexión del pool para todo el bloque.
+
+    Las llamadas anidadas (por ejemplo los helpers dentro de una petición
+    de /whatsapp) reutilizan la misma conexión en lugar de pedir otra.
+    """
+    conn = _conexion_actual.get()
+    if conn is not None:
+        yield conn
+        return
+
+    pool = obtener_pool()
+    conn = pool.obtener()
+    token = _conexion_actual.set(conn)
+    descartar = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        descartar = True
+        raise
+    finally:
+        _conexion_actual.reset(token)
+        pool.devolver(conn, descartar=descartar)
+
+
+@contextmanager
+def cursor_bd(commit=False):
+    with sesion_bd() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            cur.close()
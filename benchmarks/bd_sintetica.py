@@ -0,0 +1,159 @@
+"""Esquema de prueba en Postgres con el catálogo sintético.
+
+Crea (o recrea) un esquema aparte, con las tablas base que usa el webhook,
+aplica migraciones.py y carga un catálogo de catalogo_sintetico. Las
+conexiones de la app llegan a ese esquema con PGOPTIONS (search_path), así
+que nunca tocan las tablas reales.
+"""
+
+from datetime import date, timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+# Solo las columnas que usan el webhook y sus consultas
+ESQUEMA_BASE = """
+CREATE TABLE Cliente (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    telefono TEXT NOT NULL,
+    correo TEXT
+);
+CREATE TABLE Chat (
+    id SERIAL PRIMARY KEY,
+    cliente_id INTEGER NOT NULL REFERENCES Cliente (id),
+    estado TEXT NOT NULL DEFAULT 'abierto',
+    fecha_inicio TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE TABLE Mensaje (
+    id SERIAL PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES Chat (id),
+    emisor TEXT NOT NULL,
+    tipo TEXT NOT NULL DEFAULT 'texto',
+    contenido TEXT NOT NULL,
+    fecha_envio TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE TABLE Categoria (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL
+);
+CREATE TABLE Producto (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    descripcion TEXT,
+    stock INTEGER NOT NULL DEFAULT 0,
+    categoria_id INTEGER REFERENCES Categoria (id)
+);
+CREATE TABLE PrecioProducto (
+    id SERIAL PRIMARY KEY,
+    producto_id INTEGER NOT NULL REFERENCES Producto (id),
+    lista_precio_id INTEGER NOT NULL DEFAULT 1,
+    monto NUMERIC(10, 2) NOT NULL,
+    fecha_inicio DATE NOT NULL,
+    fecha_fin DATE
+);
+CREATE TABLE ImagenProducto (
+    id SERIAL PRIMARY KEY,
+    producto_id INTEGER NOT NULL REFERENCES Producto (id),
+    url TEXT NOT NULL
+);
+CREATE TABLE Promocion (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    descripcion TEXT,
+    porcentaje_descuento NUMERIC(5, 2),
+    monto_descuento NUMERIC(10, 2),
+    fecha_inicio DATE NOT NULL,
+    fecha_fin DATE NOT NULL
+);
+CREATE TABLE ProductoPromocion (
+    producto_id INTEGER NOT NULL REFERENCES Producto (id),
+    promocion_id INTEGER NOT NULL REFERENCES Promocion (id),
+    PRIMARY KEY (producto_id, promocion_id)
+);
+CREATE TABLE InteresProductoChat (
+    id SERIAL PRIMARY KEY,
+    chat_id INTEGER NOT NULL REFERENCES Chat (id),
+    producto_id INTEGER NOT NULL REFERENCES Producto (id),
+    observacion TEXT,
+    fecha_registro TIMESTAMP NOT NULL DEFAULT NOW()
+);
+"""
+
+
+def crear_esquema(dsn, esquema, catalogo):
+    """Recrea ``esquema`` con las tablas base, las migraciones y el catálogo."""
+    from migraciones import aplicar_migraciones
+
+    if esquema == "public":
+        raise ValueError("El esquema de prueba no puede ser public")
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    try:
+        cur = conn.cursor()
+        cur.execute(f'DROP SCHEMA IF EXISTS "{esquema}" CASCADE;')
+        cur.execute(f'CREATE SCHEMA "{esquema}";')
+        cur.execute(f'SET search_path TO "{esquema}";')
+        cur.execute(ESQUEMA_BASE)
+        sembrar(cur, catalogo)
+        conn.commit()
+        aplicar_migraciones(conn)
+    finally:
+        conn.close()
+
+
+def sembrar(cur, catalogo):
+    hoy = date.today()
+    for c in catalogo.categorias_ordenadas():
+        cur.execute(
+            "INSERT INTO Categoria (id, nombre) VALUES (%s, %s);", (c.id, c.nombre)
+        )
+    for p in catalogo.productos.values():
+        cur.execute(
+            """
+            INSERT INTO Producto (id, nombre, descripcion, stock, categoria_id)
+            VALUES (%s, %s, %s, %s, %s);
+            """,
+            (p.id, p.nombre, p.descripcion, p.stock, p.categoria_id),
+        )
+        cur.execute(
+            """
+            INSERT INTO PrecioProducto (producto_id, monto, fecha_inicio)
+            VALUES (%s, %s, %s);
+            """,
+            (p.id, p.precio, hoy - timedelta(days=30)),
+        )
+        cur.execute(
+            "INSERT INTO ImagenProducto (producto_id, url) VALUES (%s, %s);",
+            (p.id, f"imagenes/producto_{p.id}.jpg"),
+        )
+    for pr in catalogo.promociones.values():
+        cur.execute(
+            """
+            INSERT INTO Promocion (id, nombre, descripcion, porcentaje_descuento,
+                                   monto_descuento, fecha_inicio, fecha_fin)
+            VALUES (%s, %s, %s, %s, %s, %s, %s);
+            """,
+            (
+                pr.id,
+                pr.nombre,
+                pr.descripcion,
+                pr.porcentaje_descuento,
+                pr.monto_descuento,
+                pr.fecha_inicio,
+                pr.fecha_fin,
+            ),
+        )
+        for producto_id in pr.productos:
+            cur.execute(
+                """
+                INSERT INTO ProductoPromocion (producto_id, promocion_id)
+                VALUES (%s, %s);
+                """,
+                (producto_id, pr.id),
+            )
+    # Los SERIAL siguen después de los ids explícitos
+    for tabla in ("Categoria", "Producto", "Promocion"):
+        cur.execute(
+            f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+            f"(SELECT MAX(id) FROM {tabla}));"
+        )
@@ -0,0 +1,103 @@
+"""Tiempo de arranque en frío de la app (importación y hasta /healthz listo).
+
+Cada corrida es un proceso nuevo, como un worker recién levantado por el
+autoescalado: importa app.py o app1.py, anota cuánto tardó la importación y
+espera a que termine el calentamiento en segundo plano. Reporta la mediana
+de cada fase y de cada paso del calentamiento, y sale con código 1 si la
+mediana supera el presupuesto de arranque.py (ARRANQUE_PRESUPUESTO_*).
+
+Con --sin-bd se apunta DATABASE_URL a un puerto cerrado: los pasos que usan
+Postgres fallan rápido y se mide solo lo local (imports, Chroma, contexto).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_arranque [--app app1] [--corridas 5] [--sin-bd]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Se ejecuta en el proceso hijo; imprime una línea JSON con los tiempos
+_SONDA = """
+import json, time
+inicio = time.perf_counter()
+import {app}
+importacion = time.perf_counter() - inicio
+from arranque import arranque
+while not arranque.lista:
+    time.sleep(0.01)
+print(json.dumps({{
+    "importacion": importacion,
+    "lista": arranque.lista_en,
+    "pasos": arranque.pasos,
+    "fallos": sorted(arranque.fallos),
+}}))
+"""
+
+
+def medir(app, entorno):
+    salida = subprocess.run(
+        [sys.executable, "-c", _SONDA.format(app=app)],
+        capture_output=True,
+        text=True,
+        env=entorno,
+        check=True,
+        timeout=300,
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", choices=("app", "app1"), default="app")
+    parser.add_argument("--corridas", type=int, default=5)
+    parser.add_argument("--sin-bd", action="store_true")
+    args = parser.parse_args()
+
+    from arranque import ARRANQUE_PRESUPUESTO_IMPORTACION, ARRANQUE_PRESUPUESTO_LISTA
+
+    temporal = tempfile.mkdtemp(prefix="bench_arranque_")
+    entorno = dict(
+        os.environ,
+        EMBEDDING_BACKEND="hash",
+        CHROMA_RUTA=os.path.join(temporal, "chroma"),
+        EMBEDDINGS_CACHE_RUTA=os.path.join(temporal, "embeddings.sqlite3"),
+        SESIONES_RUTA=os.path.join(temporal, "sesiones.sqlite3"),
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-falsa"),
+    )
+    if args.sin_bd:
+        entorno["DATABASE_URL"] = "postgresql://bench@127.0.0.1:9/bench"
+
+    corridas = [medir(args.app, entorno) for _ in range(args.corridas)]
+    importacion = statistics.median(c["importacion"] for c in corridas)
+    lista = statistics.median(c["lista"] for c in corridas)
+    print(f"{args.app}: {args.corridas} arranques en frío (mediana)")
+    print(
+        f"  importación {importacion * 1000:7.1f} ms "
+        f"(presupuesto {ARRANQUE_PRESUPUESTO_IMPORTACION * 1000:.0f} ms)"
+    )
+    print(
+        f"  lista       {lista * 1000:7.1f} ms "
+        f"(presupuesto {ARRANQUE_PRESUPUESTO_LISTA * 1000:.0f} ms)"
+    )
+    for paso in corridas[0]["pasos"]:
+        mediana = statistics.median(c["pasos"][paso] for c in corridas)
+        falla = " (falló)" if paso in corridas[-1]["fallos"] else ""
+        print(f"    {paso:<12} {mediana * 1000:7.1f} ms{falla}")
+
+    excedidos = []
+    if importacion > ARRANQUE_PRESUPUESTO_IMPORTACION:
+        excedidos.append("importación")
+    if lista > ARRANQUE_PRESUPUESTO_LISTA:
+        excedidos.append("lista")
+    if excedidos:
+        print(f"❌ Fuera de presupuesto: {', '.join(excedidos)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Benchmark de precisión y rendimiento del enrutador de intenciones.
+
+Compara la cadena de regex anterior de app1.py con las reglas nuevas y con
+reglas + clasificador. Los casos etiquetados se generan con plantillas sobre
+el catálogo (sintético o, con --catalogo bd, el real); --csv agrega casos
+etiquetados a mano (columnas texto,intencion). La mitad de los textos
+distintos se usa para entrenar el clasificador y la otra mitad para medir.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_intenciones [--catalogo bd] [--csv casos.csv]
+"""
+
+import argparse
+import random
+import re
+import time
+from collections import Counter
+
+from benchmarks.catalogo_sintetico import catalogo_sintetico
+from catalogo import cargar_catalogo
+from indice_catalogo import IndiceCatalogo
+from intenciones import (
+    INTENCIONES_CLASIFICADOR,
+    ClasificadorIntenciones,
+    EnrutadorIntenciones,
+    leer_ejemplos_csv,
+)
+from sinonimos import reemplazar_sinonimos
+
+PLANTILLAS = {
+    "producto": [
+        "cuánto cuesta el {producto}?",
+        "precio del {producto}",
+        "tienen {producto}?",
+        "hay stock de {producto}?",
+        "quiero el {producto}",
+    ],
+    "categoria": [
+        "qué {categoria} tienen?",
+        "muéstrame los {categoria}",
+        "qué productos hay de {categoria}",
+        "{categoria}?",
+        "tienen {categoria}?",
+    ],
+    "categorias": [
+        "qué categorías manejan?",
+        "en qué secciones está organizada la tienda?",
+        "cuáles son sus categorias",
+    ],
+    "promociones": [
+        "hay promociones esta semana?",
+        "tienen ofertas?",
+        "qué descuentos hay en {categoria}?",
+        "alguna promo vigente?",
+    ],
+    "productos": [
+        "qué productos tienen?",
+        "qué venden?",
+        "me pasas el catálogo",
+    ],
+    # Sin señales léxicas: solo el clasificador puede acertarlos
+    "ambiguos": [
+        ("productos", "qué cosas ofrecen?"),
+        ("productos", "qué artículos manejan en la tienda?"),
+        ("promociones", "tienen rebajas por inicio de clases?"),
+        ("promociones", "hay liquidación o 2x1?"),
+        ("productos", "qué artículos tienen disponibles?"),
+        ("promociones", "hay rebajas en la tienda?"),
+        ("promociones", "algún 2x1 esta semana?"),
+        ("categorias", "qué tipos de artículos manejan?"),
+        ("categorias", "qué tipos de cosas venden?"),
+    ],
+    "otro": [
+        "hola buenas tardes",
+        "muchas gracias!",
+        "a qué hora abren?",
+        "hacen envíos a El Alto?",
+        "dónde están ubicados?",
+        "ok perfecto",
+    ],
+}
+
+
+# === CADENA ANTERIOR (app1.py) ===
+def detectar_pregunta_general_anterior(texto):
+    texto = texto.lower()
+    if re.search(r"\b(productos|tienen|hay)\b", texto) and re.search(
+        r"\b(stickers?|cuadernos?|marcadores?|hojas|micropen|bolígrafos?|estucheras?|correctores?)\b",
+        texto,
+    ):
+        return "categoria"
+    elif re.search(r"(qué|que)\s+(productos|tienen|hay)", texto):
+        return "productos"
+    elif "categoría" in texto or "categorias" in texto:
+        return "categorias"
+    elif "promoción" in texto or "promociones" in texto:
+        return "promociones"
+    return None
+
+
+def categoria_anterior(texto):
+    match = re.search(r"\bde\s+(\w+)|\ben\s+(\w+)", texto)
+    return match.group(1) if match else texto.split()[-1]
+
+
+def casos_etiquetados(catalogo, rnd, por_plantilla):
+    productos = list(catalogo.productos.values())
+    categorias = list(catalogo.categorias.values())
+    casos = []  # (texto, intencion, categoria_id esperada)
+    for intencion, plantillas in PLANTILLAS.items():
+        for plantilla in plantillas:
+            if intencion == "ambiguos":
+                intencion_real, texto = plantilla
+                casos += [(texto, intencion_real, None)] * por_plantilla
+                continue
+            for _ in range(por_plantilla):
+                producto = rnd.choice(productos)
+                categoria = rnd.choice(categorias)
+                texto = plantilla.format(
+                    producto=producto.nombre.lower(),
+                    categoria=categoria.nombre.lower(),
+                )
+                esperada = categoria.id if "{categoria}" in plantilla else None
+                etiqueta = None if intencion == "otro" else intencion
+                casos.append((texto, etiqueta, esperada))
+    return casos
+
+
+def medir(nombre, funcion, casos):
+    inicio = time.perf_counter()
+    predicciones = [funcion(reemplazar_sinonimos(texto)) for texto, _, _ in casos]
+    segundos = time.perf_counter() - inicio
+
+    aciertos, slots, con_slot = 0, 0, 0
+    por_intencion = Counter()
+    totales = Counter()
+    for (_, esperada, categoria_id), (tipo, slot_ok) in zip(casos, predicciones):
+        totales[esperada or "otro"] += 1
+        if tipo == esperada:
+            aciertos += 1
+            por_intencion[esperada or "otro"] += 1
+        if esperada == "categoria":
+            con_slot += 1
+            slots += slot_ok(categoria_id)
+    detalle = " ".join(
+        f"{i}={por_intencion[i] / totales[i]:.2f}" for i in sorted(totales)
+    )
+    print(
+        f"{nombre:<22} {aciertos / len(casos):9.3f} {slots / (con_slot or 1):9.3f} "
+        f"{len(casos) / segundos:12.0f}   {detalle}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--catalogo", choices=["sintetico", "bd"], default="sintetico"
+    )
+    parser.add_argument("--productos", type=int, default=400)
+    parser.add_argument("--por-plantilla", type=int, default=20)
+    parser.add_argument("--csv", help="casos etiquetados a mano (texto,intencion)")
+    args = parser.parse_args()
+
+    if args.catalogo == "bd":
+        catalogo = cargar_catalogo()
+    else:
+        catalogo = catalogo_sintetico(args.productos)
+    indice = IndiceCatalogo(
+        catalogo.productos.values(), catalogo.categorias.values()
+    )
+    rnd = random.Random(3)
+    casos = casos_etiquetados(catalogo, rnd, args.por_plantilla)
+    if args.csv:
+        casos += [
+            (texto, None if i == "otro" else i, None)
+            for texto, i in leer_ejemplos_csv(args.csv)
+        ]
+    # Se reparte por texto para que ninguna frase esté en los dos lados
+    textos = sorted({texto for texto, _, _ in casos})
+    rnd.shuffle(textos)
+    de_entrenamiento = set(textos[: len(textos) // 2])
+    entrenamiento = [c for c in casos if c[0] in de_entrenamiento]
+    prueba = [c for c in casos if c[0] not in de_entrenamiento]
+
+    clasificador = ClasificadorIntenciones.entrenar(
+        [
+            (reemplazar_sinonimos(texto), intencion)
+            for texto, intencion, _ in entrenamiento
+            if intencion is None or intencion in INTENCIONES_CLASIFICADOR
+        ]
+    )
+    reglas = EnrutadorIntenciones(indice=indice)
+    con_clasificador = EnrutadorIntenciones(clasificador, indice=indice)
+    nombres = {c.id: c.nombre.lower() for c in catalogo.categorias.values()}
+
+    def anterior(texto):
+        tipo = detectar_pregunta_general_anterior(texto)
+        filtro = categoria_anterior(texto) if tipo == "categoria" else ""
+        # app1 filtraba con ``filtro in categoria.lower()``
+        coinciden = {
+            cid for cid, nombre in nombres.items() if filtro and filtro in nombre
+        }
+        return tipo, lambda cid: coinciden == {cid}
+
+    def enrutar_con(enrutador):
+        def funcion(texto):
+            intencion = enrutador.enrutar(texto)
+            return intencion.tipo, lambda cid: intencion.categoria_id == cid
+
+        return funcion
+
+    print(
+        f"Catálogo: {len(catalogo.productos)} productos; "
+        f"{len(entrenamiento)} casos de entrenamiento, {len(prueba)} de prueba"
+    )
+    print(f"{'enrutador':<22} {'precisión':>9} {'slot cat.':>9} {'mensajes/s':>12}")
+    medir("regex anterior", anterior, prueba)
+    medir("reglas", enrutar_con(reglas), prueba)
+    medir("reglas + clasificador", enrutar_con(con_clasificador), prueba)
+
+
+if __name__ == "__main__":
+    main()
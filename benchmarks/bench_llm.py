@@ -0,0 +1,107 @@
+"""Latencia de cola con y sin la pasarela LLM, contra el OpenAI falso.
+
+Compara el cliente directo (sin timeout ni reintentos propios) con la
+pasarela sin hedging y con hedging, ante un servidor con cola larga y
+errores 429/5xx. Cuenta como "respaldo" cada llamada que terminó en
+ErrorLLM (el webhook respondería con el catálogo).
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_llm [--llamadas 300] [--cola 0.05]
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from benchmarks.openai_falso import ConfiguracionFalsa, iniciar_servidor
+from llm import Circuito, ErrorLLM, PasarelaLLM
+
+MENSAJES = [{"role": "user", "content": "¿Qué cuadernos tienen?"}]
+
+
+def percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def correr(nombre, llamar, llamadas, concurrencia):
+    def una(_):
+        inicio = time.perf_counter()
+        try:
+            llamar()
+            ok = True
+        except ErrorLLM:
+            ok = False
+        except Exception:
+            ok = None
+        return time.perf_counter() - inicio, ok
+
+    with ThreadPoolExecutor(concurrencia) as hilos:
+        resultados = list(hilos.map(una, range(llamadas)))
+    tiempos = [t for t, _ in resultados]
+    errores = sum(1 for _, ok in resultados if ok is None)
+    respaldos = sum(1 for _, ok in resultados if ok is False)
+    print(
+        f"{nombre:<22} {percentil(tiempos, 0.5):7.2f} {percentil(tiempos, 0.95):7.2f} "
+        f"{percentil(tiempos, 0.99):7.2f} {max(tiempos):7.2f} {errores:7d} "
+        f"{respaldos:9d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--llamadas", type=int, default=300)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--cola", type=float, default=0.05)
+    parser.add_argument("--latencia-cola", type=float, default=4.0)
+    parser.add_argument("--errores", type=float, default=0.05)
+    args = parser.parse_args()
+
+    config = ConfiguracionFalsa(
+        args.latencia, args.cola, args.latencia_cola, args.errores, semilla=1
+    )
+    servidor, base_url = iniciar_servidor(config)
+    cliente = OpenAI(api_key="falsa", base_url=base_url, max_retries=0)
+
+    def directo():
+        cliente.chat.completions.create(model="gpt-4o-mini", messages=MENSAJES)
+
+    sin_hedging = PasarelaLLM(
+        cliente, plazo=3, timeout=2, hedging=False, circuito=Circuito(10**6)
+    )
+    con_hedging = PasarelaLLM(
+        cliente, plazo=3, timeout=2, hedging=True, circuito=Circuito(10**6)
+    )
+
+    print(
+        f"OpenAI falso: {args.latencia}s, {args.cola:.0%} a {args.latencia_cola}s, "
+        f"{args.errores:.0%} errores; {args.llamadas} llamadas x{args.concurrencia}"
+    )
+    print(
+        f"{'cliente':<22} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'máx s':>7} "
+        f"{'errores':>7} {'respaldos':>9}"
+    )
+    correr("directo", directo, args.llamadas, args.concurrencia)
+    for nombre, pasarela in (
+        ("pasarela", sin_hedging),
+        ("pasarela + hedging", con_hedging),
+    ):
+        correr(
+            nombre,
+            lambda: pasarela.completar("gpt-4o-mini", MENSAJES),
+            args.llamadas,
+            args.concurrencia,
+        )
+        modelo = pasarela.estadisticas()["modelos"]["gpt-4o-mini"]
+        print(
+            f"{'':<22} reintentos={modelo['reintentos']} hedges={modelo['hedges']} "
+            f"ganados={modelo['hedges_ganados']}"
+        )
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
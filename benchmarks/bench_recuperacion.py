@@ -0,0 +1,111 @@
+"""Benchmark de latencia y recall: BM25, vectorial e híbrido (RRF).
+
+Funciona sin red: usa el embedding por hashing y una colección Chroma en
+memoria. Con --catalogo bd se usa el catálogo real (DATABASE_URL); por
+defecto se genera uno sintético.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_recuperacion [--catalogo bd] [--productos 400]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import chromadb
+
+from benchmarks.catalogo_sintetico import catalogo_sintetico
+from cache_embeddings import CacheEmbeddings
+from catalogo import cargar_catalogo
+from embeddings import EmbeddingHash
+from recuperacion import RecuperadorHibrido, documento_producto
+
+
+def con_error(texto, rnd):
+    palabras = texto.split()
+    i = max(range(len(palabras)), key=lambda j: len(palabras[j]))
+    palabra = palabras[i]
+    if len(palabra) > 4:
+        k = rnd.randrange(1, len(palabra) - 1)
+        palabras[i] = palabra[:k] + palabra[k + 1 :]
+    return " ".join(palabras)
+
+
+def consultas(catalogo, n, semilla=11):
+    rnd = random.Random(semilla)
+    productos = list(catalogo.productos.values())
+    casos = []
+    for p in rnd.sample(productos, min(n, len(productos))):
+        nombre = p.nombre.lower()
+        casos.append(("exacta", f"cuánto cuesta el {nombre}", p.id))
+        casos.append(("con_error", f"tienen {con_error(nombre, rnd)}?", p.id))
+    return casos
+
+
+def percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--catalogo", choices=["sintetico", "bd"], default="sintetico"
+    )
+    parser.add_argument("--productos", type=int, default=400)
+    parser.add_argument("--consultas", type=int, default=150)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.catalogo == "bd":
+        catalogo = cargar_catalogo()
+    else:
+        catalogo = catalogo_sintetico(args.productos)
+
+    funcion = EmbeddingHash()
+    coleccion = chromadb.EphemeralClient().get_or_create_collection(
+        name="bench_productos", embedding_function=funcion
+    )
+    productos = list(catalogo.productos.values())
+    coleccion.add(
+        ids=[f"producto_{p.id}" for p in productos],
+        documents=[documento_producto(catalogo, p) for p in productos],
+        metadatas=[
+            {"categoria": p.categoria or "", "stock": p.stock or 0} for p in productos
+        ],
+    )
+    embeddings = CacheEmbeddings(funcion, "hash-bench", ruta=None)
+    recuperador = RecuperadorHibrido(coleccion, embeddings, catalogo=catalogo)
+    casos = consultas(catalogo, args.consultas)
+    print(f"Catálogo: {len(productos)} productos, {len(casos)} consultas, k<={args.k}")
+    print(
+        f"{'modo':<10} {'tipo':<10} {'R@1':>6} {'R@k':>6} {'MRR':>6} "
+        f"{'k medio':>8} {'p50 ms':>8} {'p95 ms':>8}"
+    )
+
+    for modo in ("lexico", "vectorial", "hibrido"):
+        for tipo in ("exacta", "con_error"):
+            tiempos, r1, rk, rr, ks = [], 0, 0, 0.0, []
+            seleccion = [c for c in casos if c[0] == tipo]
+            for _, texto, esperado in seleccion:
+                inicio = time.perf_counter()
+                resultados = recuperador.buscar(texto, k_max=args.k, modo=modo)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                ids = [r.producto_id for r in resultados]
+                ks.append(len(ids))
+                if ids[:1] == [esperado]:
+                    r1 += 1
+                if esperado in ids:
+                    rk += 1
+                    rr += 1 / (ids.index(esperado) + 1)
+            total = len(seleccion) or 1
+            print(
+                f"{modo:<10} {tipo:<10} {r1 / total:6.2f} {rk / total:6.2f} "
+                f"{rr / total:6.2f} {statistics.mean(ks):8.2f} "
+                f"{percentil(tiempos, 0.5):8.2f} {percentil(tiempos, 0.95):8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
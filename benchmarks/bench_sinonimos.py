@@ -0,0 +1,70 @@
+"""Micro-benchmark: normalizador compilado vs. el bucle de re.sub anterior.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_sinonimos [--entradas 500] [--repeticiones 2000]
+"""
+
+import argparse
+import random
+import re
+import timeit
+
+from sinonimos import SINONIMOS, NormalizadorSinonimos
+
+MENSAJES = [
+    "Hola, ¿tienen libretas A5 y pegatinas vintage?",
+    "quiero un respuesto de hojas para mi cuaderno infinito",
+    "cuánto cuesta la cartuchera de 3 cierres y el porta lápiz",
+    "me interesan los marcadores stabilo y una goma",
+    "qué promociones hay esta semana?",
+]
+
+
+def reemplazar_sinonimos_bucle(texto, sinonimos):
+    # Implementación anterior: una compilación y un recorrido por entrada
+    texto = texto.lower()
+    for sin, real in sinonimos.items():
+        texto = re.sub(rf"\b{re.escape(sin)}\b", real, texto)
+    return texto
+
+
+def tabla_sintetica(n):
+    rnd = random.Random(42)
+    tabla = dict(SINONIMOS)
+    while len(tabla) < n:
+        palabra = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7))
+        tabla[palabra] = rnd.choice(list(SINONIMOS.values()))
+    return tabla
+
+
+def medir(nombre, funcion, repeticiones):
+    segundos = timeit.timeit(
+        lambda: [funcion(m) for m in MENSAJES], number=repeticiones
+    )
+    por_mensaje = segundos / (repeticiones * len(MENSAJES)) * 1e6
+    print(f"  {nombre:<12} {por_mensaje:9.2f} µs/mensaje")
+    return por_mensaje
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entradas", type=int, nargs="*", default=[21, 200, 500])
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    for n in args.entradas:
+        tabla = tabla_sintetica(n)
+        normalizador = NormalizadorSinonimos(tabla)
+        print(f"Tabla de {len(tabla)} sinónimos:")
+        # re cachea hasta 512 patrones; con tablas grandes el bucle recompila
+        anterior = medir(
+            "bucle re.sub",
+            lambda t: reemplazar_sinonimos_bucle(t, tabla),
+            max(1, args.repeticiones // 10),
+        )
+        nuevo = medir("compilado", normalizador.normalizar, args.repeticiones)
+        print(f"  aceleración  {anterior / nuevo:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
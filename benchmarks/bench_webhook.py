@@ -0,0 +1,364 @@
+"""Prueba de carga del webhook /whatsapp con dobles locales.
+
+Levanta la app (app.py o app1.py) en un servidor WSGI local y le envía posts
+de Twilio (From/Body) con N usuarios virtuales en paralelo; cada usuario
+espera la respuesta antes de mandar su siguiente mensaje. Todo lo externo es
+local:
+
+- OpenAI: benchmarks/openai_falso.py, con latencia y errores configurables.
+- Twilio: los posts entrantes se generan aquí; con --asincrono las
+  respuestas llegan a benchmarks/twilio_falso.py y la latencia se mide hasta
+  que llega el mensaje saliente.
+- Postgres: un esquema aparte (--esquema) recreado con el catálogo sintético
+  (benchmarks/bd_sintetica.py). Requiere DATABASE_URL; no toca las tablas
+  reales porque las conexiones usan PGOPTIONS=search_path.
+- Chroma (app1): colección local en un directorio temporal con el embedding
+  por hashing.
+
+Reporta p50/p95/p99, peticiones por segundo y consultas SQL por petición, y
+compara con la línea base guardada (la primera corrida de cada escenario
+queda como línea base; --guardar-base la reemplaza). Sale con código 1 si
+hay una regresión mayor a --tolerancia.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.bench_webhook [--app app1] [--peticiones 500]
+        [--concurrencia 8] [--latencia 0.3 --cola 0.02] [--asincrono]
+        [--replay posts.csv]
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.catalogo_sintetico import catalogo_sintetico
+
+RUTA_BASE = os.path.join(os.path.dirname(__file__), "linea_base_webhook.json")
+NUMERO_NEGOCIO = "whatsapp:+14155238886"
+
+PLANTILLAS = [
+    "hola",
+    "cuánto cuesta el {producto}?",
+    "tienen {producto}?",
+    "qué {categoria} tienen?",
+    "qué promociones tienen?",
+    "qué categorías manejan?",
+    "busco algo bonito para regalar a una amiga",
+    "hacen envíos a domicilio?",
+]
+
+
+def percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))] if valores else 0.0
+
+
+def posts_sinteticos(catalogo, peticiones, usuarios, semilla=3):
+    """``{From: [Body, ...]}`` con mensajes armados sobre el catálogo."""
+    rnd = random.Random(semilla)
+    productos = [p.nombre.lower() for p in catalogo.productos.values()]
+    categorias = [c.nombre.lower() for c in catalogo.categorias.values()]
+    por_usuario = {}
+    for i in range(peticiones):
+        numero = f"whatsapp:+5917{i % usuarios:07d}"
+        cuerpo = rnd.choice(PLANTILLAS).format(
+            producto=rnd.choice(productos), categoria=rnd.choice(categorias)
+        )
+        por_usuario.setdefault(numero, []).append(cuerpo)
+    return por_usuario
+
+
+def posts_grabados(ruta):
+    """Lee un CSV con columnas From,Body (por ejemplo exportado de Twilio)."""
+    por_usuario = {}
+    with open(ruta, newline="", encoding="utf-8") as archivo:
+        for fila in csv.DictReader(archivo):
+            por_usuario.setdefault(fila["From"], []).append(fila["Body"])
+    return por_usuario
+
+
+def contar_consultas():
+    """Cuenta las consultas SQL de las conexiones del pool (todas las
+    ejecuciones de cursor, incluidas las de los hilos en segundo plano)."""
+    import bd
+
+    contador = {"consultas": 0}
+    lock = threading.Lock()
+
+    class CursorContado(bd.CursorMedido):
+        def execute(self, *args, **kwargs):
+            with lock:
+                contador["consultas"] += 1
+            return super().execute(*args, **kwargs)
+
+        def executemany(self, *args, **kwargs):
+            with lock:
+                contador["consultas"] += 1
+            return super().executemany(*args, **kwargs)
+
+    # Las conexiones del pool se crean con bd.CursorMedido
+    bd.CursorMedido = CursorContado
+    return contador
+
+
+def indexar_chroma(modulo):
+    """Carga el catálogo del esquema de prueba en la colección de app1."""
+    from catalogo import obtener_catalogo
+    from recuperacion import documento_producto
+
+    catalogo = obtener_catalogo()
+    productos = list(catalogo.productos.values())
+    modulo.obtener_recuperador().coleccion.upsert(
+        ids=[f"producto_{p.id}" for p in productos],
+        documents=[documento_producto(catalogo, p) for p in productos],
+        metadatas=[
+            {"categoria": p.categoria or "", "stock": p.stock or 0} for p in productos
+        ],
+    )
+
+
+def esperar_lista(url, timeout=60):
+    """Espera a que /healthz deje de responder 503 (fin del calentamiento)."""
+    limite = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as r:
+                print("🔥 App lista:", json.loads(r.read())["estado"])
+                return
+        except urllib.error.HTTPError as e:
+            if e.code != 503 or time.monotonic() > limite:
+                raise
+        time.sleep(0.05)
+
+
+class Cliente:
+    """Un usuario virtual: envía sus mensajes de a uno y mide cada respuesta."""
+
+    def __init__(self, url, buzon=None, timeout=60):
+        self.url = url
+        self.buzon = buzon
+        self.timeout = timeout
+        self._sids = itertools.count(1)
+
+    def conversar(self, numero, mensajes):
+        from respuestas_async import MENSAJE_ERROR
+
+        resultados = []
+        for cuerpo in mensajes:
+            datos = urllib.parse.urlencode(
+                {
+                    "From": numero,
+                    "To": NUMERO_NEGOCIO,
+                    "Body": cuerpo,
+                    "MessageSid": f"SMbench{numero[-7:]}{next(self._sids):06d}",
+                    "NumMedia": "0",
+                }
+            ).encode()
+            esperados = self.buzon.recibidos(numero) + 1 if self.buzon else 0
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(
+                    self.url, data=datos, timeout=self.timeout
+                ) as r:
+                    cuerpo_respuesta = r.read().decode()
+                ok = MENSAJE_ERROR not in cuerpo_respuesta
+                if self.buzon is not None:
+                    ok = ok and self.buzon.esperar(numero, esperados, self.timeout)
+            except Exception:
+                ok = False
+            resultados.append((time.perf_counter() - inicio, ok))
+        return resultados
+
+
+def correr(args):
+    # === DOBLES LOCALES (antes de importar la app: leen el entorno al cargar) ===
+    from benchmarks import openai_falso, twilio_falso
+
+    config = openai_falso.ConfiguracionFalsa(
+        args.latencia,
+        args.cola,
+        args.latencia_cola,
+        args.errores,
+        semilla=1,
+        sigma=args.sigma,
+    )
+    servidor_openai, url_openai = openai_falso.iniciar_servidor(config)
+    buzon = twilio_falso.BuzonTwilio() if args.asincrono else None
+    servidor_twilio, url_twilio = twilio_falso.iniciar_servidor(buzon)
+    temporal = tempfile.mkdtemp(prefix="bench_webhook_")
+
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": url_openai,
+            "OPENAI_API_KEY": "falsa",
+            "TWILIO_API_URL": url_twilio,
+            "TWILIO_ACCOUNT_SID": "ACfalso",
+            "TWILIO_AUTH_TOKEN": "falso",
+            "TWILIO_WHATSAPP_FROM": NUMERO_NEGOCIO,
+            "RESPUESTA_ASINCRONA": "1" if args.asincrono else "0",
+            "PGOPTIONS": f"-c search_path={args.esquema}",
+            "EMBEDDING_BACKEND": "hash",
+            "CHROMA_RUTA": os.path.join(temporal, "chroma"),
+            "EMBEDDINGS_CACHE_RUTA": os.path.join(temporal, "embeddings.sqlite3"),
+            "SESIONES_RUTA": os.path.join(temporal, "sesiones.sqlite3"),
+        }
+    )
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("Falta DATABASE_URL (un Postgres local o de pruebas)")
+
+    from benchmarks.bd_sintetica import crear_esquema
+
+    catalogo = catalogo_sintetico(args.productos)
+    print(f"🗄️ Esquema {args.esquema}: {len(catalogo.productos)} productos sintéticos")
+    crear_esquema(os.environ["DATABASE_URL"], args.esquema, catalogo)
+    contador = contar_consultas()
+
+    import importlib
+
+    from werkzeug.serving import make_server
+
+    modulo = importlib.import_module(args.app)
+    if args.app == "app1":
+        indexar_chroma(modulo)
+    servidor_app = make_server("127.0.0.1", 0, modulo.app, threaded=True)
+    threading.Thread(target=servidor_app.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor_app.server_port}/whatsapp"
+    esperar_lista(url.replace("/whatsapp", "/healthz"))
+
+    if args.replay:
+        por_usuario = posts_grabados(args.replay)
+    else:
+        por_usuario = posts_sinteticos(catalogo, args.peticiones, args.usuarios)
+    total = sum(len(m) for m in por_usuario.values())
+
+    # Calentamiento: catálogo, índice y primera conexión fuera de la medición
+    cliente = Cliente(url, buzon)
+    cliente.conversar("whatsapp:+59100000000", ["hola", "qué categorías manejan?"])
+
+    consultas_antes = contador["consultas"]
+    llamadas_antes = config.peticiones
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrencia) as hilos:
+        resultados = [
+            r
+            for lote in hilos.map(
+                lambda par: cliente.conversar(*par), por_usuario.items()
+            )
+            for r in lote
+        ]
+    segundos = time.perf_counter() - inicio
+
+    for servidor in (servidor_app, servidor_openai, servidor_twilio):
+        servidor.shutdown()
+
+    tiempos = [t * 1000 for t, _ in resultados]
+    return {
+        "peticiones": total,
+        "errores": sum(1 for _, ok in resultados if not ok),
+        "rps": total / segundos,
+        "p50_ms": percentil(tiempos, 0.5),
+        "p95_ms": percentil(tiempos, 0.95),
+        "p99_ms": percentil(tiempos, 0.99),
+        "max_ms": max(tiempos, default=0.0),
+        "consultas_por_peticion": (contador["consultas"] - consultas_antes) / total,
+        "llm_por_peticion": (config.peticiones - llamadas_antes) / total,
+    }
+
+
+# (métrica, formato, True si más alto es peor)
+METRICAS = [
+    ("rps", "{:9.1f}", False),
+    ("p50_ms", "{:9.1f}", True),
+    ("p95_ms", "{:9.1f}", True),
+    ("p99_ms", "{:9.1f}", True),
+    ("max_ms", "{:9.1f}", True),
+    ("consultas_por_peticion", "{:9.2f}", True),
+    ("llm_por_peticion", "{:9.2f}", True),
+    ("errores", "{:9d}", True),
+]
+# Las que cuentan como regresión (max y errores se muestran, no se comparan)
+COMPARADAS = {"rps", "p50_ms", "p95_ms", "p99_ms", "consultas_por_peticion"}
+
+
+def comparar(actual, base, tolerancia):
+    regresiones = []
+    print(f"{'métrica':<24} {'base':>9} {'actual':>9} {'cambio':>8}")
+    for metrica, formato, mas_es_peor in METRICAS:
+        valor = actual[metrica]
+        anterior = base.get(metrica) if base else None
+        if anterior is None:
+            print(f"{metrica:<24} {'-':>9} {formato.format(valor)}")
+            continue
+        cambio = (valor - anterior) / anterior if anterior else 0.0
+        peor = cambio > tolerancia if mas_es_peor else cambio < -tolerancia
+        marca = " ⚠️" if peor and metrica in COMPARADAS else ""
+        if marca:
+            regresiones.append(metrica)
+        print(
+            f"{metrica:<24} {formato.format(anterior)} {formato.format(valor)} "
+            f"{cambio:+8.1%}{marca}"
+        )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", choices=("app", "app1"), default="app")
+    parser.add_argument("--peticiones", type=int, default=500)
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--replay", help="CSV con columnas From,Body")
+    parser.add_argument("--asincrono", action="store_true")
+    parser.add_argument("--esquema", default="bench_webhook")
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--sigma", type=float, default=0.0)
+    parser.add_argument("--cola", type=float, default=0.02)
+    parser.add_argument("--latencia-cola", type=float, default=3.0)
+    parser.add_argument("--errores", type=float, default=0.0)
+    parser.add_argument("--base", default=RUTA_BASE)
+    parser.add_argument("--guardar-base", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=0.15)
+    args = parser.parse_args()
+
+    escenario = (
+        f"{args.app}{'-asincrono' if args.asincrono else ''}"
+        f"-c{args.concurrencia}-{'replay' if args.replay else 'sintetico'}"
+    )
+    print(
+        f"Escenario {escenario}: OpenAI {args.latencia}s (sigma {args.sigma}, "
+        f"{args.cola:.0%} a {args.latencia_cola}s, {args.errores:.0%} errores)"
+    )
+    actual = correr(args)
+
+    bases = {}
+    if os.path.exists(args.base):
+        with open(args.base, encoding="utf-8") as archivo:
+            bases = json.load(archivo)
+    regresiones = comparar(actual, bases.get(escenario), args.tolerancia)
+
+    if args.guardar_base or escenario not in bases:
+        bases[escenario] = actual
+        with open(args.base, "w", encoding="utf-8") as archivo:
+            json.dump(bases, archivo, indent=2, sort_keys=True)
+        print(f"💾 Línea base de {escenario} guardada en {args.base}")
+    elif regresiones:
+        print(f"❌ Regresión en {', '.join(regresiones)} (tolerancia {args.tolerancia:.0%})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Catálogo sintético de papelería para los benchmarks (sin base de datos)."""
+
+import random
+from datetime import date, timedelta
+
+from catalogo import Catalogo, CategoriaCatalogo, ProductoCatalogo, PromocionCatalogo
+
+CATEGORIAS = {
+    "Cuadernos": ["Cuaderno", "Cuaderno Infinito", "Libreta", "Agenda"],
+    "Stickers": ["Sticker", "Stickers", "Libro Stickers"],
+    "Bolígrafos": ["Bolígrafo", "Lapicera", "Micropen", "Pigma Micropen"],
+    "Marcadores": ["Marcador", "Resaltador", "Marcador Doble Punta"],
+    "Estucheras": ["Estuchera", "Cartuchera"],
+    "Correctores": ["Corrector", "Corrector Cinta"],
+    "Hojas": ["Repuesto", "Pad", "Block"],
+}
+ATRIBUTOS = [
+    "A4", "A5", "B5", "Vintage", "Retro", "Princesas", "Kawaii", "Pastel",
+    "Neón", "Kuromi", "Gatitos", "Transparente", "Grande", "Mediana", "Pro",
+    "200 hojas", "Doble", "Hello Kitty", "Tiburón", "Galaxy",
+]
+
+
+def catalogo_sintetico(n, semilla=7):
+    rnd = random.Random(semilla)
+    categorias, productos, nombres = [], [], set()
+    por_categoria = {}
+    categoria_ids = {nombre: i for i, nombre in enumerate(CATEGORIAS, 1)}
+    pid = 0
+    while len(productos) < n:
+        categoria = rnd.choice(list(CATEGORIAS))
+        nombre = (
+            f"{rnd.choice(CATEGORIAS[categoria])} "
+            + " ".join(rnd.sample(ATRIBUTOS, rnd.choice([1, 2])))
+        )
+        if nombre in nombres:
+            continue
+        nombres.add(nombre)
+        pid += 1
+        productos.append(
+            ProductoCatalogo(
+                pid,
+                nombre,
+                f"{nombre} de la línea {rnd.choice(ATRIBUTOS).lower()}",
+                rnd.choice([0, 0, 3, 10, 25]),
+                categoria_ids[categoria],
+                categoria,
+                rnd.choice([10, 15, 35, 42, 50]),
+                (1,) if pid % 7 == 0 else (),
+            )
+        )
+        por_categoria.setdefault(categoria_ids[categoria], []).append(pid)
+    for nombre, cid in categoria_ids.items():
+        productos_ids = tuple(por_categoria.get(cid, ()))
+        categorias.append(CategoriaCatalogo(cid, nombre, productos_ids))
+    hoy = date.today()
+    promo = PromocionCatalogo(
+        1,
+        "Promo Escolar",
+        "",
+        15,
+        None,
+        hoy,
+        hoy + timedelta(days=10),
+        tuple(p.id for p in productos if p.promociones),
+    )
+    return Catalogo(productos, categorias, [promo], 1, hoy)
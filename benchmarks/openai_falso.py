@@ -0,0 +1,165 @@
+"""Servidor falso de la API de chat completions de OpenAI, para pruebas.
+
+Responde POST /v1/chat/completions con una latencia configurable (jitter
+uniforme o lognormal, más una cola larga) y una tasa de errores 429/500. Se
+usa apuntando el cliente a él:
+
+    python -m benchmarks.openai_falso --puerto 8089 --cola 0.05 --errores 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ConfiguracionFalsa:
+    def __init__(
+        self,
+        latencia=0.3,
+        cola=0.0,
+        latencia_cola=5.0,
+        errores=0.0,
+        reintentar_tras=None,
+        respuesta="Claro, con gusto te ayudo. ¿Qué producto te interesa?",
+        semilla=None,
+        sigma=0.0,
+    ):
+        self.latencia = latencia
+        self.cola = cola  # fracción de peticiones lentas
+        self.latencia_cola = latencia_cola
+        self.errores = errores  # fracción de 429/500
+        self.reintentar_tras = reintentar_tras
+        self.respuesta = respuesta
+        # sigma > 0: latencia lognormal con mediana ``latencia``
+        self.sigma = sigma
+        self.peticiones = 0
+        self._rnd = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def sortear(self):
+        with self._lock:
+            self.peticiones += 1
+            lenta = self._rnd.random() < self.cola
+            falla = self._rnd.random() < self.errores
+            estado = self._rnd.choice([429, 500, 503]) if falla else 200
+            if self.sigma > 0:
+                jitter = self._rnd.lognormvariate(0, self.sigma)
+            else:
+                jitter = self._rnd.uniform(0.8, 1.2)
+        return (self.latencia_cola if lenta else self.latencia) * jitter, estado
+
+
+def _manejador(config):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _json(self, estado, cuerpo, cabeceras=()):
+            datos = json.dumps(cuerpo).encode()
+            try:
+                self.send_response(estado)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                for clave, valor in cabeceras:
+                    self.send_header(clave, valor)
+                self.end_headers()
+                self.wfile.write(datos)
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente se cansó de esperar (timeout o hedge perdedor)
+                pass
+
+        def do_POST(self):
+            largo = int(self.headers.get("Content-Length", 0))
+            peticion = json.loads(self.rfile.read(largo) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "ruta desconocida"}})
+                return
+
+            demora, estado = config.sortear()
+            time.sleep(demora)
+            if estado != 200:
+                cabeceras = []
+                if estado == 429 and config.reintentar_tras is not None:
+                    cabeceras.append(("Retry-After", str(config.reintentar_tras)))
+                self._json(
+                    estado,
+                    {"error": {"message": "error simulado", "type": "simulado"}},
+                    cabeceras,
+                )
+                return
+
+            prompt = sum(
+                len(str(m.get("content", "")).split())
+                for m in peticion.get("messages", [])
+            )
+            self._json(
+                200,
+                {
+                    "id": f"chatcmpl-falso-{config.peticiones}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": peticion.get("model", "falso"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": config.respuesta,
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt,
+                        "completion_tokens": len(config.respuesta.split()),
+                        "total_tokens": prompt + len(config.respuesta.split()),
+                    },
+                },
+            )
+
+    return Manejador
+
+
+def iniciar_servidor(config=None, puerto=0):
+    """Arranca el servidor en un hilo; devuelve ``(servidor, base_url)``."""
+    config = config or ConfiguracionFalsa()
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _manejador(config))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=8089)
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--cola", type=float, default=0.0)
+    parser.add_argument("--latencia-cola", type=float, default=5.0)
+    parser.add_argument("--errores", type=float, default=0.0)
+    parser.add_argument("--reintentar-tras", type=float)
+    parser.add_argument("--sigma", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = ConfiguracionFalsa(
+        args.latencia,
+        args.cola,
+        args.latencia_cola,
+        args.errores,
+        args.reintentar_tras,
+        sigma=args.sigma,
+    )
+    servidor, base_url = iniciar_servidor(config, args.puerto)
+    print(f"🤖 OpenAI falso escuchando en {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
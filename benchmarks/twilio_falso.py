@@ -0,0 +1,79 @@
+"""Servidor falso de la API REST de mensajes de Twilio, para pruebas.
+
+Acepta POST /2010-04-01/Accounts/<sid>/Messages.json (lo que usa
+respuestas_async.enviar_whatsapp) y guarda cada mensaje por destinatario.
+Con RESPUESTA_ASINCRONA=1 se usa apuntando TWILIO_API_URL a él:
+
+    TWILIO_API_URL=http://127.0.0.1:8090 python app.py
+"""
+
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BuzonTwilio:
+    """Mensajes salientes recibidos, con espera por destinatario."""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.mensajes = []
+        self._por_destino = {}
+        self._cond = threading.Condition()
+
+    def recibir(self, datos):
+        with self._cond:
+            self.mensajes.append(datos)
+            destino = datos.get("To", "")
+            self._por_destino[destino] = self._por_destino.get(destino, 0) + 1
+            self._cond.notify_all()
+            return len(self.mensajes)
+
+    def recibidos(self, destino):
+        with self._cond:
+            return self._por_destino.get(destino, 0)
+
+    def esperar(self, destino, cuantos, timeout):
+        """Espera hasta que ``destino`` tenga ``cuantos`` mensajes."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._por_destino.get(destino, 0) >= cuantos, timeout
+            )
+
+
+def _manejador(buzon):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            largo = int(self.headers.get("Content-Length", 0))
+            datos = dict(urllib.parse.parse_qsl(self.rfile.read(largo).decode()))
+            if not self.path.endswith("/Messages.json"):
+                estado, cuerpo = 404, {"message": "ruta desconocida"}
+            else:
+                time.sleep(buzon.latencia)
+                numero = buzon.recibir(datos)
+                estado, cuerpo = 201, {"sid": f"SMfalso{numero:08d}", "status": "queued"}
+            salida = json.dumps(cuerpo).encode()
+            try:
+                self.send_response(estado)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(salida)))
+                self.end_headers()
+                self.wfile.write(salida)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Manejador
+
+
+def iniciar_servidor(buzon=None, puerto=0):
+    """Arranca el servidor en un hilo; devuelve ``(servidor, base_url)``."""
+    buzon = buzon or BuzonTwilio()
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _manejador(buzon))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
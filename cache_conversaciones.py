@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSACIONES_MAX = int(os.getenv("CONVERSACIONES_MAX", 1000))
+CONVERSACIONES_MAX_BYTES = int(os.getenv("CONVERSACIONES_MAX_BYTES", 50_000_000))
+# Segundos sin actividad tras los que una conversación se descarta
+CONVERSACIONES_TTL = float(os.getenv("CONVERSACIONES_TTL", 6 * 3600))
+
+
+def estimar_bytes(valor):
+    """Tamaño aproximado de una conversación (lista de mensajes o dict)."""
+    if isinstance(valor, str):
+        return len(valor) + 50
+    if isinstance(valor, dict):
+        return 64 + sum(estimar_bytes(k) + estimar_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return 56 + sum(estimar_bytes(v) for v in valor)
+    return 32
+
+
+class CacheConversaciones:
+    """Caché LRU + TTL para el estado de cada conversación.
+
+    Se usa como un dict (``in``, ``[]``, ``get``) y limita tanto el número de
+    entradas como los bytes aproximados. Una conversación expulsada se
+    vuelve a construir desde Postgres la próxima vez que se necesita.
+    """
+
+    def __init__(
+        self,
+        max_entradas=CONVERSACIONES_MAX,
+        max_bytes=CONVERSACIONES_MAX_BYTES,
+        ttl=CONVERSACIONES_TTL,
+    ):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> [valor, bytes, ultimo_acceso]
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+
+    def _quitar(self, clave):
+        _, tam, _ = self._datos.pop(clave)
+        self._bytes -= tam
+
+    def _vigente(self, clave, ahora):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        if ahora - entrada[2] > self.ttl:
+            self._quitar(clave)
+            self.expiraciones += 1
+            return None
+        return entrada
+
+    def _recortar(self, proteger=None):
+        while self._datos and (
+            len(self._datos) > self.max_entradas or self._bytes > self.max_bytes
+        ):
+            clave = next(iter(self._datos))
+            if clave == proteger:
+                if len(self._datos) == 1:
+                    break
+                self._datos.move_to_end(clave)
+                continue
+            self._quitar(clave)
+            self.expulsiones += 1
+
+    def get(self, clave, defecto=None):
+        with self._lock:
+            entrada = self._vigente(clave, time.monotonic())
+            if entrada is None:
+                self.fallos += 1
+                return defecto
+            entrada[2] = time.monotonic()
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def obtener_o_cargar(self, clave, cargar):
+        """Devuelve ``(valor, cargado)``; en un fallo llama a ``cargar()``."""
+        valor = self.get(clave)
+        if valor is not None:
+            return valor, False
+        valor = cargar()
+        self[clave] = valor
+        return valor, True
+
+    def agregar(self, clave, mensaje):
+        """Añade un mensaje a la lista de la conversación y actualiza su tamaño."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self._datos[clave] = entrada = [[], estimar_bytes([]), 0.0]
+                self._bytes += entrada[1]
+            entrada[0].append(mensaje)
+            tam = estimar_bytes(mensaje)
+            entrada[1] += tam
+            entrada[2] = time.monotonic()
+            self._bytes += tam
+            self._datos.move_to_end(clave)
+            self._recortar(proteger=clave)
+
+    def __contains__(self, clave):
+        with self._lock:
+            return self._vigente(clave, time.monotonic()) is not None
+
+    def __getitem__(self, clave):
+        with self._lock:
+            entrada = self._vigente(clave, time.monotonic())
+            if entrada is None:
+                raise KeyError(clave)
+            entrada[2] = time.monotonic()
+            self._datos.move_to_end(clave)
+            return entrada[0]
+
+    def __setitem__(self, clave, valor):
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            tam = estimar_bytes(valor)
+            self._datos[clave] = [valor, tam, time.monotonic()]
+            self._bytes += tam
+            self._recortar(proteger=clave)
+
+    def __delitem__(self, clave):
+        with self._lock:
+            self._quitar(clave)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._datos)
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+            }
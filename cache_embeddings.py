@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDINGS_CACHE_RUTA = os.getenv("EMBEDDINGS_CACHE_RUTA", "cache_embeddings.sqlite3")
+EMBEDDINGS_CACHE_MAX = int(os.getenv("EMBEDDINGS_CACHE_MAX", 5000))
+
+
+def normalizar_consulta(texto):
+    return " ".join(texto.lower().split())
+
+
+class CacheEmbeddings:
+    """Caché de embeddings de consultas en dos niveles.
+
+    Un LRU en memoria delante de una tabla SQLite en disco (vectores float32),
+    que sobrevive a reinicios y se comparte entre procesos de la misma
+    máquina. ``funcion`` es la función de embedding de Chroma y solo se llama
+    con los textos que no están en ninguno de los dos niveles.
+    """
+
+    def __init__(
+        self,
+        funcion,
+        modelo,
+        ruta=EMBEDDINGS_CACHE_RUTA,
+        max_memoria=EMBEDDINGS_CACHE_MAX,
+    ):
+        self.funcion = funcion
+        self.modelo = modelo
+        self.max_memoria = max_memoria
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco = None
+        if ruta:
+            self._disco = sqlite3.connect(ruta, check_same_thread=False, timeout=5)
+            self._disco.execute("PRAGMA journal_mode=WAL;")
+            self._disco.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    modelo TEXT NOT NULL,
+                    texto TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (modelo, texto)
+                );
+                """
+            )
+            self._disco.commit()
+        self.aciertos_memoria = 0
+        self.aciertos_disco = 0
+        self.fallos = 0
+
+    def _recordar(self, texto, vector):
+        self._memoria[texto] = vector
+        self._memoria.move_to_end(texto)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _leer_disco(self, textos):
+        if self._disco is None or not textos:
+            return {}
+        marcas = ",".join("?" * len(textos))
+        filas = self._disco.execute(
+            "SELECT texto, vector FROM embeddings "
+            f"WHERE modelo = ? AND texto IN ({marcas});",
+            (self.modelo, *textos),
+        ).fetchall()
+        return {texto: array("f", vector) for texto, vector in filas}
+
+    def _escribir_disco(self, pares):
+        if self._disco is None or not pares:
+            return
+        self._disco.executemany(
+            "INSERT OR REPLACE INTO embeddings (modelo, texto, vector) "
+            "VALUES (?, ?, ?);",
+            [(self.modelo, t, v.tobytes()) for t, v in pares],
+        )
+        self._disco.commit()
+
+    def obtener(self, textos):
+        """Embeddings de ``textos`` (ya normalizados aquí), en el mismo orden."""
+        claves = [normalizar_consulta(t) for t in textos]
+        resultado = {}
+        with self._lock:
+            faltan = []
+            for clave in dict.fromkeys(claves):
+                vector = self._memoria.get(clave)
+                if vector is not None:
+                    self._memoria.move_to_end(clave)
+                    resultado[clave] = vector
+                    self.aciertos_memoria += 1
+                else:
+                    faltan.append(clave)
+
+            for clave, vector in self._leer_disco(faltan).items():
+                resultado[clave] = vector
+                self._recordar(clave, vector)
+                self.aciertos_disco += 1
+            faltan = [c for c in faltan if c not in resultado]
+
+        if faltan:
+            # float32 compacto: ~6 KB por vector de 1536 dimensiones
+            vectores = [array("f", v) for v in self.funcion(faltan)]
+            with self._lock:
+                self.fallos += len(faltan)
+                for clave, vector in zip(faltan, vectores):
+                    resultado[clave] = vector
+                    self._recordar(clave, vector)
+                self._escribir_disco(list(zip(faltan, vectores)))
+
+        return [resultado[c].tolist() for c in claves]
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos_memoria + self.aciertos_disco + self.fallos
+            aciertos = self.aciertos_memoria + self.aciertos_disco
+            return {
+                "entradas_memoria": len(self._memoria),
+                "aciertos_memoria": self.aciertos_memoria,
+                "aciertos_disco": self.aciertos_disco,
+                "fallos": self.fallos,
+                "tasa_aciertos": aciertos / consultas if consultas else 0.0,
+            }
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPUESTAS_TTL = float(os.getenv("RESPUESTAS_TTL", 3600))
+RESPUESTAS_MAX = int(os.getenv("RESPUESTAS_MAX", 500))
+
+
+class CacheRespuestas:
+    """Caché de respuestas del LLM para preguntas generales.
+
+    La clave es (tipo, filtro, hash del contexto, modelo): si el contexto
+    cambia la clave cambia sola, e ``invalidar()`` se engancha a las recargas
+    del catálogo para no retener respuestas viejas hasta que venza el TTL.
+    """
+
+    def __init__(self, ttl=RESPUESTAS_TTL, max_entradas=RESPUESTAS_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()  # clave -> (respuesta, expira)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+
+    @staticmethod
+    def clave(tipo, filtro, contexto, modelo):
+        huella = hashlib.sha256(contexto.encode("utf-8")).hexdigest()
+        return (tipo, (filtro or "").lower(), huella, modelo)
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[1] < time.monotonic():
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, respuesta):
+        with self._lock:
+            self._datos[clave] = (respuesta, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, *_):
+        with self._lock:
+            self._datos.clear()
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "invalidaciones": self.invalidaciones,
+            }
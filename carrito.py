@@ -0,0 +1,279 @@
+import atexit
+import json
+import os
+import threading
+from collections import namedtuple
+from decimal import Decimal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tiempo máximo que un cambio de carrito espera en memoria antes de escribirse
+CARRITO_FLUSH_SEGUNDOS = float(os.getenv("CARRITO_FLUSH_SEGUNDOS", 1))
+# Al llegar a este número de carritos con cambios se escribe sin esperar
+CARRITO_LOTE = int(os.getenv("CARRITO_LOTE", 200))
+
+LineaCarrito = namedtuple(
+    "LineaCarrito",
+    "producto_id nombre cantidad precio descuento promocion subtotal",
+)
+ResumenCarrito = namedtuple("ResumenCarrito", "lineas total")
+
+
+class _Cambios:
+    """Operaciones pendientes de un carrito, ya compactadas.
+
+    ``fijos`` pone la cantidad de un producto (0 = quitarlo) y ``sumas`` se
+    aplica después; así "quitar y luego agregar 2" queda en fijo 0 + suma 2.
+    La función SQL ``carrito_aplicar`` (migración 0005) usa la misma regla.
+    """
+
+    __slots__ = ("sumas", "fijos")
+
+    def __init__(self):
+        self.sumas = {}
+        self.fijos = {}
+
+    def sumar(self, producto_id, cantidad):
+        clave = str(producto_id)
+        self.sumas[clave] = self.sumas.get(clave, 0) + cantidad
+
+    def fijar(self, producto_id, cantidad):
+        clave = str(producto_id)
+        self.fijos[clave] = cantidad
+        self.sumas.pop(clave, None)
+
+    def componer(self, posteriores):
+        """Aplica ``posteriores`` encima de estos cambios."""
+        for clave, cantidad in posteriores.fijos.items():
+            self.fijar(clave, cantidad)
+        for clave, cantidad in posteriores.sumas.items():
+            self.sumar(clave, cantidad)
+
+    def parametros(self):
+        return json.dumps(self.sumas), json.dumps(self.fijos)
+
+
+def aplicar(items, cambios):
+    """Versión en Python de ``carrito_aplicar``: ``{producto_id: cantidad}``."""
+    resultado = {}
+    for clave in {**items, **cambios.sumas, **cambios.fijos}:
+        cantidad = cambios.fijos.get(clave, items.get(clave, 0))
+        cantidad += cambios.sumas.get(clave, 0)
+        if cantidad > 0:
+            resultado[clave] = cantidad
+    return resultado
+
+
+class Carritos:
+    """Carritos persistidos en la tabla Carrito con escritura diferida.
+
+    Cada carrito es una fila con ``items`` JSONB ``{"producto_id": cantidad}``.
+    Agregar o quitar solo anota el cambio en memoria; un hilo lo escribe por
+    lotes aplicándolo sobre la fila actual dentro de Postgres, de modo que
+    dos workers que tocan el mismo carrito no se pisan. Ver el carrito es una
+    sola consulta que superpone los cambios aún pendientes y calcula precios
+    vigentes y descuentos de promociones activas para todas las líneas.
+    """
+
+    def __init__(self, intervalo=CARRITO_FLUSH_SEGUNDOS, lote=CARRITO_LOTE):
+        self.intervalo = intervalo
+        self.lote = lote
+        self._pendientes = {}  # telefono -> _Cambios
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        self._despertar = threading.Event()
+        self._detenido = False
+        self._hilo = None
+        self.escritos = 0
+
+    def _iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._bucle, name="escritor-carritos", daemon=True
+            )
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def _anotar(self, telefono, operacion, producto_id, cantidad):
+        with self._lock:
+            if self._detenido:
+                raise RuntimeError("El escritor de carritos está detenido")
+            cambios = self._pendientes.setdefault(telefono, _Cambios())
+            getattr(cambios, operacion)(producto_id, cantidad)
+            lleno = len(self._pendientes) >= self.lote
+            self._iniciar()
+        if lleno:
+            self._despertar.set()
+
+    def agregar(self, telefono, producto_id, cantidad=1):
+        self._anotar(telefono, "sumar", producto_id, cantidad)
+
+    def fijar(self, telefono, producto_id, cantidad):
+        self._anotar(telefono, "fijar", producto_id, max(0, cantidad))
+
+    def quitar(self, telefono, producto_id):
+        self._anotar(telefono, "fijar", producto_id, 0)
+
+    def _pendiente(self, telefono):
+        with self._lock:
+            cambios = _Cambios()
+            if telefono in self._pendientes:
+                cambios.componer(self._pendientes[telefono])
+            return cambios
+
+    def items(self, telefono):
+        """``{producto_id: cantidad}`` con los cambios pendientes incluidos."""
+        from bd import cursor_bd
+
+        with cursor_bd() as cur:
+            cur.execute("SELECT items FROM Carrito WHERE telefono = %s;", (telefono,))
+            fila = cur.fetchone()
+        items = aplicar(fila["items"] if fila else {}, self._pendiente(telefono))
+        return {int(clave): cantidad for clave, cantidad in items.items()}
+
+    def resumen(self, telefono):
+        """Líneas con el precio y la promoción del snapshot del catálogo.
+
+        Son los mismos que citan las plantillas (lista de precios 1), así el
+        total no difiere de lo que el bot acaba de responder.
+        """
+        from bd import cursor_bd
+        from catalogo import obtener_catalogo
+
+        sumas, fijos = self._pendiente(telefono).parametros()
+        with cursor_bd() as cur:
+            cur.execute(
+                """
+                SELECT p.id AS producto_id, p.nombre, c.cantidad::int AS cantidad
+                FROM JSONB_EACH_TEXT(
+                    carrito_aplicar(
+                        COALESCE(
+                            (SELECT items FROM Carrito WHERE telefono = %s),
+                            '{}'::jsonb
+                        ),
+                        %s::jsonb,
+                        %s::jsonb
+                    )
+                ) AS c (producto_id, cantidad)
+                JOIN Producto p ON p.id = c.producto_id::int
+                ORDER BY p.nombre;
+                """,
+                (telefono, sumas, fijos),
+            )
+            filas = cur.fetchall()
+
+        catalogo = obtener_catalogo()
+        lineas = []
+        for f in filas:
+            producto = catalogo.productos.get(f["producto_id"])
+            promo, final = (
+                catalogo.mejor_promocion(producto) if producto else (None, None)
+            )
+            precio = None if final is None else Decimal(producto.precio)
+            descuento = Decimal(0) if final is None else precio - final
+            subtotal = None if final is None else final * f["cantidad"]
+            lineas.append(
+                LineaCarrito(
+                    f["producto_id"],
+                    f["nombre"],
+                    f["cantidad"],
+                    precio,
+                    descuento,
+                    promo.nombre if promo else None,
+                    subtotal,
+                )
+            )
+        total = sum((l.subtotal for l in lineas if l.subtotal is not None), Decimal(0))
+        return ResumenCarrito(lineas, total)
+
+    def vaciar(self):
+        """Escribe todo lo pendiente; devuelve cuántos carritos se enviaron."""
+        from psycopg2.extras import execute_values
+
+        from bd import cursor_bd
+
+        with self._escritura:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, {}
+            if not lote:
+                return 0
+            filas = [
+                (telefono, *lote[telefono].parametros()) for telefono in sorted(lote)
+            ]
+            try:
+                with cursor_bd(commit=True) as cur:
+                    execute_values(
+                        cur,
+                        """
+                        INSERT INTO Carrito (telefono)
+                        VALUES %s
+                        ON CONFLICT (telefono) DO NOTHING;
+                        """,
+                        [(telefono,) for telefono, _, _ in filas],
+                        page_size=self.lote,
+                    )
+                    # UPDATE ... FROM VALUES no bloquea en un orden fijo: se
+                    # toman antes todas las filas ordenadas, así dos workers
+                    # con números en común no se bloquean en cruz
+                    cur.execute(
+                        """
+                        SELECT telefono FROM Carrito
+                        WHERE telefono = ANY(%s)
+                        ORDER BY telefono
+                        FOR UPDATE;
+                        """,
+                        ([telefono for telefono, _, _ in filas],),
+                    )
+                    # carrito_aplicar lee la fila ya bloqueada: los cambios de
+                    # otro worker confirmados entretanto no se pierden
+                    execute_values(
+                        cur,
+                        """
+                        UPDATE Carrito c
+                        SET items = carrito_aplicar(c.items, v.sumas, v.fijos),
+                            actualizado = NOW()
+                        FROM (VALUES %s) AS v (telefono, sumas, fijos)
+                        WHERE c.telefono = v.telefono;
+                        """,
+                        filas,
+                        template="(%s, %s::jsonb, %s::jsonb)",
+                        page_size=self.lote,
+                    )
+            except Exception:
+                # Se reintenta en el próximo ciclo, antes de lo que llegó después
+                with self._lock:
+                    for telefono, cambios in self._pendientes.items():
+                        lote.setdefault(telefono, _Cambios()).componer(cambios)
+                    self._pendientes = lote
+                raise
+            self.escritos += len(filas)
+            return len(filas)
+
+    def _bucle(self):
+        while not self._detenido:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                print("⚠️ No se pudieron guardar los carritos:", e)
+
+    def detener(self):
+        with self._lock:
+            self._detenido = True
+        self._despertar.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=self.intervalo + 5)
+        try:
+            self.vaciar()
+        except Exception as e:
+            print("❌ Carritos sin guardar al cerrar:", e)
+
+    def estadisticas(self):
+        with self._lock:
+            return {"pendientes": len(self._pendientes), "escritos": self.escritos}
+
+
+carritos = Carritos()
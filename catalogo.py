@@ -0,0 +1,303 @@
+import os
+import select
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+from types import MappingProxyType
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Respaldo por si se pierde una notificación: el snapshot no vive más que esto
+CATALOGO_TTL = float(os.getenv("CATALOGO_TTL", 600))
+CATALOGO_CANAL = "catalogo_cambios"
+# Con CATALOGO_ESCUCHAR=0 solo se usa el TTL (por ejemplo en scripts por lotes)
+CATALOGO_ESCUCHAR = os.getenv("CATALOGO_ESCUCHAR", "1") == "1"
+
+ProductoCatalogo = namedtuple(
+    "ProductoCatalogo",
+    "id nombre descripcion stock categoria_id categoria precio promociones",
+)
+CategoriaCatalogo = namedtuple("CategoriaCatalogo", "id nombre productos")
+PromocionCatalogo = namedtuple(
+    "PromocionCatalogo",
+    "id nombre descripcion porcentaje_descuento monto_descuento "
+    "fecha_inicio fecha_fin productos",
+)
+
+
+class Catalogo:
+    """Snapshot inmutable del catálogo: productos con precio (lista 1),
+    categorías y promociones vigentes (``fecha_fin >= CURRENT_DATE``).
+
+    Se recarga al cambiar el día, porque las promociones dependen de la fecha.
+    """
+
+    def __init__(self, productos, categorias, promociones, version, fecha):
+        self.productos = MappingProxyType({p.id: p for p in productos})
+        self.categorias = MappingProxyType({c.id: c for c in categorias})
+        self.promociones = MappingProxyType({p.id: p for p in promociones})
+        self.version = version
+        self.fecha = fecha
+        self.cargado = time.monotonic()
+
+    def productos_ordenados(self):
+        """Por categoría y nombre, como el listado del webhook."""
+        return sorted(
+            self.productos.values(), key=lambda p: (p.categoria or "", p.nombre)
+        )
+
+    def categorias_ordenadas(self):
+        return sorted(self.categorias.values(), key=lambda c: c.nombre)
+
+    def promociones_ordenadas(self):
+        return sorted(self.promociones.values(), key=lambda p: (p.fecha_fin, p.id))
+
+    def mejor_promocion(self, producto):
+        """``(promocion, precio_final)`` con el mayor descuento vigente hoy.
+
+        Es el precio que citan las plantillas y el que cobra el carrito.
+        """
+        if producto.precio is None:
+            return None, None
+        precio = Decimal(producto.precio)
+        hoy = date.today()
+        mejor, final = None, precio
+        for pid in producto.promociones:
+            promo = self.promociones.get(pid)
+            if promo is None or promo.fecha_inicio > hoy:
+                continue
+            if promo.porcentaje_descuento:
+                descuento = precio * Decimal(promo.porcentaje_descuento) / 100
+            else:
+                descuento = Decimal(promo.monto_descuento or 0)
+            if precio - descuento < final:
+                mejor, final = promo, max(precio - descuento, Decimal(0))
+        return mejor, final.quantize(Decimal("0.01"))
+
+
+def resumen_promociones(cur, ids=None):
+    """Promociones con sus productos en una sola consulta.
+
+    Sin ``ids`` devuelve las vigentes (``fecha_fin >= CURRENT_DATE``). Cada
+    fila trae ``productos``: lista de dicts con producto_id, producto_nombre,
+    producto_descripcion, producto_precio (precio vigente) e imagen_url.
+    """
+    if ids is None:
+        filtro, parametros = "pr.fecha_fin >= CURRENT_DATE", ()
+    else:
+        filtro, parametros = "pr.id = ANY(%s)", (list(ids),)
+    cur.execute(
+        f"""
+        SELECT pr.id, pr.nombre, pr.descripcion, pr.porcentaje_descuento,
+               pr.monto_descuento, pr.fecha_inicio, pr.fecha_fin,
+               COALESCE(
+                   JSON_AGG(
+                       JSON_BUILD_OBJECT(
+                           'producto_id', p.id,
+                           'producto_nombre', p.nombre,
+                           'producto_descripcion', p.descripcion,
+                           'producto_precio', precio.monto,
+                           'imagen_url', imagen.url
+                       ) ORDER BY p.id
+                   ) FILTER (WHERE p.id IS NOT NULL),
+                   '[]'
+               ) AS productos
+        FROM Promocion pr
+        LEFT JOIN ProductoPromocion pp ON pp.promocion_id = pr.id
+        LEFT JOIN Producto p ON p.id = pp.producto_id
+        LEFT JOIN LATERAL (
+            SELECT monto FROM PrecioProducto
+            WHERE producto_id = p.id
+              AND CURRENT_DATE BETWEEN fecha_inicio
+                                   AND COALESCE(fecha_fin, CURRENT_DATE)
+            ORDER BY fecha_inicio DESC LIMIT 1
+        ) precio ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT url FROM ImagenProducto WHERE producto_id = p.id LIMIT 1
+        ) imagen ON TRUE
+        WHERE {filtro}
+        GROUP BY pr.id
+        ORDER BY pr.fecha_fin, pr.id;
+        """,
+        parametros,
+    )
+    return cur.fetchall()
+
+
+def cargar_catalogo(version=0):
+    from bd import cursor_bd
+
+    with cursor_bd() as cur:
+        cur.execute("SELECT id, nombre FROM Categoria ORDER BY id;")
+        filas_categorias = cur.fetchall()
+
+        # Solo los ids: precio e imagen (resumen_promociones) son para los PDF
+        cur.execute(
+            """
+            SELECT pr.id, pr.nombre, pr.descripcion, pr.porcentaje_descuento,
+                   pr.monto_descuento, pr.fecha_inicio, pr.fecha_fin,
+                   COALESCE(
+                       ARRAY_AGG(pp.producto_id ORDER BY pp.producto_id)
+                           FILTER (WHERE pp.producto_id IS NOT NULL),
+                       '{}'
+                   ) AS productos
+            FROM Promocion pr
+            LEFT JOIN ProductoPromocion pp ON pp.promocion_id = pr.id
+            WHERE pr.fecha_fin >= CURRENT_DATE
+            GROUP BY pr.id;
+            """
+        )
+        promociones = [
+            PromocionCatalogo(**{**f, "productos": tuple(f["productos"])})
+            for f in cur.fetchall()
+        ]
+
+        cur.execute(
+            """
+            SELECT p.id, p.nombre, COALESCE(p.descripcion, '') AS descripcion,
+                   p.stock, p.categoria_id, c.nombre AS categoria,
+                   pp.monto AS precio
+            FROM Producto p
+            LEFT JOIN Categoria c ON c.id = p.categoria_id
+            LEFT JOIN PrecioProducto pp
+                 ON pp.producto_id = p.id AND pp.lista_precio_id = 1
+            ORDER BY p.id;
+            """
+        )
+        filas_productos = cur.fetchall()
+
+    promos_por_producto = {}
+    for promo in promociones:
+        for producto_id in promo.productos:
+            promos_por_producto.setdefault(producto_id, []).append(promo.id)
+    productos = [
+        ProductoCatalogo(**f, promociones=tuple(promos_por_producto.get(f["id"], ())))
+        for f in filas_productos
+    ]
+
+    por_categoria = {}
+    for p in productos:
+        por_categoria.setdefault(p.categoria_id, []).append(p.id)
+    categorias = [
+        CategoriaCatalogo(c["id"], c["nombre"], tuple(por_categoria.get(c["id"], ())))
+        for c in filas_categorias
+    ]
+    return Catalogo(productos, categorias, promociones, version, date.today())
+
+
+_catalogo = None
+_catalogo_lock = threading.Lock()
+_version = 0
+_suscriptores = []
+_escucha = None
+_escucha_lock = threading.Lock()
+
+
+def al_cambiar(callback):
+    """Registra ``callback(catalogo)``; se llama tras cada recarga."""
+    _suscriptores.append(callback)
+    return callback
+
+
+def _vencido(catalogo):
+    return (
+        catalogo is None
+        or time.monotonic() - catalogo.cargado > CATALOGO_TTL
+        or catalogo.fecha != date.today()
+    )
+
+
+def _cargar():
+    # Llamar con _catalogo_lock tomado
+    global _catalogo, _version
+    _version += 1
+    _catalogo = cargar_catalogo(_version)
+    return _catalogo
+
+
+def _avisar(catalogo):
+    for callback in list(_suscriptores):
+        try:
+            callback(catalogo)
+        except Exception as e:
+            print("⚠️ Error en suscriptor del catálogo:", e)
+
+
+def recargar_catalogo():
+    with _catalogo_lock:
+        catalogo = _cargar()
+    _avisar(catalogo)
+    return catalogo
+
+
+def obtener_catalogo():
+    if CATALOGO_ESCUCHAR:
+        iniciar_escucha()
+    catalogo = _catalogo
+    if _vencido(catalogo):
+        recargado = None
+        with _catalogo_lock:
+            if _vencido(_catalogo):
+                recargado = _cargar()
+            catalogo = _catalogo
+        if recargado is not None:
+            _avisar(recargado)
+    return catalogo
+
+
+def _escuchar():
+    import psycopg2
+    from psycopg2 import extensions
+
+    from bd import conectar_bd
+
+    espera = 1
+    while True:
+        conn = None
+        try:
+            conn = conectar_bd()
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CATALOGO_CANAL};")
+            espera = 1
+            # Lo que cambió mientras no escuchábamos
+            recargar_catalogo()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if not conn.notifies:
+                    continue
+                # Agrupa una ráfaga de cambios en una sola recarga
+                time.sleep(0.2)
+                conn.poll()
+                tablas = {n.payload for n in conn.notifies}
+                conn.notifies.clear()
+                print(f"🔄 Catálogo modificado ({', '.join(sorted(tablas))})")
+                recargar_catalogo()
+        except Exception as e:
+            # También un error al recargar: el hilo no debe morir sin avisar
+            print(f"⚠️ Escucha del catálogo caída, reintento en {espera}s:", e)
+            if conn is not None and not conn.closed:
+                try:
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+            time.sleep(espera)
+            espera = min(espera * 2, 60)
+
+
+def iniciar_escucha():
+    global _escucha
+    if _escucha is not None:
+        return
+    with _escucha_lock:
+        if _escucha is None:
+            _escucha = threading.Thread(
+                target=_escuchar, name="catalogo-listen", daemon=True
+            )
+            _escucha.start()
@@ -1,21 +1,13 @@
-import os
 from chromadb import PersistentClient
-from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
+from embeddings import abrir_coleccion
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
 # === 1. Inicializar cliente de ChromaDB con función de embedding ===
-embed_fn = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=OPENAI_API_KEY, model_name="text-embedding-3-small"
-)
-
+# El backend (openai, onnx, sentence-transformers, hash) sale de EMBEDDING_BACKEND
 chroma_client = PersistentClient(path="chroma_db")
-collection = chroma_client.get_or_create_collection(
-    name="productos_marketing", embedding_function=embed_fn
-)
+collection, _, _ = abrir_coleccion(chroma_client, "productos_marketing")
 
 
 # === 2. Función para consultar los productos más relevantes ===
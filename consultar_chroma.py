@@ -1,25 +1,16 @@
-import os
 from dotenv import load_dotenv
 import chromadb
-from chromadb.utils import embedding_functions
 from chromadb import PersistentClient
+from embeddings import abrir_coleccion
 
-# Cargar API key
+# Cargar configuración (API key, EMBEDDING_BACKEND)
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 # Conectar a ChromaDB local
 client = PersistentClient(path="chroma_db")
 
-# Usar función de embedding con OpenAI
-embed_fn = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=OPENAI_API_KEY, model_name="text-embedding-3-small"
-)
-
-# Cargar colección
-collection = client.get_or_create_collection(
-    name="productos_marketing", embedding_function=embed_fn
-)
+# Cargar colección con el backend de embedding configurado
+collection, _, _ = abrir_coleccion(client, "productos_marketing")
 
 # Consultar en bucle
 print("🔍 Escribe tu consulta sobre los productos (o escribe 'salir'):")
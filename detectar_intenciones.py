@@ -2,12 +2,11 @@ import os
 from flask import json
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from openai import OpenAI
 from datetime import datetime
 from dotenv import load_dotenv
+from llm import ErrorLLM, llm
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 
@@ -26,9 +25,9 @@ def obtener_chats_del_dia():
         FROM Chat c
         JOIN Mensaje m ON m.chat_id = c.id
         JOIN Cliente cl ON c.cliente_id = cl.id
-        WHERE m.fecha_envio::date = %s;
+        WHERE m.fecha_envio >= %s::date AND m.fecha_envio < %s::date + 1;
     """,
-        (hoy,),
+        (hoy, hoy),
     )
     resultados = cur.fetchall()
     conn.close()
@@ -44,10 +43,10 @@ def reconstruir_historial(chat_id):
         """
         SELECT emisor, contenido
         FROM Mensaje
-        WHERE chat_id = %s AND fecha_envio::date = %s
+        WHERE chat_id = %s AND fecha_envio >= %s::date AND fecha_envio < %s::date + 1
         ORDER BY fecha_envio ASC;
     """,
-        (chat_id, hoy),
+        (chat_id, hoy, hoy),
     )
     mensajes = cur.fetchall()
     conn.close()
@@ -82,7 +81,7 @@ def registrar_interes_si_no_existe(chat_id, producto_id, observacion=""):
         """
         SELECT id FROM InteresProductoChat
         WHERE chat_id = %s AND producto_id = %s
-        AND fecha_registro::date = CURRENT_DATE;
+        AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
         """,
         (chat_id, producto_id),
     )
@@ -114,10 +113,10 @@ def detectar_intenciones(historial):
 
     historial.append(prompt_final)
 
-    respuesta = client.chat.completions.create(
-        model="gpt-3.5-turbo", messages=historial, temperature=0.2
+    # Proceso por lotes: más plazo que en el webhook
+    return llm.completar(
+        model="gpt-3.5-turbo", messages=historial, temperature=0.2, plazo=60
     )
-    return respuesta.choices[0].message.content.strip()
 
     # def guardar_intereses(chat_id, data):
     try:
@@ -140,9 +139,10 @@ def detectar_intenciones(historial):
             cur.execute(
                 """
                 SELECT id FROM InteresProductoChat
-                WHERE chat_id = %s AND producto_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND producto_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, p["id"], hoy),
+                (chat_id, p["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -163,9 +163,10 @@ def detectar_intenciones(historial):
             cur.execute(
                 """
                 SELECT id FROM InteresCategoriaChat
-                WHERE chat_id = %s AND categoria_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND categoria_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, c["id"], hoy),
+                (chat_id, c["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -186,9 +187,10 @@ def detectar_intenciones(historial):
             cur.execute(
                 """
                 SELECT id FROM InteresPromocionChat
-                WHERE chat_id = %s AND promocion_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND promocion_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, pr["id"], hoy),
+                (chat_id, pr["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -224,9 +226,10 @@ def guardar_intereses(chat_id, data):
             cur.execute(
                 """
                 SELECT id FROM InteresProductoChat
-                WHERE chat_id = %s AND producto_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND producto_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, p["id"], hoy),
+                (chat_id, p["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -247,9 +250,10 @@ def guardar_intereses(chat_id, data):
             cur.execute(
                 """
                 SELECT id FROM InteresCategoriaChat
-                WHERE chat_id = %s AND categoria_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND categoria_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, c["id"], hoy),
+                (chat_id, c["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -270,9 +274,10 @@ def guardar_intereses(chat_id, data):
             cur.execute(
                 """
                 SELECT id FROM InteresPromocionChat
-                WHERE chat_id = %s AND promocion_id = %s AND fecha_registro::date = %s;
+                WHERE chat_id = %s AND promocion_id = %s
+                  AND fecha_registro >= %s::date AND fecha_registro < %s::date + 1;
             """,
-                (chat_id, pr["id"], hoy),
+                (chat_id, pr["id"], hoy, hoy),
             )
             if not cur.fetchone():
                 cur.execute(
@@ -294,7 +299,11 @@ def main():
     for chat in chats:
         print(f"📊 INTENCIONES CHAT {chat['chat_id']} ({chat['telefono']}):")
         historial = reconstruir_historial(chat["chat_id"])
-        respuesta = detectar_intenciones(historial)
+        try:
+            respuesta = detectar_intenciones(historial)
+        except ErrorLLM as e:
+            print(f"⚠️ Se omite el chat {chat['chat_id']}, OpenAI no respondió:", e)
+            continue
         print(respuesta)
         guardar_intereses(chat["chat_id"], respuesta)
 
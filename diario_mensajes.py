@@ -0,0 +1,335 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso escribe en la carpeta del diario
+    fcntl = None
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Tiempo máximo que un mensaje espera en memoria antes de escribirse
+MENSAJES_FLUSH_SEGUNDOS = float(os.getenv("MENSAJES_FLUSH_SEGUNDOS", 0.5))
+# Al llegar a este número de mensajes pendientes se escribe sin esperar
+MENSAJES_LOTE = int(os.getenv("MENSAJES_LOTE", 200))
+# Con más pendientes que esto, guardar() espera a que se vacíe la cola
+MENSAJES_MAX_PENDIENTES = int(os.getenv("MENSAJES_MAX_PENDIENTES", 10_000))
+# Segundos que guardar() espera por lugar antes de fallar
+MENSAJES_ESPERA_MAX = float(os.getenv("MENSAJES_ESPERA_MAX", 5))
+# Carpeta del diario en disco (un archivo por segmento y por proceso)
+MENSAJES_DIARIO_RUTA = os.getenv("MENSAJES_DIARIO_RUTA", "mensajes_diario")
+# Con MENSAJES_DIARIO_FSYNC=1 cada mensaje llega al disco antes de seguir
+# (sobrevive a un corte de luz, no solo a la caída del proceso)
+MENSAJES_DIARIO_FSYNC = os.getenv("MENSAJES_DIARIO_FSYNC", "0") == "1"
+
+EntradaMensaje = namedtuple("EntradaMensaje", "chat_id emisor tipo contenido ts")
+
+
+class DiarioMensajes:
+    """Escritura diferida de la tabla Mensaje (write-behind).
+
+    ``guardar`` anota el mensaje en un archivo del diario y en memoria, y
+    vuelve; un hilo en segundo plano lo inserta por lotes cada ``intervalo``
+    segundos (o antes, al juntar ``lote``). ``fecha_envio`` se calcula en la
+    base como NOW() menos la antigüedad del mensaje, así el orden del chat no
+    depende de cuándo se escribió el lote.
+
+    El diario se parte en segmentos: al tomar un lote se cierra el segmento
+    en curso y, cuando el lote se confirma, se borran los segmentos cerrados.
+    Si el proceso muere, el próximo que arranque (con el mismo directorio)
+    recupera los segmentos cuyo dueño ya no tiene su archivo ``.lock``. Un
+    lote que se confirmó justo antes de la caída puede insertarse dos veces:
+    se prefiere duplicar a perder.
+    """
+
+    def __init__(
+        self,
+        ruta=MENSAJES_DIARIO_RUTA,
+        intervalo=MENSAJES_FLUSH_SEGUNDOS,
+        lote=MENSAJES_LOTE,
+        max_pendientes=MENSAJES_MAX_PENDIENTES,
+        espera_max=MENSAJES_ESPERA_MAX,
+        fsync=MENSAJES_DIARIO_FSYNC,
+    ):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.lote = lote
+        self.max_pendientes = max_pendientes
+        self.espera_max = espera_max
+        self.fsync = fsync
+        self._pendientes = []
+        self._en_vuelo = []
+        self._cond = threading.Condition()
+        self._escritura = threading.Lock()
+        # Los commits del lote y las lecturas de Mensaje no se cruzan
+        self._visibilidad = threading.Lock()
+        self._despertar = threading.Event()
+        self._id = None
+        self._bloqueo = None
+        self._segmento = None
+        self._numero = 0
+        self._cerrados = []
+        self._detenido = False
+        self._hilo = None
+        self.escritos = 0
+        self.lotes = 0
+        self.esperas = 0
+        self.recuperados = 0
+
+    # === DIARIO EN DISCO ===
+    def _abrir(self):
+        # Llamar con _cond tomado
+        if self._id is not None:
+            return
+        os.makedirs(self.ruta, exist_ok=True)
+        self._id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if fcntl is not None:
+            self._bloqueo = open(os.path.join(self.ruta, f"{self._id}.lock"), "w")
+            fcntl.flock(self._bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._recuperar()
+        self._hilo = threading.Thread(
+            target=self._bucle, name="diario-mensajes", daemon=True
+        )
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def _recuperar(self):
+        """Adopta los segmentos de procesos que terminaron sin vaciarlos."""
+        duenos = set()
+        for archivo in glob.glob(os.path.join(self.ruta, "*-*.*")):
+            nombre = os.path.basename(archivo)
+            if nombre.endswith(".lock"):
+                duenos.add(nombre[: -len(".lock")])
+            elif nombre.endswith(".jsonl"):
+                duenos.add(nombre.rsplit("-", 1)[0])
+        duenos.discard(self._id)
+        for dueno in sorted(duenos):
+            ruta_bloqueo = os.path.join(self.ruta, f"{dueno}.lock")
+            bloqueo = None
+            if fcntl is not None and os.path.exists(ruta_bloqueo):
+                bloqueo = open(ruta_bloqueo, "a")
+                try:
+                    fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    bloqueo.close()  # el dueño sigue vivo
+                    continue
+            patron = os.path.join(self.ruta, f"{dueno}-*.jsonl")
+            segmentos = sorted(glob.glob(patron))
+            entradas = []
+            for segmento in segmentos:
+                with open(segmento, encoding="utf-8") as archivo:
+                    for linea in archivo:
+                        try:
+                            entradas.append(EntradaMensaje(*json.loads(linea)))
+                        except (ValueError, TypeError):
+                            pass  # última línea a medio escribir
+            # Primero quedan en nuestro diario; recién entonces se borran
+            self._anotar(entradas)
+            self._pendientes.extend(entradas)
+            self.recuperados += len(entradas)
+            for segmento in segmentos:
+                os.remove(segmento)
+            if bloqueo is not None:
+                os.remove(ruta_bloqueo)
+                bloqueo.close()
+            if entradas:
+                print(f"♻️ Diario de mensajes: {len(entradas)} de {dueno}")
+
+    def _anotar(self, entradas):
+        # Llamar con _cond tomado
+        if not entradas:
+            return
+        if self._segmento is None:
+            self._numero += 1
+            self._segmento = open(
+                os.path.join(self.ruta, f"{self._id}-{self._numero:08d}.jsonl"),
+                "a",
+                encoding="utf-8",
+            )
+        for entrada in entradas:
+            self._segmento.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        self._segmento.flush()
+        if self.fsync:
+            os.fsync(self._segmento.fileno())
+
+    def _cerrar_segmento(self):
+        # Llamar con _cond tomado
+        if self._segmento is not None:
+            self._cerrados.append(self._segmento.name)
+            self._segmento.close()
+            self._segmento = None
+
+    # === ESCRITURA ===
+    def _en_cola(self):
+        return len(self._pendientes) + len(self._en_vuelo)
+
+    def guardar(self, chat_id, contenido, emisor="cliente", tipo="texto"):
+        entrada = EntradaMensaje(chat_id, emisor, tipo, contenido, time.time())
+        with self._cond:
+            if self._detenido:
+                raise RuntimeError("El diario de mensajes está detenido")
+            self._abrir()
+            if self._en_cola() >= self.max_pendientes:
+                # Contrapresión: la base no da abasto, se frena al que escribe
+                self.esperas += 1
+                self._despertar.set()
+                if not self._cond.wait_for(
+                    lambda: self._en_cola() < self.max_pendientes,
+                    self.espera_max,
+                ):
+                    raise RuntimeError(
+                        f"Cola de mensajes llena ({self.max_pendientes}) "
+                        f"tras {self.espera_max}s"
+                    )
+            self._anotar([entrada])
+            self._pendientes.append(entrada)
+            lleno = len(self._pendientes) >= self.lote
+        if lleno:
+            self._despertar.set()
+
+    def vaciar(self):
+        """Inserta todo lo pendiente; devuelve cuántos mensajes se enviaron."""
+        from psycopg2.extras import execute_values
+
+        from bd import cursor_bd
+
+        with self._escritura:
+            with self._cond:
+                if not self._pendientes:
+                    return 0
+                self._cerrar_segmento()
+                borrar = list(self._cerrados)
+                lote, self._pendientes = self._pendientes, []
+                self._en_vuelo = lote
+            try:
+                with cursor_bd() as cur:
+                    ahora = time.time()
+                    # Antigüedad de cada mensaje: la base le resta su propio reloj
+                    filas = [
+                        (e.chat_id, e.emisor, e.tipo, e.contenido, max(ahora - e.ts, 0))
+                        for e in lote
+                    ]
+                    with self._visibilidad:
+                        execute_values(
+                            cur,
+                            """
+                            INSERT INTO Mensaje
+                                (chat_id, emisor, tipo, contenido, fecha_envio)
+                            VALUES %s;
+                            """,
+                            filas,
+                            template=(
+                                "(%s, %s, %s, %s, "
+                                "LOCALTIMESTAMP - %s * INTERVAL '1 second')"
+                            ),
+                            page_size=self.lote,
+                        )
+                        cur.connection.commit()
+                        with self._cond:
+                            self._en_vuelo = []
+                            self._cond.notify_all()
+            except Exception:
+                # Se reintenta en el próximo ciclo; los segmentos quedan
+                with self._cond:
+                    self._pendientes[:0] = lote
+                    self._en_vuelo = []
+                raise
+            with self._cond:
+                for segmento in borrar:
+                    self._cerrados.remove(segmento)
+                    try:
+                        os.remove(segmento)
+                    except FileNotFoundError:
+                        pass
+            self.escritos += len(lote)
+            self.lotes += 1
+            return len(lote)
+
+    def _bucle(self):
+        while not self._detenido:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                print("⚠️ No se pudieron guardar los mensajes:", e)
+
+    def detener(self):
+        with self._cond:
+            self._detenido = True
+        self._despertar.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=self.intervalo + 5)
+        try:
+            self.vaciar()
+        except Exception as e:
+            print("❌ Mensajes sin guardar al cerrar (quedan en el diario):", e)
+            return
+        with self._cond:
+            # Todo quedó escrito: el archivo .lock ya no protege nada
+            if self._bloqueo is not None and not self._cerrados:
+                os.remove(self._bloqueo.name)
+                self._bloqueo.close()
+                self._bloqueo = None
+
+    # === LECTURA ===
+    @contextmanager
+    def lectura(self):
+        """Lee Mensaje sin que un lote se confirme a la mitad.
+
+        Dentro del bloque, lo que no está en la tabla está en ``pendientes``.
+        Tomar la conexión antes que este bloqueo (como hace el hilo del
+        diario), para no cruzar esperas con el pool.
+        """
+        with self._visibilidad:
+            yield
+
+    def pendientes(self, chat_id):
+        """Mensajes de ``chat_id`` aún sin escribir, del más viejo al más nuevo."""
+        with self._cond:
+            en_memoria = self._en_vuelo + self._pendientes
+        return [e for e in en_memoria if e.chat_id == chat_id]
+
+    def ultimo(self, chat_id, emisor):
+        for entrada in reversed(self.pendientes(chat_id)):
+            if entrada.emisor == emisor:
+                return entrada
+        return None
+
+    def saludo_pendiente(self, chat_id):
+        """Si el último mensaje del sistema aún no está escrito: ¿saludó hoy?
+
+        None si no hay ninguno en memoria (lo dice la tabla Mensaje).
+        """
+        entrada = self.ultimo(chat_id, "sistema")
+        if entrada is None:
+            return None
+        return (
+            date.fromtimestamp(entrada.ts) == date.today()
+            and "hola" in entrada.contenido.lower()
+        )
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "pendientes": self._en_cola(),
+                "escritos": self.escritos,
+                "lotes": self.lotes,
+                "esperas": self.esperas,
+                "recuperados": self.recuperados,
+                "segmentos": len(self._cerrados) + (self._segmento is not None),
+            }
+
+
+diario = DiarioMensajes()
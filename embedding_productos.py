@@ -1,56 +1,43 @@
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import chromadb
 from chromadb.config import Settings
-from chromadb.utils import embedding_functions
 from chromadb import PersistentClient
+from catalogo import cargar_catalogo
+from embeddings import abrir_coleccion
 
 # Carga las variables de entorno
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-# === 1. Conectar a la base de datos ===
-def conectar_bd():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-
-
-# === 2. Obtener todos los productos con datos relevantes ===
+# === 1. Obtener todos los productos desde el snapshot del catálogo ===
 def obtener_productos():
-    conn = conectar_bd()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT 
-            p.id,
-            p.nombre,
-            COALESCE(p.descripcion, '') AS descripcion,
-            p.stock,
-            c.nombre AS categoria,
-            pp.monto AS precio,
-            ARRAY(
-                SELECT pr.nombre || ' (' || pr.porcentaje_descuento || '% hasta ' || pr.fecha_fin || ')'
-                FROM ProductoPromocion pprom
-                JOIN Promocion pr ON pr.id = pprom.promocion_id
-                WHERE pprom.producto_id = p.id
-            ) AS promociones
-        FROM Producto p
-        JOIN Categoria c ON p.categoria_id = c.id
-        LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id AND pp.lista_precio_id = 1
-    """
-    )
-
-    productos = cur.fetchall()
-    conn.close()
+    catalogo = cargar_catalogo()
+    productos = []
+    for p in catalogo.productos.values():
+        if p.categoria is None:
+            continue
+        promociones = [catalogo.promociones[pid] for pid in p.promociones]
+        productos.append(
+            {
+                "id": p.id,
+                "nombre": p.nombre,
+                "descripcion": p.descripcion,
+                "stock": p.stock,
+                "categoria": p.categoria,
+                "precio": p.precio,
+                "promociones": [
+                    f"{pr.nombre} ({pr.porcentaje_descuento}% hasta {pr.fecha_fin})"
+                    for pr in promociones
+                ],
+            }
+        )
     return productos
 
 
-# === 3. Preparar los textos para embedding ===
+# === 2. Preparar los textos para embedding ===
 def preparar_documentos(productos):
     documentos = []
     metadatos = []
@@ -71,30 +58,29 @@ def preparar_documentos(productos):
 
         documentos.append(texto)
         ids.append(f"producto_{p['id']}")
-        metadatos.append(
-            {
-                "categoria": p["categoria"],
-                "precio": str(p["precio"]),
-                "stock": p["stock"],
-            }
-        )
+        metadato = {
+            "producto_id": p["id"],
+            "categoria": p["categoria"],
+            "stock": p["stock"],
+        }
+        # Numérico para poder filtrar por rango con where en Chroma
+        if p["precio"] is not None:
+            metadato["precio"] = float(p["precio"])
+        metadatos.append(metadato)
 
     return documentos, ids, metadatos
 
 
-# === 4. Guardar en ChromaDB ===
+# === 3. Guardar en ChromaDB ===
 def guardar_en_chroma(documents, ids, metadatas):
     client = PersistentClient(path="chroma_db")  # <- esta es la nueva forma correcta
 
-    embed_fn = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=os.getenv("OPENAI_API_KEY"), model_name="text-embedding-3-small"
-    )
-
-    collection = client.get_or_create_collection(
-        name="productos_marketing", embedding_function=embed_fn
-    )
+    # Backend según EMBEDDING_BACKEND; los documentos se embeben por lotes
+    collection, _, modelo = abrir_coleccion(client, "productos_marketing")
+    print(f"🧮 Embeddings con {modelo}")
 
-    collection.add(documents=documents, ids=ids, metadatas=metadatas)
+    # upsert para que reindexar actualice precio, stock y promociones
+    collection.upsert(documents=documents, ids=ids, metadatas=metadatas)
 
     print("✅ Guardado en ChromaDB con persistencia local (chroma_db/)")
 
@@ -0,0 +1,127 @@
+import hashlib
+import math
+import os
+import re
+import unicodedata
+
+from chromadb.api.types import EmbeddingFunction
+from chromadb.utils import embedding_functions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# openai | onnx | sentence-transformers | hash
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+OPENAI_EMBEDDING_MODELO = os.getenv("OPENAI_EMBEDDING_MODELO", "text-embedding-3-small")
+# Carpeta local de un modelo sentence-transformers (sin descargar nada)
+EMBEDDING_MODELO_RUTA = os.getenv("EMBEDDING_MODELO_RUTA", "modelos/all-MiniLM-L6-v2")
+EMBEDDING_LOTE = int(os.getenv("EMBEDDING_LOTE", 64))
+EMBEDDING_HASH_DIMENSIONES = int(os.getenv("EMBEDDING_HASH_DIMENSIONES", 256))
+
+BACKENDS = ("openai", "onnx", "sentence-transformers", "hash")
+
+
+class EmbeddingHash(EmbeddingFunction):
+    """Embedding determinista por hashing de palabras y trigramas.
+
+    No necesita red ni modelo; sirve para pruebas y benchmarks offline y da
+    una similitud léxica razonable (tolera tildes y errores de una letra).
+    """
+
+    def __init__(self, dimensiones=EMBEDDING_HASH_DIMENSIONES):
+        self.dimensiones = dimensiones
+
+    def _rasgos(self, texto):
+        texto = unicodedata.normalize("NFKD", texto.lower())
+        texto = "".join(c for c in texto if not unicodedata.combining(c))
+        palabras = re.findall(r"[0-9a-zñ]+", texto)
+        for palabra in palabras:
+            yield "p:" + palabra, 1.0
+            marcada = f"#{palabra}#"
+            for i in range(len(marcada) - 2):
+                yield "t:" + marcada[i : i + 3], 0.5
+
+    def _vector(self, texto):
+        vector = [0.0] * self.dimensiones
+        for rasgo, peso in self._rasgos(texto):
+            h = hashlib.blake2b(rasgo.encode(), digest_size=8).digest()
+            indice = int.from_bytes(h[:4], "little") % self.dimensiones
+            signo = 1.0 if h[4] & 1 else -1.0
+            vector[indice] += signo * peso
+        norma = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norma for v in vector]
+
+    def __call__(self, input):
+        return [self._vector(texto) for texto in input]
+
+
+class EmbeddingPorLotes(EmbeddingFunction):
+    """Envuelve otra función de embedding y la llama por lotes de ``lote``."""
+
+    def __init__(self, funcion, lote=EMBEDDING_LOTE):
+        self.funcion = funcion
+        self.lote = lote
+
+    def __call__(self, input):
+        vectores = []
+        for i in range(0, len(input), self.lote):
+            vectores.extend(self.funcion(input[i : i + self.lote]))
+        return vectores
+
+
+def backend_de(coleccion):
+    """Backend de una colección: EMBEDDING_BACKEND_<COLECCION> o el global."""
+    variable = "EMBEDDING_BACKEND_" + re.sub(r"\W", "_", coleccion).upper()
+    return os.getenv(variable, EMBEDDING_BACKEND)
+
+
+def modelo_embedding(backend):
+    if backend == "openai":
+        return OPENAI_EMBEDDING_MODELO
+    if backend == "onnx":
+        return "all-MiniLM-L6-v2-onnx"
+    if backend == "sentence-transformers":
+        return "st:" + os.path.basename(EMBEDDING_MODELO_RUTA.rstrip("/"))
+    if backend == "hash":
+        return f"hash-{EMBEDDING_HASH_DIMENSIONES}"
+    raise ValueError(f"Backend de embedding desconocido: {backend}")
+
+
+def crear_funcion_embedding(backend=EMBEDDING_BACKEND):
+    if backend == "openai":
+        funcion = embedding_functions.OpenAIEmbeddingFunction(
+            api_key=os.getenv("OPENAI_API_KEY"), model_name=OPENAI_EMBEDDING_MODELO
+        )
+    elif backend == "onnx":
+        # MiniLM-L6-v2 en ONNX Runtime, solo CPU; el modelo queda en disco
+        funcion = embedding_functions.ONNXMiniLM_L6_V2(
+            preferred_providers=["CPUExecutionProvider"]
+        )
+    elif backend == "sentence-transformers":
+        funcion = embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=EMBEDDING_MODELO_RUTA, device="cpu"
+        )
+    elif backend == "hash":
+        return EmbeddingHash()
+    else:
+        raise ValueError(f"Backend de embedding desconocido: {backend}")
+    return EmbeddingPorLotes(funcion)
+
+
+def nombre_coleccion(base, backend):
+    # Cada backend tiene otra dimensión, así que vive en su propia colección;
+    # la de OpenAI conserva el nombre original para reutilizar chroma_db/
+    return base if backend == "openai" else f"{base}_{backend.replace('-', '_')}"
+
+
+def abrir_coleccion(cliente, base="productos_marketing", backend=None):
+    """Devuelve ``(coleccion, funcion_embedding, modelo)`` para ``base``."""
+    backend = backend or backend_de(base)
+    funcion = crear_funcion_embedding(backend)
+    coleccion = cliente.get_or_create_collection(
+        name=nombre_coleccion(base, backend),
+        embedding_function=funcion,
+        metadata={"embedding_backend": backend},
+    )
+    return coleccion, funcion, modelo_embedding(backend)
@@ -84,37 +84,43 @@ def actualizar_estado_envio(chat_id, tipo):
         "PRODUCTOS": {
             "update": """
                 UPDATE InteresProductoChat SET estado = 'enviado'
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
             "insert": """
                 INSERT INTO EnvioInteresProductoChat (interes_producto_chat_id, medio, observacion)
                 SELECT id, 'email', 'Enviado automáticamente por script'
                 FROM InteresProductoChat
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
         },
         "CATEGORIAS": {
             "update": """
                 UPDATE InteresCategoriaChat SET estado = 'enviado'
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
             "insert": """
                 INSERT INTO EnvioInteresCategoriaChat (interes_categoria_chat_id, medio, observacion)
                 SELECT id, 'email', 'Enviado automáticamente por script'
                 FROM InteresCategoriaChat
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
         },
         "PROMOS": {
             "update": """
                 UPDATE InteresPromocionChat SET estado = 'enviado'
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
             "insert": """
                 INSERT INTO EnvioInteresPromocionChat (interes_promocion_chat_id, medio, observacion)
                 SELECT id, 'email', 'Enviado automáticamente por script'
                 FROM InteresPromocionChat
-                WHERE chat_id = %s AND fecha_registro::date = CURRENT_DATE;
+                WHERE chat_id = %s
+                  AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
             """,
         },
     }
@@ -141,9 +147,9 @@ def actualizar_estado_envio(chat_id, tipo):
 
 def ya_se_envio(chat_id, tipo):
     query_map = {
-        "PRODUCTOS": "SELECT 1 FROM EnvioInteresProductoChat ep JOIN InteresProductoChat ip ON ep.interes_producto_chat_id = ip.id WHERE ip.chat_id = %s AND ip.fecha_registro::date = CURRENT_DATE;",
-        "CATEGORIAS": "SELECT 1 FROM EnvioInteresCategoriaChat ec JOIN InteresCategoriaChat ic ON ec.interes_categoria_chat_id = ic.id WHERE ic.chat_id = %s AND ic.fecha_registro::date = CURRENT_DATE;",
-        "PROMOS": "SELECT 1 FROM EnvioInteresPromocionChat ep JOIN InteresPromocionChat ip ON ep.interes_promocion_chat_id = ip.id WHERE ip.chat_id = %s AND ip.fecha_registro::date = CURRENT_DATE;",
+        "PRODUCTOS": "SELECT 1 FROM EnvioInteresProductoChat ep JOIN InteresProductoChat ip ON ep.interes_producto_chat_id = ip.id WHERE ip.chat_id = %s AND ip.fecha_registro >= CURRENT_DATE AND ip.fecha_registro < CURRENT_DATE + 1;",
+        "CATEGORIAS": "SELECT 1 FROM EnvioInteresCategoriaChat ec JOIN InteresCategoriaChat ic ON ec.interes_categoria_chat_id = ic.id WHERE ic.chat_id = %s AND ic.fecha_registro >= CURRENT_DATE AND ic.fecha_registro < CURRENT_DATE + 1;",
+        "PROMOS": "SELECT 1 FROM EnvioInteresPromocionChat ep JOIN InteresPromocionChat ip ON ep.interes_promocion_chat_id = ip.id WHERE ip.chat_id = %s AND ip.fecha_registro >= CURRENT_DATE AND ip.fecha_registro < CURRENT_DATE + 1;",
     }
 
     if tipo not in query_map:
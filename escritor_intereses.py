@@ -0,0 +1,137 @@
+import atexit
+import os
+import threading
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tiempo máximo que una fila espera en memoria antes de escribirse
+INTERESES_FLUSH_SEGUNDOS = float(os.getenv("INTERESES_FLUSH_SEGUNDOS", 2))
+# Al llegar a este número de filas pendientes se escribe sin esperar
+INTERESES_LOTE = int(os.getenv("INTERESES_LOTE", 500))
+# Tope de filas retenidas si la base de datos no responde
+INTERESES_MAX_PENDIENTES = int(os.getenv("INTERESES_MAX_PENDIENTES", 50_000))
+
+
+class EscritorIntereses:
+    """Acumula filas de InteresProductoChat y las escribe por lotes.
+
+    Descarta en memoria los repetidos de (chat_id, producto_id, día) y escribe
+    con un único INSERT multi-fila, que además omite los que ya existen en la
+    tabla para ese día. Un hilo en segundo plano vacía el buffer cada
+    ``intervalo`` segundos y al terminar el proceso.
+    """
+
+    def __init__(
+        self,
+        intervalo=INTERESES_FLUSH_SEGUNDOS,
+        lote=INTERESES_LOTE,
+        max_pendientes=INTERESES_MAX_PENDIENTES,
+    ):
+        self.intervalo = intervalo
+        self.lote = lote
+        self.max_pendientes = max_pendientes
+        self._pendientes = []
+        self._vistos = set()
+        self._dia = date.today()
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        self._despertar = threading.Event()
+        self._detenido = False
+        self._hilo = None
+        self.escritas = 0
+        self.descartadas = 0
+
+    def _iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._bucle, name="escritor-intereses", daemon=True
+            )
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def registrar(self, chat_id, producto_id, observacion=None):
+        hoy = date.today()
+        with self._lock:
+            if self._detenido:
+                raise RuntimeError("El escritor de intereses está detenido")
+            if hoy != self._dia:
+                self._vistos.clear()
+                self._dia = hoy
+            clave = (chat_id, producto_id)
+            if clave in self._vistos:
+                return False
+            if len(self._pendientes) >= self.max_pendientes:
+                self.descartadas += 1
+                return False
+            self._vistos.add(clave)
+            self._pendientes.append((chat_id, producto_id, observacion))
+            lleno = len(self._pendientes) >= self.lote
+            self._iniciar()
+        if lleno:
+            self._despertar.set()
+        return True
+
+    def vaciar(self):
+        """Escribe todo lo pendiente; devuelve cuántas filas se enviaron."""
+        from psycopg2.extras import execute_values
+
+        from bd import cursor_bd
+
+        with self._escritura:
+            with self._lock:
+                filas, self._pendientes = self._pendientes, []
+            if not filas:
+                return 0
+            try:
+                with cursor_bd(commit=True) as cur:
+                    execute_values(
+                        cur,
+                        """
+                        INSERT INTO InteresProductoChat (chat_id, producto_id, observacion)
+                        SELECT v.chat_id, v.producto_id, v.observacion
+                        FROM (VALUES %s) AS v (chat_id, producto_id, observacion)
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM InteresProductoChat i
+                            WHERE i.chat_id = v.chat_id
+                              AND i.producto_id = v.producto_id
+                              AND i.fecha_registro >= CURRENT_DATE
+                              AND i.fecha_registro < CURRENT_DATE + 1
+                        );
+                        """,
+                        filas,
+                        template="(%s::integer, %s::integer, %s::text)",
+                        page_size=self.lote,
+                    )
+            except Exception:
+                # Se reintenta en el próximo ciclo
+                with self._lock:
+                    self._pendientes[:0] = filas
+                raise
+            self.escritas += len(filas)
+            return len(filas)
+
+    def _bucle(self):
+        while not self._detenido:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                print("⚠️ No se pudieron guardar los intereses:", e)
+
+    def detener(self):
+        with self._lock:
+            self._detenido = True
+        self._despertar.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=self.intervalo + 5)
+        try:
+            self.vaciar()
+        except Exception as e:
+            print("❌ Intereses sin guardar al cerrar:", e)
+
+
+intereses = EscritorIntereses()
@@ -9,6 +9,8 @@ from dotenv import load_dotenv
 from pathlib import Path
 from weasyprint import HTML
 
+from catalogo import resumen_promociones
+
 # Configuración
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -71,9 +73,11 @@ def obtener_intereses_del_dia():
         LEFT JOIN ProductoPromocion pprom ON pprom.producto_id = p.id
         LEFT JOIN Promocion prom ON prom.id = pprom.promocion_id
              AND CURRENT_DATE BETWEEN prom.fecha_inicio AND prom.fecha_fin
-        WHERE ipc.fecha_registro::date = %s AND ipc.estado = 'pendiente';
+        WHERE ipc.fecha_registro >= %s::date
+          AND ipc.fecha_registro < %s::date + 1
+          AND ipc.estado = 'pendiente';
     """,
-        (hoy,),
+        (hoy, hoy),
     )
     productos = cur.fetchall()
     for p in productos:
@@ -89,34 +93,38 @@ def obtener_intereses_del_dia():
         JOIN Chat c ON icc.chat_id = c.id
         JOIN Cliente cl ON c.cliente_id = cl.id
         JOIN Categoria cat ON cat.id = icc.categoria_id
-        WHERE icc.fecha_registro::date = %s AND icc.estado = 'pendiente';
+        WHERE icc.fecha_registro >= %s::date
+          AND icc.fecha_registro < %s::date + 1
+          AND icc.estado = 'pendiente';
     """,
-        (hoy,),
+        (hoy, hoy),
     )
     categorias = cur.fetchall()
 
+    # Productos de todas las categorías en una sola consulta
+    cur.execute(
+        """
+        SELECT p.categoria_id, p.id AS producto_id, p.nombre AS producto_nombre, p.descripcion AS producto_descripcion,
+               ip.url AS imagen_url,
+               pp.monto AS producto_precio,
+               prom.nombre AS promocion_nombre, prom.fecha_fin AS promocion_fecha_fin
+        FROM Producto p
+        LEFT JOIN ImagenProducto ip ON ip.producto_id = p.id
+        LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id
+             AND CURRENT_DATE BETWEEN pp.fecha_inicio AND COALESCE(pp.fecha_fin, CURRENT_DATE)
+        LEFT JOIN ProductoPromocion pprom ON pprom.producto_id = p.id
+        LEFT JOIN Promocion prom ON prom.id = pprom.promocion_id
+             AND CURRENT_DATE BETWEEN prom.fecha_inicio AND prom.fecha_fin
+        WHERE p.categoria_id = ANY(%s)
+    """,
+        (list({cat["categoria_id"] for cat in categorias}),),
+    )
+    por_categoria = {}
+    for p in cur.fetchall():
+        p["imagen_url"] = limpiar_url_cloudinary(p["imagen_url"])
+        por_categoria.setdefault(p.pop("categoria_id"), []).append(p)
     for cat in categorias:
-        cur.execute(
-            """
-            SELECT p.id AS producto_id, p.nombre AS producto_nombre, p.descripcion AS producto_descripcion,
-                   ip.url AS imagen_url,
-                   pp.monto AS producto_precio,
-                   prom.nombre AS promocion_nombre, prom.fecha_fin AS promocion_fecha_fin
-            FROM Producto p
-            LEFT JOIN ImagenProducto ip ON ip.producto_id = p.id
-            LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id 
-                 AND CURRENT_DATE BETWEEN pp.fecha_inicio AND COALESCE(pp.fecha_fin, CURRENT_DATE)
-            LEFT JOIN ProductoPromocion pprom ON pprom.producto_id = p.id
-            LEFT JOIN Promocion prom ON prom.id = pprom.promocion_id 
-                 AND CURRENT_DATE BETWEEN prom.fecha_inicio AND prom.fecha_fin
-            WHERE p.categoria_id = %s
-        """,
-            (cat["categoria_id"],),
-        )
-        productos_categoria = cur.fetchall()
-        for p in productos_categoria:
-            p["imagen_url"] = limpiar_url_cloudinary(p["imagen_url"])
-        cat["productos"] = productos_categoria
+        cat["productos"] = por_categoria.get(cat["categoria_id"], [])
 
     # === Promociones de interés ===
     cur.execute(
@@ -129,28 +137,21 @@ def obtener_intereses_del_dia():
         JOIN Chat c ON ipc.chat_id = c.id
         JOIN Cliente cl ON c.cliente_id = cl.id
         JOIN Promocion prom ON prom.id = ipc.promocion_id
-        WHERE ipc.fecha_registro::date = %s AND ipc.estado = 'pendiente';
+        WHERE ipc.fecha_registro >= %s::date
+          AND ipc.fecha_registro < %s::date + 1
+          AND ipc.estado = 'pendiente';
     """,
-        (hoy,),
+        (hoy, hoy),
     )
     promociones = cur.fetchall()
 
+    # Productos de cada promoción con el mismo resumen que usa el webhook
+    resumen = resumen_promociones(
+        cur, {promo["promocion_id"] for promo in promociones}
+    )
+    productos_por_promo = {r["id"]: r["productos"] for r in resumen}
     for promo in promociones:
-        cur.execute(
-            """
-            SELECT p.id AS producto_id, p.nombre AS producto_nombre, p.descripcion AS producto_descripcion,
-                   ip.url AS imagen_url,
-                   pp.monto AS producto_precio
-            FROM ProductoPromocion pprom
-            JOIN Producto p ON p.id = pprom.producto_id
-            LEFT JOIN ImagenProducto ip ON ip.producto_id = p.id
-            LEFT JOIN PrecioProducto pp ON pp.producto_id = p.id 
-                 AND CURRENT_DATE BETWEEN pp.fecha_inicio AND COALESCE(pp.fecha_fin, CURRENT_DATE)
-            WHERE pprom.promocion_id = %s
-        """,
-            (promo["promocion_id"],),
-        )
-        productos_promo = cur.fetchall()
+        productos_promo = productos_por_promo.get(promo["promocion_id"], [])
         for p in productos_promo:
             p["imagen_url"] = limpiar_url_cloudinary(p["imagen_url"])
         promo["productos"] = productos_promo
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Cuánto se recuerda en memoria la respuesta de un MessageSid ya atendido
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", 600))
+IDEMPOTENCIA_MAX = int(os.getenv("IDEMPOTENCIA_MAX", 10_000))
+# Segundos que un reintento espera a la respuesta que se está calculando
+# (por debajo del timeout de 15 s de Twilio); pasado ese tiempo la respuesta
+# se envía por la API REST (requiere TWILIO_ACCOUNT_SID y TWILIO_AUTH_TOKEN)
+IDEMPOTENCIA_ESPERA = float(os.getenv("IDEMPOTENCIA_ESPERA", 12))
+# Un reclamo sin respuesta más viejo que esto es de un proceso que murió:
+# el siguiente reintento lo toma y recalcula
+IDEMPOTENCIA_RECLAMO_VENCE = int(os.getenv("IDEMPOTENCIA_RECLAMO_VENCE", 60))
+# Cada cuánto se consulta la base mientras otro proceso calcula la respuesta
+IDEMPOTENCIA_SONDEO = 0.2
+
+
+class _Entrada:
+    __slots__ = ("listo", "respuesta", "fallo", "expira", "abandonada")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta = None
+        self.fallo = False
+        self.expira = None
+        # Un reintento se cansó de esperar: nadie recibirá la respuesta por HTTP
+        self.abandonada = False
+
+
+class MensajesProcesados:
+    """Atiende cada MessageSid de Twilio una sola vez.
+
+    Twilio reintenta el POST si la respuesta tarda; el reintento no debe
+    volver a guardar el mensaje ni llamar otra vez al LLM. En memoria se
+    guarda la respuesta de cada MessageSid (con TTL) y los reintentos
+    concurrentes esperan al cálculo en curso; entre procesos, la tabla
+    MensajeProcesado (clave primaria message_sid) hace de reclamo y guarda la
+    respuesta. Si el cálculo falla se libera el reclamo para que el próximo
+    reintento lo intente de nuevo.
+
+    Si un reintento deja de esperar antes de que termine el cálculo, la
+    petición original ya venció en Twilio y nadie recibiría la respuesta:
+    el reintento marca el cálculo como abandonado y quien lo termina la
+    envía con ``entregar`` (la API REST de mensajes).
+    """
+
+    def __init__(
+        self,
+        ttl=IDEMPOTENCIA_TTL,
+        max_entradas=IDEMPOTENCIA_MAX,
+        espera=IDEMPOTENCIA_ESPERA,
+        vence=IDEMPOTENCIA_RECLAMO_VENCE,
+    ):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.espera = espera
+        self.vence = vence
+        self._datos = OrderedDict()  # message_sid -> _Entrada
+        self._lock = threading.Lock()
+        self.nuevos = 0
+        self.repetidos = 0
+        self.coalescidos = 0
+        self.sin_respuesta = 0
+        self.entregados = 0
+
+    def procesar(self, message_sid, calcular, entregar=None):
+        """Respuesta de ``calcular()`` para ``message_sid``, calculada una vez.
+
+        Devuelve None si otro cálculo del mismo mensaje sigue en curso tras
+        ``espera`` segundos; ese cálculo la enviará con su ``entregar``. Sin
+        ``message_sid`` simplemente llama a ``calcular``.
+        """
+        if not message_sid:
+            return calcular()
+
+        with self._lock:
+            entrada = self._datos.get(message_sid)
+            if entrada is not None and entrada.expira is not None:
+                if entrada.expira < time.monotonic():
+                    del self._datos[message_sid]
+                    entrada = None
+            propia = entrada is None
+            if propia:
+                entrada = self._datos[message_sid] = _Entrada()
+                while len(self._datos) > self.max_entradas:
+                    self._datos.popitem(last=False)
+        if not propia:
+            return self._esperar(entrada, message_sid, calcular, entregar)
+
+        respuesta = None
+        abandonada = False
+        contador = "nuevos"
+        try:
+            reclamado, respuesta = self._reclamar(message_sid)
+            if reclamado:
+                respuesta = calcular()
+                abandonada = self._completar(message_sid, respuesta)
+            else:
+                contador = "repetidos" if respuesta is not None else "sin_respuesta"
+        except Exception:
+            # Solo falla calcular(): se suelta el reclamo para el próximo reintento
+            entrada.fallo = True
+            self._liberar(message_sid)
+            raise
+        finally:
+            with self._lock:
+                entrada.respuesta = respuesta
+                entrada.expira = time.monotonic() + self.ttl
+                # Sin respuesta no se recuerda: el próximo reintento vuelve a probar
+                if entrada.fallo or respuesta is None:
+                    if self._datos.get(message_sid) is entrada:
+                        del self._datos[message_sid]
+                if not entrada.fallo:
+                    setattr(self, contador, getattr(self, contador) + 1)
+                # Con el lock: un reintento no puede abandonar después de esto
+                abandonada = abandonada or entrada.abandonada
+                entrada.listo.set()
+        if abandonada and respuesta and entregar is not None:
+            self._entregar(entregar, respuesta)
+        return respuesta
+
+    def _esperar(self, entrada, message_sid, calcular, entregar):
+        with self._lock:
+            if entrada.listo.is_set():
+                self.repetidos += 1
+            else:
+                self.coalescidos += 1
+        entrada.listo.wait(self.espera)
+        with self._lock:
+            listo = entrada.listo.is_set()
+            if not (listo and entrada.fallo):
+                if not listo:
+                    entrada.abandonada = True
+                if entrada.respuesta is None:
+                    self.sin_respuesta += 1
+                return entrada.respuesta
+        # El cálculo original falló y ya soltó su entrada: este reintento
+        # lo vuelve a intentar (o espera al reintento que lo tomó primero)
+        return self.procesar(message_sid, calcular, entregar)
+
+    def _entregar(self, entregar, respuesta):
+        try:
+            entregar(respuesta)
+            with self._lock:
+                self.entregados += 1
+        except Exception as e:
+            print("❌ No se pudo entregar la respuesta abandonada:", e)
+
+    # === RECLAMO EN LA BASE ===
+    def _reclamar(self, message_sid):
+        """``(True, None)`` si este proceso calcula; si no, ``(False, respuesta)``.
+
+        Si la base no responde se calcula igual: la memoria ya evita los
+        duplicados dentro del proceso.
+        """
+        from bd import cursor_bd
+
+        limite = time.monotonic() + self.espera
+        while True:
+            try:
+                with cursor_bd(commit=True) as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO MensajeProcesado (message_sid) VALUES (%s)
+                        ON CONFLICT (message_sid) DO UPDATE
+                            SET creado_en = NOW()
+                            WHERE MensajeProcesado.respuesta IS NULL
+                              AND MensajeProcesado.creado_en
+                                  < NOW() - %s * INTERVAL '1 second'
+                        RETURNING message_sid;
+                        """,
+                        (message_sid, self.vence),
+                    )
+                    if cur.fetchone():
+                        return True, None
+                    cur.execute(
+                        "SELECT respuesta FROM MensajeProcesado "
+                        "WHERE message_sid = %s;",
+                        (message_sid,),
+                    )
+                    fila = cur.fetchone()
+            except Exception as e:
+                print("⚠️ Sin reclamo de idempotencia en la base:", e)
+                return True, None
+            if fila is None:
+                continue  # se liberó entre las dos consultas
+            if fila["respuesta"] is not None:
+                return False, fila["respuesta"]
+            if time.monotonic() >= limite:
+                return False, self._abandonar(message_sid)
+            time.sleep(IDEMPOTENCIA_SONDEO)
+
+    def _abandonar(self, message_sid):
+        """Pide al otro proceso que envíe él la respuesta.
+
+        Devuelve la respuesta si terminó justo antes de marcarla.
+        """
+        from bd import cursor_bd
+
+        try:
+            with cursor_bd(commit=True) as cur:
+                cur.execute(
+                    """
+                    UPDATE MensajeProcesado SET abandonado = TRUE
+                    WHERE message_sid = %s AND respuesta IS NULL
+                    RETURNING message_sid;
+                    """,
+                    (message_sid,),
+                )
+                if cur.fetchone():
+                    return None
+                cur.execute(
+                    "SELECT respuesta FROM MensajeProcesado "
+                    "WHERE message_sid = %s;",
+                    (message_sid,),
+                )
+                fila = cur.fetchone()
+        except Exception as e:
+            print("⚠️ No se pudo marcar la respuesta como abandonada:", e)
+            return None
+        return fila["respuesta"] if fila else None
+
+    def _completar(self, message_sid, respuesta):
+        """Guarda la respuesta; True si un reintento de otro proceso la abandonó."""
+        from bd import cursor_bd
+
+        try:
+            with cursor_bd(commit=True) as cur:
+                cur.execute(
+                    """
+                    UPDATE MensajeProcesado
+                    SET respuesta = %s, respondido_en = NOW()
+                    WHERE message_sid = %s
+                    RETURNING abandonado;
+                    """,
+                    (respuesta, message_sid),
+                )
+                fila = cur.fetchone()
+        except Exception as e:
+            print("⚠️ No se pudo guardar la respuesta idempotente:", e)
+            return False
+        return bool(fila and fila["abandonado"])
+
+    def _liberar(self, message_sid):
+        from bd import cursor_bd
+
+        try:
+            with cursor_bd(commit=True) as cur:
+                cur.execute(
+                    "DELETE FROM MensajeProcesado "
+                    "WHERE message_sid = %s AND respuesta IS NULL;",
+                    (message_sid,),
+                )
+        except Exception as e:
+            print("⚠️ No se pudo liberar el reclamo de idempotencia:", e)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "nuevos": self.nuevos,
+                "repetidos": self.repetidos,
+                "coalescidos": self.coalescidos,
+                "sin_respuesta": self.sin_respuesta,
+                "entregados": self.entregados,
+            }
+
+
+procesados = MensajesProcesados()
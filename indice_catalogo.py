@@ -0,0 +1,230 @@
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+from catalogo import obtener_catalogo
+
+Mencion = namedtuple("Mencion", "tipo id nombre inicio fin exacta")
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-zñ]+")
+
+# Palabras de uso común (ya normalizadas) que nunca se corrigen hacia el
+# catálogo: "rojas" no es un error de tipeo de "hojas". Si una de ellas es
+# parte de un nombre del catálogo, igual coincide de forma exacta.
+PALABRAS_COMUNES = frozenset(
+    """
+    rojo roja rojos rojas verde verdes negro negra negros negras blanco blanca
+    blancos blancas azules amarillo amarilla morado morada rosado rosada gris
+    grises celeste celestes dorado dorada plateado plateada marron
+    grande grandes chico chica chicos chicas pequeño pequeña pequeños pequeñas
+    mediano mediana largo larga largos largas nuevo nueva nuevos nuevas
+    bonito bonita bueno buena buenos buenas mejor mejores barato barata
+    hola gracias favor tardes noches quiero quisiera queria necesito tengo
+    tienes tiene tienen puedo puede pueden podria hacer tener saber comprar
+    pedir llevar mandar enviar traer busco buscaba estan estas estos estoy
+    donde cuando cuanto cuanta cuantos cuantas ahora todos todas todavia
+    tambien mucho mucha muchos muchas otros otras otro otra algun alguna
+    algunos algunas ningun ninguna cosas precio precios cuesta cuestan
+    valen stock disponible disponibles quedan existencias promo promos
+    promocion promociones oferta ofertas descuento descuentos categoria
+    categorias productos producto catalogo muestrame mostrar unidades
+    """.split()
+)
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes (conserva la ñ) y solo letras/números."""
+    texto = texto.lower().replace("ñ", "\0")
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace("\0", "ñ")
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+
+def tokenizar(texto):
+    return normalizar(texto).split()
+
+
+def _distancia_maxima(token):
+    if len(token) >= 9:
+        return 2
+    if len(token) >= 5:
+        return 1
+    return 0
+
+
+def _borrados(token, distancia):
+    resultado = {token}
+    frontera = {token}
+    for _ in range(distancia):
+        siguiente = set()
+        for t in frontera:
+            for i in range(len(t)):
+                siguiente.add(t[:i] + t[i + 1 :])
+        resultado |= siguiente
+        frontera = siguiente
+    return resultado
+
+
+def distancia_edicion(a, b, limite):
+    """Damerau-Levenshtein (transposición adyacente) con corte temprano."""
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            costo = 0 if ca == cb else 1
+            actual[j] = min(
+                anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + costo
+            )
+            if (
+                anterior2 is not None
+                and i > 1
+                and j > 1
+                and ca == b[j - 2]
+                and a[i - 2] == cb
+            ):
+                actual[j] = min(actual[j], anterior2[j - 2] + 1)
+        if min(actual) > limite:
+            return limite + 1
+        anterior2, anterior = anterior, actual
+    return anterior[-1]
+
+
+class IndiceCatalogo:
+    """Índice en memoria de productos y categorías.
+
+    Las frases del catálogo se guardan en un trie de tokens normalizados, de
+    modo que todas las menciones de un mensaje se encuentran en una sola
+    pasada (la coincidencia más larga gana). Los tokens que no están en el
+    vocabulario se corrigen con un índice de borrados (estilo SymSpell), lo
+    que tolera tildes y errores de tipeo; las palabras de ``comunes`` no se
+    corrigen.
+
+    Recibe los productos y categorías del snapshot de catalogo.py.
+    """
+
+    def __init__(self, productos, categorias, version=0, comunes=PALABRAS_COMUNES):
+        productos = list(productos)
+        categorias = list(categorias)
+        self.version = version
+        self.comunes = comunes
+        self.productos = {p.id: p for p in productos}
+        self.categorias = {c.id: c for c in categorias}
+        self._trie = {}
+        self._vocabulario = set()
+        self._borrados = {}
+
+        for p in productos:
+            self._insertar(tokenizar(p.nombre), ("producto", p.id))
+        for c in categorias:
+            self._insertar(tokenizar(c.nombre), ("categoria", c.id))
+
+        for token in self._vocabulario:
+            for borrado in _borrados(token, _distancia_maxima(token)):
+                self._borrados.setdefault(borrado, set()).add(token)
+
+    def _insertar(self, tokens, destino):
+        if not tokens:
+            return
+        nodo = self._trie
+        for token in tokens:
+            self._vocabulario.add(token)
+            nodo = nodo.setdefault(token, {})
+        nodo.setdefault(None, []).append(destino)
+
+    def corregir(self, token):
+        """Devuelve los tokens del vocabulario a menor distancia de ``token``."""
+        if token in self._vocabulario:
+            # Singular/plural también cuentan ("cuaderno" -> "cuadernos")
+            variantes = [token + "s", token + "es", token[:-1], token[:-2]]
+            return [token] + [
+                v for v in variantes if v != token and v in self._vocabulario
+            ]
+        limite = _distancia_maxima(token)
+        if not limite or token in self.comunes:
+            return []
+        candidatos = set()
+        for borrado in _borrados(token, limite):
+            candidatos |= self._borrados.get(borrado, set())
+        mejores, mejor = [], limite + 1
+        for candidato in sorted(candidatos):
+            d = distancia_edicion(token, candidato, limite)
+            if d < mejor:
+                mejores, mejor = [candidato], d
+            elif d == mejor:
+                mejores.append(candidato)
+        return mejores
+
+    def _mas_largo(self, opciones, inicio):
+        # Recorre el trie admitiendo cualquier corrección por posición
+        mejor = None
+        pendientes = [(self._trie, inicio, True)]
+        while pendientes:
+            nodo, i, exacta = pendientes.pop()
+            if None in nodo and i > inicio:
+                if (
+                    mejor is None
+                    or i > mejor[0]
+                    or (i == mejor[0] and exacta and not mejor[2])
+                ):
+                    mejor = (i, nodo[None], exacta)
+            if i == len(opciones):
+                continue
+            for token, es_exacto in opciones[i]:
+                hijo = nodo.get(token)
+                if hijo is not None:
+                    pendientes.append((hijo, i + 1, exacta and es_exacto))
+        return mejor
+
+    def buscar_menciones(self, texto):
+        """Todas las menciones de productos y categorías en ``texto``."""
+        tokens = tokenizar(texto)
+        opciones = []
+        for token in tokens:
+            correcciones = self.corregir(token)
+            opciones.append([(c, c == token) for c in correcciones])
+
+        menciones = []
+        i = 0
+        while i < len(tokens):
+            encontrado = self._mas_largo(opciones, i)
+            if encontrado is None:
+                i += 1
+                continue
+            fin, destinos, exacta = encontrado
+            for tipo, id_ in destinos:
+                fuente = self.productos if tipo == "producto" else self.categorias
+                menciones.append(
+                    Mencion(tipo, id_, fuente[id_].nombre, i, fin, exacta)
+                )
+            i = fin
+        return menciones
+
+    def productos_de_categoria(self, categoria_id):
+        categoria = self.categorias[categoria_id]
+        return [self.productos[pid] for pid in categoria.productos]
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def obtener_indice():
+    """Índice del snapshot vigente; se reconstruye cuando el catálogo cambia."""
+    global _indice
+    catalogo = obtener_catalogo()
+    indice = _indice
+    if indice is None or indice.version != catalogo.version:
+        with _indice_lock:
+            if _indice is None or _indice.version != catalogo.version:
+                _indice = IndiceCatalogo(
+                    catalogo.productos.values(),
+                    catalogo.categorias.values(),
+                    version=catalogo.version,
+                )
+            indice = _indice
+    return indice
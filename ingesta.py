@@ -0,0 +1,25 @@
+from bd import cursor_bd
+from diario_mensajes import diario
+
+
+def ingresar_mensaje_cliente(telefono, contenido, tipo="texto"):
+    """Registra un mensaje entrante en un solo viaje a la base de datos.
+
+    Resuelve (o crea) el Cliente y su Chat abierto, guarda el Mensaje y
+    devuelve ``(chat_id, nombre_cliente, ya_saludo_hoy)``. Requiere la
+    función ``ingresar_mensaje_cliente`` de migraciones.py.
+    """
+    with cursor_bd(commit=True) as cur:
+        cur.execute(
+            """
+            SELECT r_chat_id AS chat_id, r_nombre AS nombre, r_ya_saludo AS ya_saludo
+            FROM ingresar_mensaje_cliente(%s, %s, %s);
+            """,
+            (telefono, contenido, tipo),
+        )
+        fila = cur.fetchone()
+    # El último saludo puede seguir en el diario, sin llegar aún a Mensaje
+    ya_saludo = diario.saludo_pendiente(fila["chat_id"])
+    if ya_saludo is None:
+        ya_saludo = fila["ya_saludo"]
+    return fila["chat_id"], fila["nombre"], ya_saludo
@@ -0,0 +1,262 @@
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter, namedtuple
+
+from dotenv import load_dotenv
+
+from indice_catalogo import normalizar, obtener_indice
+
+load_dotenv()
+
+INTENCIONES_MODELO = os.getenv("INTENCIONES_MODELO", "modelo_intenciones.json")
+# Similitud mínima para aceptar lo que diga el clasificador
+INTENCIONES_UMBRAL = float(os.getenv("INTENCIONES_UMBRAL", 0.35))
+
+# tipo: producto | categoria | categorias | promociones | productos | None
+# pregunta: precio | stock | promocion | None; fuente: reglas | clasificador
+Intencion = namedtuple(
+    "Intencion", "tipo categoria_id productos pregunta confianza fuente"
+)
+SIN_INTENCION = Intencion(None, None, (), None, 0.0, None)
+
+# === SEÑALES ===
+# Se evalúan todas en una sola pasada sobre el texto normalizado (sin tildes)
+SENALES = {
+    "promociones": r"promos?|promocion(?:es)?|ofertas?|descuentos?",
+    "categorias": r"categorias?|secciones?|rubros?",
+    "productos": r"que\s+(?:productos|tienen|hay|venden)|catalogo",
+    "listar": r"productos|tienen|hay|venden|muestra(?:me)?|ver",
+    "precio": r"precios?|cuanto|cuesta[n]?|vale[n]?|costo",
+    "stock": r"stock|disponibles?|quedan?|existencias?",
+}
+_SENALES = re.compile(
+    "|".join(rf"\b(?P<{nombre}>{patron})\b" for nombre, patron in SENALES.items())
+)
+# Solo estas intenciones no necesitan slots, así que son las que aprende
+# el clasificador
+INTENCIONES_CLASIFICADOR = ("productos", "categorias", "promociones")
+
+
+def senales(texto):
+    return {m.lastgroup for m in _SENALES.finditer(texto)}
+
+
+def _rasgos(texto):
+    # Palabras más su prefijo de 5 letras (tolera plurales y conjugaciones)
+    rasgos = []
+    for token in normalizar(texto).split():
+        rasgos.append(token)
+        if len(token) > 5:
+            rasgos.append(token[:5] + "~")
+    return rasgos
+
+
+class ClasificadorIntenciones:
+    """TF-IDF + un centroide normalizado por intención (modelo lineal).
+
+    Se entrena con ejemplos ``(texto, intencion)``; ``"otro"`` es la clase
+    para mensajes que no son preguntas generales. No usa dependencias fuera
+    de la librería estándar y se guarda como JSON.
+    """
+
+    def __init__(self, idf, centroides):
+        self.idf = idf
+        self.centroides = centroides
+
+    @staticmethod
+    def _vector(texto, idf):
+        conteo = Counter(r for r in _rasgos(texto) if r in idf)
+        vector = {r: (1 + math.log(n)) * idf[r] for r, n in conteo.items()}
+        norma = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {r: v / norma for r, v in vector.items()}
+
+    @classmethod
+    def entrenar(cls, ejemplos):
+        ejemplos = [(t, i or "otro") for t, i in ejemplos if t and t.strip()]
+        documentos = Counter()
+        for texto, _ in ejemplos:
+            documentos.update(set(_rasgos(texto)))
+        n = len(ejemplos)
+        idf = {r: math.log((1 + n) / (1 + df)) + 1 for r, df in documentos.items()}
+
+        sumas = {}
+        for texto, intencion in ejemplos:
+            suma = sumas.setdefault(intencion, Counter())
+            suma.update(cls._vector(texto, idf))
+        centroides = {}
+        for intencion, suma in sumas.items():
+            norma = math.sqrt(sum(v * v for v in suma.values())) or 1.0
+            centroides[intencion] = {r: v / norma for r, v in suma.items()}
+        return cls(idf, centroides)
+
+    def predecir(self, texto):
+        """Devuelve ``(intencion, similitud)``; la intención puede ser "otro"."""
+        vector = self._vector(texto, self.idf)
+        mejor, similitud = "otro", 0.0
+        for intencion, centroide in self.centroides.items():
+            s = sum(v * centroide.get(r, 0.0) for r, v in vector.items())
+            if s > similitud:
+                mejor, similitud = intencion, s
+        return mejor, similitud
+
+    def guardar(self, ruta=INTENCIONES_MODELO):
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump({"idf": self.idf, "centroides": self.centroides}, f)
+
+    @classmethod
+    def cargar(cls, ruta=INTENCIONES_MODELO):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        return cls(datos["idf"], datos["centroides"])
+
+
+class EnrutadorIntenciones:
+    """Decide la intención de un mensaje y extrae sus slots en una pasada.
+
+    Las señales salen de un único patrón precompilado y los slots (categoría,
+    productos) de las menciones del índice del catálogo. Lo que las reglas no
+    resuelven lo decide el clasificador, si hay uno y está seguro.
+    """
+
+    def __init__(self, clasificador=None, indice=None, umbral=INTENCIONES_UMBRAL):
+        self.clasificador = clasificador
+        self.umbral = umbral
+        self._indice_fijo = indice
+
+    def _indice(self):
+        return self._indice_fijo or obtener_indice()
+
+    def reglas(self, texto, indice=None):
+        indice = indice or self._indice()
+        menciones = indice.buscar_menciones(texto)
+        encontradas = senales(normalizar(texto))
+
+        if "precio" in encontradas:
+            pregunta = "precio"
+        elif "stock" in encontradas:
+            pregunta = "stock"
+        elif "promociones" in encontradas:
+            pregunta = "promocion"
+        else:
+            pregunta = None
+
+        productos = tuple(
+            dict.fromkeys(m.id for m in menciones if m.tipo == "producto")
+        )
+        categoria = next((m for m in menciones if m.tipo == "categoria"), None)
+        categoria_id = categoria.id if categoria is not None else None
+
+        if productos:
+            tipo = "producto"
+        elif "promociones" in encontradas:
+            tipo = "promociones"
+        elif categoria is not None and (
+            encontradas & {"listar", "productos"}
+            # Una categoría sola ("cuadernos?") también es pedir su lista
+            or categoria.fin - categoria.inicio == len(normalizar(texto).split())
+        ):
+            tipo = "categoria"
+        elif "categorias" in encontradas:
+            tipo = "categorias"
+        elif "productos" in encontradas:
+            tipo = "productos"
+        else:
+            # Sin intención, pero la categoría mencionada sigue sirviendo de filtro
+            return SIN_INTENCION._replace(
+                categoria_id=categoria_id, pregunta=pregunta
+            )
+        return Intencion(tipo, categoria_id, productos, pregunta, 1.0, "reglas")
+
+    def enrutar(self, texto, indice=None):
+        """``indice`` fija el IndiceCatalogo con el que se leerán los slots."""
+        intencion = self.reglas(texto, indice)
+        if intencion.tipo is not None or self.clasificador is None:
+            return intencion
+        tipo, similitud = self.clasificador.predecir(texto)
+        if tipo in INTENCIONES_CLASIFICADOR and similitud >= self.umbral:
+            return intencion._replace(
+                tipo=tipo, confianza=similitud, fuente="clasificador"
+            )
+        return intencion
+
+
+def cargar_enrutador(ruta=INTENCIONES_MODELO):
+    clasificador = None
+    if ruta and os.path.exists(ruta):
+        try:
+            clasificador = ClasificadorIntenciones.cargar(ruta)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ No se pudo cargar el clasificador ({ruta}):", e)
+    return EnrutadorIntenciones(clasificador)
+
+
+enrutador = cargar_enrutador()
+
+
+def detectar_intencion(texto, indice=None):
+    return enrutador.enrutar(texto, indice)
+
+
+# === ENTRENAMIENTO ===
+def ejemplos_desde_historial(limite=20000):
+    """Mensajes de clientes etiquetados con las reglas (supervisión débil).
+
+    Los que las reglas no reconocen quedan como "otro"; las intenciones con
+    slots no se usan porque el clasificador no puede extraerlos.
+    """
+    from bd import cursor_bd
+
+    with cursor_bd() as cur:
+        cur.execute(
+            """
+            SELECT contenido FROM Mensaje
+            WHERE emisor = 'cliente' AND tipo = 'texto'
+            ORDER BY id DESC LIMIT %s;
+            """,
+            (limite,),
+        )
+        filas = cur.fetchall()
+
+    reglas = EnrutadorIntenciones()
+    ejemplos = []
+    for fila in filas:
+        tipo = reglas.reglas(fila["contenido"]).tipo
+        if tipo is None or tipo in INTENCIONES_CLASIFICADOR:
+            ejemplos.append((fila["contenido"], tipo or "otro"))
+    return ejemplos
+
+
+def leer_ejemplos_csv(ruta):
+    """Ejemplos etiquetados a mano: columnas ``texto,intencion``."""
+    import csv
+
+    with open(ruta, encoding="utf-8", newline="") as f:
+        return [
+            (fila["texto"], fila["intencion"] or "otro") for fila in csv.DictReader(f)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Entrena el clasificador de intenciones con el historial."
+    )
+    parser.add_argument("--limite", type=int, default=20000)
+    parser.add_argument("--csv", help="ejemplos etiquetados a mano (texto,intencion)")
+    parser.add_argument("--salida", default=INTENCIONES_MODELO)
+    args = parser.parse_args()
+
+    ejemplos = ejemplos_desde_historial(args.limite)
+    if args.csv:
+        ejemplos += leer_ejemplos_csv(args.csv)
+    clasificador = ClasificadorIntenciones.entrenar(ejemplos)
+    clasificador.guardar(args.salida)
+    conteo = Counter(i for _, i in ejemplos)
+    print(f"✅ Clasificador entrenado con {len(ejemplos)} mensajes: {dict(conteo)}")
+    print(f"💾 Guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
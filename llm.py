@@ -0,0 +1,341 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from metricas import llm_llamadas, llm_tokens
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Tiempo total de una llamada, reintentos incluidos
+LLM_PLAZO = float(os.getenv("LLM_PLAZO", 20))
+# Tope de cada intento individual
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 12))
+LLM_REINTENTOS = int(os.getenv("LLM_REINTENTOS", 2))
+LLM_ESPERA_BASE = float(os.getenv("LLM_ESPERA_BASE", 0.5))
+LLM_ESPERA_MAX = float(os.getenv("LLM_ESPERA_MAX", 4))
+# Hedging: si un intento tarda más que el p95 del modelo se lanza un segundo
+# intento igual y se usa el primero que responda (cuesta tokens de más)
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_TRAS = float(os.getenv("LLM_HEDGE_TRAS", 3))
+LLM_HEDGE_MUESTRAS = int(os.getenv("LLM_HEDGE_MUESTRAS", 20))
+LLM_HILOS = int(os.getenv("LLM_HILOS", 8))
+# Circuito: tras N fallos seguidos no se llama al proveedor durante un rato
+LLM_CIRCUITO_FALLOS = int(os.getenv("LLM_CIRCUITO_FALLOS", 5))
+LLM_CIRCUITO_ENFRIAMIENTO = float(os.getenv("LLM_CIRCUITO_ENFRIAMIENTO", 30))
+
+VENTANA_LATENCIAS = 200
+
+
+class ErrorLLM(Exception):
+    """No se obtuvo respuesta del LLM dentro del plazo."""
+
+
+class CircuitoAbierto(ErrorLLM):
+    """El circuito está abierto: ni se intentó la llamada."""
+
+
+def reintentable(error):
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    estado = getattr(error, "status_code", None)
+    return estado == 429 or (estado is not None and estado >= 500)
+
+
+def _reintentar_tras(error):
+    # Retry-After en segundos, si el proveedor lo manda
+    respuesta = getattr(error, "response", None)
+    valor = respuesta.headers.get("retry-after") if respuesta is not None else None
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+def _percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(q * len(valores)))] if valores else 0.0
+
+
+class Circuito:
+    """Cortacircuito simple: cerrado -> abierto -> semiabierto (una prueba)."""
+
+    def __init__(
+        self, fallos=LLM_CIRCUITO_FALLOS, enfriamiento=LLM_CIRCUITO_ENFRIAMIENTO
+    ):
+        self.fallos_max = fallos
+        self.enfriamiento = enfriamiento
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.probando = False
+        self.aperturas = 0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.fallos < self.fallos_max:
+                return True
+            if time.monotonic() < self.abierto_hasta or self.probando:
+                return False
+            # Semiabierto: deja pasar una sola llamada de prueba
+            self.probando = True
+            return True
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.probando = False
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            self.probando = False
+            if self.fallos >= self.fallos_max:
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+                self.aperturas += 1
+
+    @property
+    def estado(self):
+        if self.fallos < self.fallos_max:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self.abierto_hasta else "semiabierto"
+
+
+class _Contadores:
+    def __init__(self):
+        self.llamadas = 0
+        self.exitos = 0
+        self.fallidas = 0
+        self.rechazadas = 0
+        self.reintentos = 0
+        self.hedges = 0
+        self.hedges_ganados = 0
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+        self.latencias = deque(maxlen=VENTANA_LATENCIAS)
+
+
+class PasarelaLLM:
+    """Punto único de salida hacia el proveedor de chat completions.
+
+    Cada llamada tiene un plazo total; los intentos fallidos por 429, 5xx,
+    timeout o conexión se reintentan con espera exponencial con jitter
+    (respetando Retry-After), y opcionalmente se hace hedging. Si el plazo
+    se agota o el circuito está abierto se lanza ``ErrorLLM`` para que quien
+    llama responda con el catálogo. Lleva contadores por modelo.
+
+    El cliente respeta OPENAI_BASE_URL, así que se puede apuntar a un
+    servidor falso (ver benchmarks/openai_falso.py).
+    """
+
+    def __init__(
+        self,
+        cliente=None,
+        plazo=LLM_PLAZO,
+        timeout=LLM_TIMEOUT,
+        reintentos=LLM_REINTENTOS,
+        hedging=LLM_HEDGING,
+        hedge_tras=LLM_HEDGE_TRAS,
+        circuito=None,
+    ):
+        self._cliente = cliente
+        self.plazo = plazo
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.hedging = hedging
+        self.hedge_tras = hedge_tras
+        self.circuito = circuito or Circuito()
+        self._contadores = {}
+        self._lock = threading.Lock()
+        self._hilos = None
+
+    @property
+    def cliente(self):
+        # Se crea al primer uso: importar el módulo no exige OPENAI_API_KEY
+        if self._cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    # El SDK tarda en importarse: se carga al crear el cliente
+                    from openai import OpenAI
+
+                    # Los reintentos los decide la pasarela, no el SDK
+                    self._cliente = OpenAI(
+                        api_key=os.getenv("OPENAI_API_KEY"),
+                        max_retries=0,
+                        timeout=self.timeout,
+                    )
+        return self._cliente
+
+    def _de(self, modelo):
+        with self._lock:
+            return self._contadores.setdefault(modelo, _Contadores())
+
+    def _espera_hedge(self, c):
+        with self._lock:
+            latencias = list(c.latencias)
+        if len(latencias) < LLM_HEDGE_MUESTRAS:
+            return self.hedge_tras
+        return _percentil(latencias, 0.95)
+
+    def _llamar(self, model, messages, timeout, kwargs):
+        cliente = self.cliente.with_options(timeout=timeout)
+        return cliente.chat.completions.create(
+            model=model, messages=messages, **kwargs
+        )
+
+    def _con_hedging(self, c, model, messages, timeout, kwargs):
+        with self._lock:
+            if self._hilos is None:
+                self._hilos = ThreadPoolExecutor(
+                    max_workers=LLM_HILOS, thread_name_prefix="llm-hedge"
+                )
+        espera = min(self._espera_hedge(c), timeout)
+        primero = self._hilos.submit(self._llamar, model, messages, timeout, kwargs)
+        hechos, _ = wait([primero], timeout=espera)
+        if hechos:
+            return primero.result()
+
+        with self._lock:
+            c.hedges += 1
+        restante = max(0.0, timeout - espera)
+        segundo = self._hilos.submit(self._llamar, model, messages, restante, kwargs)
+        pendientes = {primero, segundo}
+        error = None
+        fin = time.monotonic() + restante
+        while pendientes:
+            hechos, pendientes = wait(
+                pendientes,
+                timeout=max(0.0, fin - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not hechos:
+                break
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if futuro is segundo:
+                        with self._lock:
+                            c.hedges_ganados += 1
+                    # El otro intento termina solo en su hilo y se descarta
+                    return futuro.result()
+                error = futuro.exception()
+        raise error or ErrorLLM(f"Sin respuesta de {model} en {timeout:.1f}s")
+
+    def completar(self, model, messages, plazo=None, **kwargs):
+        """Texto de la primera opción; lanza ``ErrorLLM`` si no hay respuesta."""
+        c = self._de(model)
+        with self._lock:
+            c.llamadas += 1
+        if not self.circuito.permitir():
+            with self._lock:
+                c.rechazadas += 1
+            llm_llamadas.observar(0.0, modelo=model, resultado="circuito")
+            raise CircuitoAbierto(f"Circuito abierto para {model}")
+
+        comienzo = time.monotonic()
+        limite = comienzo + (plazo or self.plazo)
+        intento = 0
+        while True:
+            restante = limite - time.monotonic()
+            timeout = min(self.timeout, restante)
+            inicio = time.monotonic()
+            try:
+                if timeout <= 0:
+                    raise ErrorLLM(f"Plazo agotado para {model}")
+                if self.hedging:
+                    respuesta = self._con_hedging(c, model, messages, timeout, kwargs)
+                else:
+                    respuesta = self._llamar(model, messages, timeout, kwargs)
+            except Exception as e:
+                espera = None
+                if intento < self.reintentos and reintentable(e):
+                    tope = min(LLM_ESPERA_MAX, LLM_ESPERA_BASE * 2**intento)
+                    espera = _reintentar_tras(e) or random.uniform(0, tope)
+                if espera is None or time.monotonic() + espera >= limite:
+                    if reintentable(e) or isinstance(e, ErrorLLM):
+                        self.circuito.fallo()
+                    else:
+                        # Un 4xx es culpa de la petición: el proveedor responde
+                        self.circuito.exito()
+                    with self._lock:
+                        c.fallidas += 1
+                    llm_llamadas.observar(
+                        time.monotonic() - comienzo, modelo=model, resultado="error"
+                    )
+                    if isinstance(e, ErrorLLM):
+                        raise
+                    raise ErrorLLM(f"{model}: {e}") from e
+                with self._lock:
+                    c.reintentos += 1
+                intento += 1
+                time.sleep(espera)
+                continue
+
+            self.circuito.exito()
+            uso = getattr(respuesta, "usage", None)
+            with self._lock:
+                c.exitos += 1
+                c.latencias.append(time.monotonic() - inicio)
+                if uso is not None:
+                    c.tokens_entrada += uso.prompt_tokens or 0
+                    c.tokens_salida += uso.completion_tokens or 0
+            llm_llamadas.observar(
+                time.monotonic() - comienzo, modelo=model, resultado="ok"
+            )
+            if uso is not None:
+                llm_tokens.inc(uso.prompt_tokens or 0, modelo=model, tipo="entrada")
+                llm_tokens.inc(uso.completion_tokens or 0, modelo=model, tipo="salida")
+            return (respuesta.choices[0].message.content or "").strip()
+
+    def estadisticas(self):
+        with self._lock:
+            modelos = {}
+            for modelo, c in self._contadores.items():
+                latencias = list(c.latencias)
+                modelos[modelo] = {
+                    "llamadas": c.llamadas,
+                    "exitos": c.exitos,
+                    "fallidas": c.fallidas,
+                    "rechazadas": c.rechazadas,
+                    "reintentos": c.reintentos,
+                    "hedges": c.hedges,
+                    "hedges_ganados": c.hedges_ganados,
+                    "tokens_entrada": c.tokens_entrada,
+                    "tokens_salida": c.tokens_salida,
+                    "latencia_p50": _percentil(latencias, 0.5),
+                    "latencia_p95": _percentil(latencias, 0.95),
+                    "latencia_p99": _percentil(latencias, 0.99),
+                }
+        return {"circuito": self.circuito.estado, "modelos": modelos}
+
+
+llm = PasarelaLLM()
+
+
+# === RESPALDO DETERMINISTA ===
+def respuesta_de_respaldo(pregunta):
+    """Respuesta armada solo con el catálogo, para cuando el LLM no responde."""
+    from catalogo import obtener_catalogo
+    from intenciones import detectar_intencion
+    from respuestas_directas import respuesta_directa
+
+    catalogo = obtener_catalogo()
+    intencion = detectar_intencion(pregunta)
+    if intencion.tipo is None and intencion.categoria_id is not None:
+        intencion = intencion._replace(tipo="categoria")
+    # Sin el modelo, cualquier intención reconocida es mejor que nada
+    texto = respuesta_directa(intencion, catalogo, umbral=0)
+    if texto is not None:
+        return texto
+    return (
+        "En este momento no puedo darte una respuesta detallada. "
+        "Estas son nuestras categorías:\n- "
+        + "\n- ".join(c.nombre for c in catalogo.categorias_ordenadas())
+        + "\n¿Sobre cuál te gustaría saber más?"
+    )
@@ -0,0 +1,284 @@
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Con METRICAS_LOG_JSON=1 cada etapa y cada petición se registran como una
+# línea JSON con el id de la petición (además de los print de siempre)
+METRICAS_LOG_JSON = os.getenv("METRICAS_LOG_JSON", "0") == "1"
+METRICAS_PREFIJO = "chatbot"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = (f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores))
+    return "{" + ",".join(pares) + "}"
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = f"{METRICAS_PREFIJO}_{nombre}"
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        return tuple(etiquetas.get(n, "") for n in self.etiquetas)
+
+    def exportar(self):
+        lineas = [
+            f"# HELP {self.nombre} {self.ayuda}",
+            f"# TYPE {self.nombre} {self.tipo}",
+        ]
+        with self._lock:
+            valores = sorted(self._valores.items())
+        for clave, valor in valores:
+            lineas.extend(self._lineas(clave, valor))
+        return lineas
+
+    def _lineas(self, clave, valor):
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # [conteos por bucket (sin acumular)..., +Inf, suma]
+                serie = self._valores[clave] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[bisect_left(self.buckets, valor)] += 1
+            serie[-1] += valor
+
+    def _lineas(self, clave, serie):
+        lineas = []
+        acumulado = 0
+        for limite, cuenta in zip(self.buckets + ("+Inf",), serie):
+            acumulado += cuenta
+            etiquetas = _etiquetas(self.etiquetas + ("le",), clave + (limite,))
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+        etiquetas = _etiquetas(self.etiquetas, clave)
+        lineas.append(f"{self.nombre}_sum{etiquetas} {serie[-1]}")
+        lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+# === MÉTRICAS DEL WEBHOOK ===
+peticiones = Histograma(
+    "peticion_segundos", "Duración total de cada petición", ("ruta", "resultado")
+)
+etapas = Histograma(
+    "etapa_segundos", "Duración de cada etapa del pipeline", ("ruta", "etapa")
+)
+consultas_bd = Histograma(
+    "consultas_bd_por_peticion",
+    "Consultas SQL ejecutadas en cada petición",
+    ("ruta",),
+    buckets=BUCKETS_CONSULTAS,
+)
+errores = Contador("errores_total", "Errores por etapa", ("ruta", "etapa"))
+llm_llamadas = Histograma(
+    "llm_segundos", "Duración de cada llamada al LLM", ("modelo", "resultado")
+)
+llm_tokens = Contador("llm_tokens_total", "Tokens del LLM", ("modelo", "tipo"))
+respuestas = Contador(
+    "respuestas_total",
+    "Respuestas enviadas por fuente (plantilla, llm, cache, respaldo, saludo)",
+    ("ruta", "fuente"),
+)
+
+_METRICAS = [
+    peticiones,
+    etapas,
+    consultas_bd,
+    errores,
+    llm_llamadas,
+    llm_tokens,
+    respuestas,
+]
+# (nombre, valor) -> (etiqueta, función que devuelve un dict de números)
+_recolectores = {}
+
+
+def recolectar(nombre, etiqueta, valor, funcion):
+    """Exporta en cada /metrics los campos numéricos de ``funcion()`` como
+    gauges ``<nombre>_<campo>{<etiqueta>="<valor>"}`` (p. ej. las
+    estadísticas de una caché)."""
+    _recolectores[(nombre, valor)] = (etiqueta, funcion)
+
+
+def _recolectados():
+    # Todas las muestras de un nombre van juntas y con un solo encabezado,
+    # aunque vengan de varios recolectores (p. ej. dos cachés)
+    familias = {}
+    for (nombre, valor), (etiqueta, funcion) in sorted(_recolectores.items()):
+        try:
+            datos = funcion()
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer las métricas de {valor}:", e)
+            continue
+        for campo, numero in sorted(datos.items()):
+            if isinstance(numero, bool) or not isinstance(numero, (int, float)):
+                continue
+            metrica = f"{METRICAS_PREFIJO}_{nombre}_{campo}"
+            familias.setdefault(metrica, (nombre, campo, []))[2].append(
+                f'{metrica}{{{etiqueta}="{_escapar(valor)}"}} {numero}'
+            )
+    lineas = []
+    for metrica, (nombre, campo, muestras) in sorted(familias.items()):
+        lineas.append(f"# HELP {metrica} Campo {campo} de {nombre}")
+        lineas.append(f"# TYPE {metrica} gauge")
+        lineas.extend(muestras)
+    return lineas
+
+
+def exportar():
+    """Texto en el formato de exposición de Prometheus."""
+    lineas = []
+    for metrica in _METRICAS:
+        lineas.extend(metrica.exportar())
+    lineas.extend(_recolectados())
+    return "\n".join(lineas) + "\n"
+
+
+# === PETICIONES Y ETAPAS ===
+class _Peticion:
+    __slots__ = ("id", "ruta", "inicio", "consultas", "resultado")
+
+    def __init__(self, id, ruta):
+        self.id = id
+        self.ruta = ruta
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.resultado = "ok"
+
+
+_peticion_actual = ContextVar("peticion_actual", default=None)
+
+
+def id_peticion():
+    peticion = _peticion_actual.get()
+    return peticion.id if peticion else None
+
+
+def registrar(evento, **campos):
+    """Línea de log JSON con el id de la petición, si METRICAS_LOG_JSON=1."""
+    if not METRICAS_LOG_JSON:
+        return
+    peticion = _peticion_actual.get()
+    print(
+        json.dumps(
+            {
+                "ts": round(time.time(), 3),
+                "evento": evento,
+                "request_id": peticion.id if peticion else None,
+                **campos,
+            },
+            ensure_ascii=False,
+            default=str,
+        ),
+        flush=True,
+    )
+
+
+@contextmanager
+def peticion(ruta, id=None):
+    """Mide una petición completa; ``id`` suele ser el MessageSid de Twilio."""
+    actual = _Peticion(id or uuid.uuid4().hex[:16], ruta)
+    token = _peticion_actual.set(actual)
+    try:
+        yield actual
+    except Exception:
+        actual.resultado = "error"
+        raise
+    finally:
+        duracion = time.perf_counter() - actual.inicio
+        peticiones.observar(duracion, ruta=ruta, resultado=actual.resultado)
+        consultas_bd.observar(actual.consultas, ruta=ruta)
+        registrar(
+            "peticion",
+            ruta=ruta,
+            resultado=actual.resultado,
+            ms=round(duracion * 1000, 1),
+            consultas_bd=actual.consultas,
+        )
+        _peticion_actual.reset(token)
+
+
+@contextmanager
+def etapa(nombre):
+    """Mide una etapa del pipeline dentro de la petición en curso."""
+    actual = _peticion_actual.get()
+    ruta = actual.ruta if actual else "-"
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        errores.inc(ruta=ruta, etapa=nombre)
+        registrar("error", etapa=nombre, error=str(e))
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        etapas.observar(duracion, ruta=ruta, etapa=nombre)
+        registrar("etapa", etapa=nombre, ms=round(duracion * 1000, 1))
+
+
+def contar_consulta():
+    actual = _peticion_actual.get()
+    if actual is not None:
+        actual.consultas += 1
+
+
+def fuente_respuesta(fuente):
+    """Cuenta de dónde salió la respuesta de la petición en curso."""
+    actual = _peticion_actual.get()
+    respuestas.inc(ruta=actual.ruta if actual else "-", fuente=fuente)
+    registrar("respuesta", fuente=fuente)
+
+
+def error(etapa_nombre, detalle=None, fallida=False):
+    """Cuenta un error que se manejó sin propagarse (p. ej. un respaldo).
+
+    Con ``fallida`` la petición en curso se registra con resultado "error".
+    """
+    actual = _peticion_actual.get()
+    if actual is not None and fallida:
+        actual.resultado = "error"
+    errores.inc(ruta=actual.ruta if actual else "-", etapa=etapa_nombre)
+    registrar("error", etapa=etapa_nombre, error=detalle)
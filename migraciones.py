@@ -0,0 +1,311 @@
+from bd import conectar_bd
+
+# === MIGRACIONES DE ESQUEMA ===
+# Se aplican en orden y una sola vez; el nombre queda en schema_migraciones.
+# Una migración es un texto SQL (se aplica en una transacción) o una lista de
+# sentencias que se ejecutan de a una en autocommit, para poder usar
+# CREATE INDEX CONCURRENTLY sobre tablas grandes sin bloquear escrituras.
+# Si un índice concurrente falla queda INVALID: borrarlo y volver a aplicar.
+# Ejecutar con: python migraciones.py
+MIGRACIONES = [
+    (
+        "0001_ingresar_mensaje_cliente",
+        """
+        CREATE OR REPLACE FUNCTION ingresar_mensaje_cliente(
+            p_telefono TEXT,
+            p_contenido TEXT,
+            p_tipo TEXT DEFAULT 'texto'
+        )
+        RETURNS TABLE (r_chat_id INTEGER, r_nombre TEXT, r_ya_saludo BOOLEAN)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_cliente_id INTEGER;
+        BEGIN
+            -- Serializa los mensajes simultáneos de un mismo número para que
+            -- un cliente nuevo no termine con dos Cliente o dos Chat abiertos.
+            PERFORM pg_advisory_xact_lock(hashtext('cliente:' || p_telefono));
+
+            SELECT c.id, cl.nombre INTO r_chat_id, r_nombre
+            FROM Chat c
+            JOIN Cliente cl ON c.cliente_id = cl.id
+            WHERE cl.telefono = p_telefono AND c.estado = 'abierto'
+            ORDER BY c.fecha_inicio DESC
+            LIMIT 1;
+
+            IF r_chat_id IS NULL THEN
+                SELECT cl.id, cl.nombre INTO v_cliente_id, r_nombre
+                FROM Cliente cl
+                WHERE cl.telefono = p_telefono
+                LIMIT 1;
+
+                IF v_cliente_id IS NULL THEN
+                    INSERT INTO Cliente (nombre, telefono)
+                    VALUES ('Invitado', p_telefono)
+                    RETURNING id INTO v_cliente_id;
+                    r_nombre := 'Invitado';
+                END IF;
+
+                INSERT INTO Chat (cliente_id) VALUES (v_cliente_id)
+                RETURNING id INTO r_chat_id;
+            END IF;
+
+            -- Ya saludó hoy si el último mensaje del sistema
+            -- es de hoy y contiene un saludo.
+            SELECT COALESCE(
+                m.fecha_envio::date = CURRENT_DATE
+                AND LOWER(m.contenido) LIKE '%hola%',
+                FALSE
+            ) INTO r_ya_saludo
+            FROM Mensaje m
+            WHERE m.chat_id = r_chat_id AND m.emisor = 'sistema'
+            ORDER BY m.fecha_envio DESC
+            LIMIT 1;
+            r_ya_saludo := COALESCE(r_ya_saludo, FALSE);
+
+            INSERT INTO Mensaje (chat_id, emisor, tipo, contenido)
+            VALUES (r_chat_id, 'cliente', p_tipo, p_contenido);
+
+            RETURN NEXT;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0002_tabla_sinonimo",
+        """
+        CREATE TABLE IF NOT EXISTS Sinonimo (
+            id SERIAL PRIMARY KEY,
+            termino TEXT NOT NULL UNIQUE,
+            reemplazo TEXT NOT NULL,
+            activo BOOLEAN NOT NULL DEFAULT TRUE
+        );
+        """,
+    ),
+    (
+        "0003_notificar_cambios_catalogo",
+        """
+        CREATE OR REPLACE FUNCTION notificar_cambio_catalogo()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('catalogo_cambios', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS catalogo_cambios ON Producto;
+        CREATE TRIGGER catalogo_cambios
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Producto
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+        DROP TRIGGER IF EXISTS catalogo_cambios ON Categoria;
+        CREATE TRIGGER catalogo_cambios
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Categoria
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+        DROP TRIGGER IF EXISTS catalogo_cambios ON PrecioProducto;
+        CREATE TRIGGER catalogo_cambios
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PrecioProducto
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+        DROP TRIGGER IF EXISTS catalogo_cambios ON Promocion;
+        CREATE TRIGGER catalogo_cambios
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Promocion
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+
+        DROP TRIGGER IF EXISTS catalogo_cambios ON ProductoPromocion;
+        CREATE TRIGGER catalogo_cambios
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON ProductoPromocion
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_cambio_catalogo();
+        """,
+    ),
+    (
+        "0004_tabla_sesion",
+        """
+        -- Estado de conversación compartido entre workers (sesiones.py).
+        -- UNLOGGED: no pasa por el WAL; tras una caída se reconstruye
+        CREATE UNLOGGED TABLE IF NOT EXISTS Sesion (
+            clave TEXT PRIMARY KEY,
+            datos JSONB NOT NULL,
+            actualizado TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_sesion_actualizado ON Sesion (actualizado);
+        """,
+    ),
+    (
+        "0005_tabla_carrito",
+        """
+        -- Un carrito por teléfono: items = {"producto_id": cantidad}
+        CREATE TABLE IF NOT EXISTS Carrito (
+            telefono TEXT PRIMARY KEY,
+            items JSONB NOT NULL DEFAULT '{}'::jsonb,
+            actualizado TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+
+        -- Aplica cambios compactados (ver carrito.py): primero fija las
+        -- cantidades de ``fijos``, luego suma ``sumas``; quita las <= 0
+        CREATE OR REPLACE FUNCTION carrito_aplicar(
+            items JSONB, sumas JSONB, fijos JSONB
+        )
+        RETURNS JSONB
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT COALESCE(
+                JSONB_OBJECT_AGG(clave, cantidad) FILTER (WHERE cantidad > 0),
+                '{}'::jsonb
+            )
+            FROM (
+                SELECT clave,
+                       COALESCE((fijos ->> clave)::int, (items ->> clave)::int, 0)
+                       + COALESCE((sumas ->> clave)::int, 0) AS cantidad
+                FROM JSONB_OBJECT_KEYS(items || sumas || fijos) AS clave
+            ) t;
+        $$;
+        """,
+    ),
+    (
+        "0006_indices_consultas_calientes",
+        [
+            # Búsqueda del cliente por teléfono (webhook, ingresar_mensaje_cliente)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cliente_telefono "
+            "ON Cliente (telefono);",
+            # enviar_pdfs_email compara el teléfono sin espacios
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cliente_telefono_sin_espacios "
+            "ON Cliente ((REPLACE(telefono, ' ', '')));",
+            # Chat abierto más reciente del cliente
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chat_cliente_abierto "
+            "ON Chat (cliente_id, fecha_inicio DESC) WHERE estado = 'abierto';",
+            # Historial y último mensaje del sistema de un chat
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensaje_chat_fecha "
+            "ON Mensaje (chat_id, fecha_envio);",
+            # Mensajes de un día (detectar_intenciones), con rangos sargables
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensaje_fecha "
+            "ON Mensaje (fecha_envio);",
+            # Búsquedas por nombre sin distinguir mayúsculas (detectar_intenciones)
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_producto_nombre_lower "
+            "ON Producto (LOWER(nombre));",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_categoria_nombre_lower "
+            "ON Categoria (LOWER(nombre));",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_promocion_nombre_lower "
+            "ON Promocion (LOWER(nombre));",
+        ],
+    ),
+    (
+        "0007_indices_intereses",
+        """
+        -- Interes*Chat: duplicados del día por chat y pendientes de un día para
+        -- los PDF. Las tablas de categorías/promociones (y la columna estado)
+        -- no existen en todos los despliegues, así que se crean si están.
+        DO $$
+        DECLARE
+            tabla TEXT;
+        BEGIN
+            FOREACH tabla IN ARRAY ARRAY[
+                'interesproductochat', 'interescategoriachat', 'interespromocionchat'
+            ] LOOP
+                CONTINUE WHEN to_regclass(tabla) IS NULL;
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS %I ON %I (chat_id, fecha_registro)',
+                    'idx_' || tabla || '_chat_fecha', tabla
+                );
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema()
+                      AND table_name = tabla AND column_name = 'estado'
+                ) THEN
+                    EXECUTE format(
+                        'CREATE INDEX IF NOT EXISTS %I ON %I (fecha_registro) '
+                        'WHERE estado = %L',
+                        'idx_' || tabla || '_pendiente', tabla, 'pendiente'
+                    );
+                END IF;
+            END LOOP;
+        END;
+        $$;
+        """,
+    ),
+    (
+        "0008_mensaje_procesado",
+        """
+        -- Idempotencia del webhook: un MessageSid de Twilio se atiende una vez
+        -- (ver idempotencia.py); los reintentos leen la respuesta guardada.
+        CREATE TABLE IF NOT EXISTS MensajeProcesado (
+            message_sid TEXT PRIMARY KEY,
+            respuesta TEXT,
+            creado_en TIMESTAMP NOT NULL DEFAULT NOW(),
+            respondido_en TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_mensaje_procesado_creado
+        ON MensajeProcesado (creado_en);
+        """,
+    ),
+    (
+        "0009_mensaje_procesado_abandonado",
+        """
+        -- Un reintento que dejó de esperar pide que la respuesta se envíe por
+        -- la API REST al terminar el cálculo
+        ALTER TABLE MensajeProcesado
+        ADD COLUMN IF NOT EXISTS abandonado BOOLEAN NOT NULL DEFAULT FALSE;
+        """,
+    ),
+]
+
+
+def aplicar_migraciones(conn=None):
+    propia = conn is None
+    if propia:
+        conn = conectar_bd()
+    try:
+        cur = conn.cursor()
+        # Evita que dos procesos apliquen las mismas migraciones a la vez
+        cur.execute("SELECT pg_advisory_lock(hashtext('schema_migraciones'));")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                nombre TEXT PRIMARY KEY,
+                aplicada_en TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+            """
+        )
+        conn.commit()
+
+        cur.execute("SELECT nombre FROM schema_migraciones;")
+        aplicadas = {fila["nombre"] for fila in cur.fetchall()}
+
+        nuevas = []
+        for nombre, sql in MIGRACIONES:
+            if nombre in aplicadas:
+                continue
+            print(f"🛠️ Aplicando migración {nombre}...")
+            if isinstance(sql, str):
+                cur.execute(sql)
+            else:
+                conn.commit()
+                conn.autocommit = True
+                try:
+                    for sentencia in sql:
+                        cur.execute(sentencia)
+                finally:
+                    conn.autocommit = False
+            cur.execute(
+                "INSERT INTO schema_migraciones (nombre) VALUES (%s);", (nombre,)
+            )
+            conn.commit()
+            nuevas.append(nombre)
+
+        cur.execute("SELECT pg_advisory_unlock(hashtext('schema_migraciones'));")
+        conn.commit()
+        return nuevas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if propia:
+            conn.close()
+
+
+if __name__ == "__main__":
+    nuevas = aplicar_migraciones()
+    if nuevas:
+        print(f"✅ {len(nuevas)} migraciones aplicadas.")
+    else:
+        print("✅ El esquema ya está al día.")
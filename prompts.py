@@ -0,0 +1,180 @@
+import math
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+from indice_catalogo import tokenizar
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Tope de tokens de entrada por llamada (mensajes completos, sin la respuesta)
+PROMPT_PRESUPUESTO = int(os.getenv("PROMPT_PRESUPUESTO", 2000))
+# Turnos más recientes del historial que se conservan antes de mirar relevancia
+PROMPT_TURNOS_RECIENTES = int(os.getenv("PROMPT_TURNOS_RECIENTES", 4))
+# Con PROMPT_TIKTOKEN=0 se usa siempre la aproximación local
+PROMPT_TIKTOKEN = os.getenv("PROMPT_TIKTOKEN", "1") == "1"
+
+# Fijos del formato chat de OpenAI: por mensaje y para cebar la respuesta
+TOKENS_POR_MENSAJE = 3
+TOKENS_RESPUESTA = 3
+
+_PIEZAS = re.compile(r"\s?\w+|\s?[^\w\s]+|\s+", re.UNICODE)
+_codificadores = {}
+_codificadores_lock = threading.Lock()
+
+
+def _codificador(modelo):
+    """Codificador de tiktoken para ``modelo`` o None si no está disponible.
+
+    tiktoken es opcional y descarga el vocabulario la primera vez; sin él (o
+    sin red) se usa la aproximación, que tiende a contar de más.
+    """
+    if not PROMPT_TIKTOKEN:
+        return None
+    if modelo not in _codificadores:
+        with _codificadores_lock:
+            if modelo not in _codificadores:
+                try:
+                    import tiktoken
+
+                    try:
+                        codificador = tiktoken.encoding_for_model(modelo)
+                    except KeyError:
+                        codificador = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    print("⚠️ tiktoken no disponible, se aproximan los tokens:", e)
+                    codificador = None
+                _codificadores[modelo] = codificador
+    return _codificadores[modelo]
+
+
+def _aproximar(texto):
+    # ~4 bytes por token en cada palabra (con su espacio) o signo; los
+    # acentos y emojis ocupan más bytes y cuentan más, como en BPE
+    return sum(
+        max(1, math.ceil(len(pieza.encode("utf-8")) / 4))
+        for pieza in _PIEZAS.findall(texto)
+    )
+
+
+def contar_tokens(texto, modelo="gpt-4o-mini"):
+    codificador = _codificador(modelo)
+    if codificador is None:
+        return _aproximar(texto)
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def contar_mensajes(mensajes, modelo="gpt-4o-mini"):
+    """Tokens de entrada de una lista de mensajes de chat."""
+    return TOKENS_RESPUESTA + sum(
+        TOKENS_POR_MENSAJE + contar_tokens(m["content"] or "", modelo)
+        for m in mensajes
+    )
+
+
+def relevancia(texto, consulta):
+    """Fracción de las palabras de ``consulta`` que aparecen en ``texto``."""
+    buscadas = set(tokenizar(consulta))
+    if not buscadas:
+        return 0.0
+    return len(buscadas & set(tokenizar(texto))) / len(buscadas)
+
+
+# === CONTEXTO POR LÍNEAS ===
+def ajustar_lineas(lineas, presupuesto, modelo="gpt-4o-mini"):
+    """Une ``lineas`` sin pasar de ``presupuesto`` tokens.
+
+    ``lineas`` es una lista de ``(texto, puntaje, grupo)``. Si todo entra se
+    devuelve igual (mismo orden, así la caché de respuestas sigue acertando).
+    Si no, se eligen por puntaje y las que quedan fuera se resumen por grupo
+    ("- … y 40 más de Cuadernos"); lo elegido conserva el orden original.
+    """
+    textos = [texto for texto, _, _ in lineas]
+    costos = [contar_tokens(texto, modelo) for texto in textos]
+    if sum(costos) <= presupuesto:
+        return "".join(textos)
+
+    # Reserva aproximada para los resúmenes de lo que se omite
+    grupos = {grupo for _, _, grupo in lineas}
+    restante = presupuesto - sum(
+        contar_tokens(_resumen(grupo, 100), modelo) for grupo in grupos
+    )
+    orden = sorted(range(len(lineas)), key=lambda i: -lineas[i][1])
+    elegidas = set()
+    for i in orden:
+        if costos[i] <= restante:
+            elegidas.add(i)
+            restante -= costos[i]
+
+    omitidas = {}
+    for i, (_, _, grupo) in enumerate(lineas):
+        if i not in elegidas:
+            omitidas[grupo] = omitidas.get(grupo, 0) + 1
+    return "".join(textos[i] for i in sorted(elegidas)) + "".join(
+        _resumen(grupo, n) for grupo, n in omitidas.items()
+    )
+
+
+def _resumen(grupo, cantidad):
+    return f"- … y {cantidad} más de {grupo}\n"
+
+
+_bm25 = None
+_bm25_lock = threading.Lock()
+
+
+def puntajes_productos(catalogo, consulta):
+    """``{producto_id: puntaje}`` de BM25 para ``consulta`` (0 si no aparece)."""
+    global _bm25
+    from recuperacion import IndiceBM25
+
+    indice = _bm25
+    if indice is None or indice.version != catalogo.version:
+        with _bm25_lock:
+            if _bm25 is None or _bm25.version != catalogo.version:
+                _bm25 = IndiceBM25(catalogo)
+            indice = _bm25
+    return dict(indice.buscar(consulta, n=len(catalogo.productos)))
+
+
+# === HISTORIAL ===
+def recortar_historial(
+    sistema, historial, consulta, presupuesto=PROMPT_PRESUPUESTO, modelo="gpt-4o-mini"
+):
+    """``[sistema] + historial`` dentro de ``presupuesto`` tokens.
+
+    Siempre van el mensaje de sistema y el último turno (la pregunta en
+    curso). Luego entran los PROMPT_TURNOS_RECIENTES más recientes y, con lo
+    que sobre, los turnos anteriores más parecidos a ``consulta``. El
+    resultado conserva el orden cronológico.
+    """
+    if not historial:
+        return [sistema]
+    mensajes = [sistema] + list(historial)
+    if contar_mensajes(mensajes, modelo) <= presupuesto:
+        return mensajes
+
+    costos = [
+        TOKENS_POR_MENSAJE + contar_tokens(m["content"] or "", modelo)
+        for m in historial
+    ]
+    ultimo = len(historial) - 1
+    restante = presupuesto - contar_mensajes([sistema, historial[-1]], modelo)
+    recientes = range(ultimo - 1, max(ultimo - 1 - PROMPT_TURNOS_RECIENTES, -1), -1)
+    anteriores = sorted(
+        range(0, max(ultimo - PROMPT_TURNOS_RECIENTES, 0)),
+        key=lambda i: (-relevancia(historial[i]["content"] or "", consulta), -i),
+    )
+    elegidos = {ultimo}
+    for i in list(recientes) + anteriores:
+        if costos[i] <= restante:
+            elegidos.add(i)
+            restante -= costos[i]
+    # Una respuesta sin su pregunta confunde al modelo: se descarta
+    for i in sorted(elegidos):
+        if historial[i]["role"] == "assistant" and i - 1 not in elegidos:
+            elegidos.discard(i)
+    return [sistema] + [historial[i] for i in sorted(elegidos)]
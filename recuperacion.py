@@ -0,0 +1,254 @@
+import math
+import os
+import threading
+from collections import Counter, namedtuple
+
+from dotenv import load_dotenv
+
+from catalogo import obtener_catalogo
+from indice_catalogo import IndiceCatalogo, tokenizar
+from metricas import etapa
+
+load_dotenv()
+
+RECUPERACION_K_MAX = int(os.getenv("RECUPERACION_K_MAX", 5))
+# Se corta una lista cuando el puntaje cae más de esta fracción respecto al anterior
+RECUPERACION_SALTO = float(os.getenv("RECUPERACION_SALTO", 0.35))
+# Constante estándar de Reciprocal Rank Fusion
+RRF_K = 60
+
+Resultado = namedtuple("Resultado", "producto_id documento puntaje fuentes")
+
+
+def documento_producto(catalogo, producto):
+    """Texto del producto con el mismo formato que se indexa en Chroma."""
+    promociones = [catalogo.promociones[pid] for pid in producto.promociones]
+    promo_texto = (
+        ", ".join(
+            f"{pr.nombre} ({pr.porcentaje_descuento}% hasta {pr.fecha_fin})"
+            for pr in promociones
+        )
+        or "Sin promociones"
+    )
+    return (
+        f"Producto: {producto.nombre}\n"
+        f"Categoría: {producto.categoria}\n"
+        f"Descripción: {producto.descripcion}\n"
+        f"Precio: Bs. {producto.precio}\n"
+        f"Stock disponible: {producto.stock}\n"
+        f"Promociones: {promo_texto}"
+    )
+
+
+class IndiceBM25:
+    """BM25 sobre nombre (con doble peso), categoría y descripción.
+
+    Los tokens de la consulta que no aparecen en el catálogo se corrigen con
+    el índice de borrados de IndiceCatalogo ("cuadreno" -> "cuaderno").
+    """
+
+    def __init__(self, catalogo, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = catalogo.version
+        self._correcciones = IndiceCatalogo(
+            catalogo.productos.values(), catalogo.categorias.values()
+        )
+        self._postings = {}  # token -> [(producto_id, frecuencia)]
+        self._largos = {}
+        for p in catalogo.productos.values():
+            tokens = (
+                tokenizar(p.nombre) * 2
+                + tokenizar(p.categoria or "")
+                + tokenizar(p.descripcion or "")
+            )
+            self._largos[p.id] = len(tokens)
+            for token, frecuencia in Counter(tokens).items():
+                self._postings.setdefault(token, []).append((p.id, frecuencia))
+        n = len(self._largos)
+        self._promedio = (sum(self._largos.values()) / n) if n else 0.0
+        self._idf = {
+            token: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self._postings.items()
+        }
+
+    def _terminos(self, consulta):
+        terminos = set()
+        for token in tokenizar(consulta):
+            if token in self._idf:
+                terminos.add(token)
+            else:
+                terminos.update(self._correcciones.corregir(token))
+        return terminos
+
+    def buscar(self, consulta, permitidos=None, n=20):
+        puntajes = {}
+        for token in self._terminos(consulta):
+            idf = self._idf.get(token)
+            if idf is None:
+                continue
+            for producto_id, frecuencia in self._postings[token]:
+                if permitidos is not None and producto_id not in permitidos:
+                    continue
+                largo = self._largos[producto_id] / (self._promedio or 1)
+                puntajes[producto_id] = puntajes.get(producto_id, 0.0) + idf * (
+                    frecuencia
+                    * (self.k1 + 1)
+                    / (frecuencia + self.k1 * (1 - self.b + self.b * largo))
+                )
+        return sorted(puntajes.items(), key=lambda x: (-x[1], x[0]))[:n]
+
+
+def corte_adaptativo(ordenados, k_max, salto=RECUPERACION_SALTO):
+    """Se queda con los primeros hasta el primer salto grande de puntaje."""
+    elegidos = ordenados[:1]
+    for anterior, actual in zip(ordenados, ordenados[1:k_max]):
+        if actual[1] < anterior[1] * (1 - salto):
+            break
+        elegidos.append(actual)
+    return elegidos
+
+
+class RecuperadorHibrido:
+    """Combina BM25 y los vecinos de Chroma con Reciprocal Rank Fusion.
+
+    Los filtros (categoría, stock > 0, rango de precio) se aplican antes de
+    puntuar: sobre el snapshot en BM25 y con ``where`` en Chroma. El precio
+    se valida contra el snapshot porque los metadatos viejos lo guardan como
+    texto. ``embeddings`` es una CacheEmbeddings (o algo con ``obtener``).
+    """
+
+    def __init__(self, coleccion, embeddings, catalogo=None):
+        self.coleccion = coleccion
+        self.embeddings = embeddings
+        self._catalogo_fijo = catalogo
+        self._bm25 = None
+        self._lock = threading.Lock()
+
+    def _catalogo(self):
+        return self._catalogo_fijo or obtener_catalogo()
+
+    def _indice_bm25(self, catalogo):
+        indice = self._bm25
+        if indice is None or indice.version != catalogo.version:
+            with self._lock:
+                if self._bm25 is None or self._bm25.version != catalogo.version:
+                    self._bm25 = IndiceBM25(catalogo)
+                indice = self._bm25
+        return indice
+
+    def calentar(self):
+        """Construye el índice BM25 y abre los segmentos de la colección."""
+        self._indice_bm25(self._catalogo())
+        self.coleccion.count()
+
+    @staticmethod
+    def _permitidos(catalogo, categoria, solo_con_stock, precio_min, precio_max):
+        sin_filtros = not categoria and not solo_con_stock
+        if sin_filtros and precio_min is None and precio_max is None:
+            return None
+        permitidos = set()
+        for p in catalogo.productos.values():
+            if categoria and (p.categoria or "").lower() != categoria.lower():
+                continue
+            if solo_con_stock and not (p.stock or 0) > 0:
+                continue
+            if precio_min is not None and (p.precio is None or p.precio < precio_min):
+                continue
+            if precio_max is not None and (p.precio is None or p.precio > precio_max):
+                continue
+            permitidos.add(p.id)
+        return permitidos
+
+    @staticmethod
+    def _where(catalogo, categoria, solo_con_stock):
+        condiciones = []
+        if categoria:
+            # Con el nombre exacto guardado en los metadatos
+            nombres = {
+                c.nombre
+                for c in catalogo.categorias.values()
+                if c.nombre.lower() == categoria.lower()
+            }
+            nombres = sorted(nombres) or [categoria]
+            condiciones.append({"categoria": {"$in": nombres}})
+        if solo_con_stock:
+            condiciones.append({"stock": {"$gt": 0}})
+        if not condiciones:
+            return None
+        return condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+
+    def buscar_vectorial(self, consulta, catalogo, permitidos, where, n):
+        with etapa("embedding"):
+            embedding = self.embeddings.obtener([consulta])[0]
+        with etapa("chroma"):
+            resultados = self.coleccion.query(
+                query_embeddings=[embedding], n_results=n, where=where
+            )
+        ids = resultados.get("ids", [[]])[0]
+        distancias = resultados.get("distances", [[]])[0] or [0.0] * len(ids)
+        vecinos = []
+        for id_, distancia in zip(ids, distancias):
+            producto_id = int(id_.rsplit("_", 1)[-1])
+            if producto_id not in catalogo.productos:
+                continue
+            if permitidos is not None and producto_id not in permitidos:
+                continue
+            # Distancia L2² entre vectores unitarios -> similitud coseno
+            vecinos.append((producto_id, 1.0 - distancia / 2))
+        return vecinos
+
+    def buscar(
+        self,
+        consulta,
+        k_max=RECUPERACION_K_MAX,
+        categoria=None,
+        solo_con_stock=False,
+        precio_min=None,
+        precio_max=None,
+        modo="hibrido",
+    ):
+        catalogo = self._catalogo()
+        permitidos = self._permitidos(
+            catalogo, categoria, solo_con_stock, precio_min, precio_max
+        )
+        if permitidos is not None and not permitidos:
+            return []
+        n = max(k_max * 4, 20)
+
+        listas = {}
+        if modo in ("hibrido", "lexico"):
+            with etapa("bm25"):
+                bm25 = self._indice_bm25(catalogo)
+                listas["bm25"] = bm25.buscar(consulta, permitidos, n)
+        if modo in ("hibrido", "vectorial"):
+            where = self._where(catalogo, categoria, solo_con_stock)
+            listas["vector"] = self.buscar_vectorial(
+                consulta, catalogo, permitidos, where, n
+            )
+
+        fusion = {}
+        fuentes = {}
+        for nombre, lista in listas.items():
+            for rango, (producto_id, _) in enumerate(lista, 1):
+                aporte = 1.0 / (RRF_K + rango)
+                fusion[producto_id] = fusion.get(producto_id, 0.0) + aporte
+                fuentes.setdefault(producto_id, []).append(nombre)
+        ordenados = sorted(fusion.items(), key=lambda x: (-x[1], x[0]))
+
+        # Los puntajes RRF casi no tienen saltos; k sale de los puntajes
+        # originales de cada lista y se toma el más corto de los no vacíos
+        cortes = [
+            len(corte_adaptativo(lista, k_max)) for lista in listas.values() if lista
+        ]
+        k = min(cortes, default=k_max)
+
+        return [
+            Resultado(
+                producto_id,
+                documento_producto(catalogo, catalogo.productos[producto_id]),
+                puntaje,
+                tuple(fuentes[producto_id]),
+            )
+            for producto_id, puntaje in ordenados[:k]
+        ]
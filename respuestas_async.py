@@ -0,0 +1,131 @@
+import base64
+import json
+import os
+import queue
+import threading
+import urllib.parse
+import urllib.request
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Con RESPUESTA_ASINCRONA=1 el webhook responde a Twilio de inmediato y la
+# respuesta se envía después por la API REST de mensajes.
+RESPUESTA_ASINCRONA = os.getenv("RESPUESTA_ASINCRONA", "0") == "1"
+RESPUESTA_WORKERS = int(os.getenv("RESPUESTA_WORKERS", 4))
+RESPUESTA_COLA_MAX = int(os.getenv("RESPUESTA_COLA_MAX", 100))
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
+# Se puede apuntar a un stub local para pruebas
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com").rstrip("/")
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", 10))
+
+MENSAJE_ERROR = "Ocurrió un error al procesar tu mensaje. Intenta nuevamente."
+
+
+def enviar_whatsapp(destino, cuerpo, origen=None):
+    """Envía un mensaje con la API REST de Twilio (Messages.json)."""
+    url = f"{TWILIO_API_URL}/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+    datos = urllib.parse.urlencode(
+        {"To": destino, "From": origen or TWILIO_WHATSAPP_FROM, "Body": cuerpo}
+    ).encode()
+    credenciales = base64.b64encode(
+        f"{TWILIO_ACCOUNT_SID}:{TWILIO_AUTH_TOKEN}".encode()
+    ).decode()
+    peticion = urllib.request.Request(
+        url,
+        data=datos,
+        headers={"Authorization": f"Basic {credenciales}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(peticion, timeout=TWILIO_TIMEOUT) as r:
+        return json.loads(r.read().decode() or "{}")
+
+
+class PoolRespuestas:
+    """Workers en segundo plano que generan y envían las respuestas.
+
+    ``procesar`` recibe los argumentos encolados y devuelve el texto a
+    enviar; ``enviar`` se puede reemplazar por un stub en pruebas.
+
+    Cada worker tiene su propia cola y los mensajes de un mismo ``destino``
+    van siempre al mismo worker: se atienden en orden y ningún otro worker
+    queda esperando el bloqueo de ese número.
+    """
+
+    def __init__(
+        self,
+        procesar,
+        enviar=enviar_whatsapp,
+        workers=RESPUESTA_WORKERS,
+        cola_max=RESPUESTA_COLA_MAX,
+    ):
+        self.procesar = procesar
+        self.enviar = enviar
+        self.workers = workers
+        por_worker = max(1, cola_max // workers)
+        self._colas = [queue.Queue(maxsize=por_worker) for _ in range(workers)]
+        self._hilos = []
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilos:
+                return
+            for i, cola in enumerate(self._colas):
+                hilo = threading.Thread(
+                    target=self._trabajar,
+                    args=(cola,),
+                    name=f"respuestas-{i}",
+                    daemon=True,
+                )
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def encolar(self, destino, origen, *args):
+        """Devuelve False si la cola está llena, para responder en línea."""
+        self._iniciar()
+        cola = self._colas[zlib.crc32(destino.encode()) % len(self._colas)]
+        try:
+            cola.put_nowait((destino, origen, args))
+            return True
+        except queue.Full:
+            return False
+
+    def pendientes(self):
+        return sum(cola.qsize() for cola in self._colas)
+
+    def _trabajar(self, cola):
+        while True:
+            tarea = cola.get()
+            if tarea is None:
+                cola.task_done()
+                return
+            destino, origen, args = tarea
+            try:
+                try:
+                    respuesta = self.procesar(*args)
+                except Exception as e:
+                    print("❌ Error al generar respuesta en segundo plano:", e)
+                    respuesta = MENSAJE_ERROR
+                if respuesta:
+                    self.enviar(destino, respuesta, origen)
+            except Exception as e:
+                print(f"❌ No se pudo enviar la respuesta a {destino}:", e)
+            finally:
+                cola.task_done()
+
+    def detener(self):
+        """Espera a que se vacíe la cola y termina los workers."""
+        with self._lock:
+            hilos, self._hilos = self._hilos, []
+        if hilos:
+            for cola in self._colas:
+                cola.put(None)
+        for hilo in hilos:
+            hilo.join()
@@ -0,0 +1,187 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Confianza mínima de la intención para responder sin el LLM (las reglas
+# dan 1.0; el clasificador, su similitud)
+RESPUESTAS_DIRECTAS_UMBRAL = float(os.getenv("RESPUESTAS_DIRECTAS_UMBRAL", 0.8))
+# Productos que se listan de una categoría antes de resumir el resto
+RESPUESTAS_DIRECTAS_MAX_LISTA = int(os.getenv("RESPUESTAS_DIRECTAS_MAX_LISTA", 15))
+
+# === PLANTILLAS ===
+PLANTILLAS = {
+    "precio": "💵 {nombre}: Bs. {precio}{promo}.",
+    "precio_desconocido": "Por ahora no tengo el precio de {nombre}. 🙏",
+    "stock": "📦 {nombre}: {disponibilidad}.",
+    "producto": "🛍️ {nombre}: Bs. {precio}{promo}. {disponibilidad_frase}.",
+    "promo_producto": " (con {promo}: Bs. {final})",
+    "sin_promo_producto": "{nombre} no tiene promociones activas por ahora.",
+    "cierre_producto": "¿Te gustaría agregarlo a tu pedido? 😊",
+    "categoria": "Estos son nuestros productos de {categoria}:\n{lista}",
+    "categoria_vacia": "Por ahora no tenemos productos en {categoria}. 😔",
+    "mas": "- … y {cantidad} más",
+    "categorias": "Estas son nuestras categorías:\n{lista}\n¿Cuál te interesa? 😊",
+    "promociones": "🎉 Estas son nuestras promociones activas:\n{lista}",
+    "promociones_categoria": "🎉 Promociones activas en {categoria}:\n{lista}",
+    "sin_promociones": "En este momento no contamos con promociones activas. 🙏",
+    "sin_promociones_categoria": "Por ahora no hay promociones activas en {categoria}.",
+}
+
+
+def _disponibilidad(producto):
+    if not producto.stock:
+        return "agotado por ahora"
+    if producto.stock == 1:
+        return "queda 1 unidad"
+    return f"{producto.stock} unidades disponibles"
+
+
+def _texto_promo(promo, final):
+    if promo is None:
+        return ""
+    return PLANTILLAS["promo_producto"].format(promo=promo.nombre, final=final)
+
+
+def _linea_promocion(catalogo, promo):
+    nombres = [
+        catalogo.productos[pid].nombre
+        for pid in promo.productos
+        if pid in catalogo.productos
+    ]
+    descuento = (
+        f"{promo.porcentaje_descuento}%"
+        if promo.porcentaje_descuento
+        else f"Bs. {promo.monto_descuento}"
+    )
+    linea = f"- {promo.nombre} ({descuento} hasta {promo.fecha_fin})"
+    if nombres:
+        linea += ": " + ", ".join(nombres[:RESPUESTAS_DIRECTAS_MAX_LISTA])
+        if len(nombres) > RESPUESTAS_DIRECTAS_MAX_LISTA:
+            linea += f" y {len(nombres) - RESPUESTAS_DIRECTAS_MAX_LISTA} más"
+    return linea
+
+
+def responder_producto(catalogo, producto, pregunta):
+    if pregunta == "stock":
+        return PLANTILLAS["stock"].format(
+            nombre=producto.nombre, disponibilidad=_disponibilidad(producto)
+        )
+    if producto.precio is None:
+        return PLANTILLAS["precio_desconocido"].format(nombre=producto.nombre)
+    promo, final = catalogo.mejor_promocion(producto)
+    if pregunta == "promocion" and promo is None:
+        return PLANTILLAS["sin_promo_producto"].format(nombre=producto.nombre)
+    if pregunta in ("precio", "promocion"):
+        return PLANTILLAS["precio"].format(
+            nombre=producto.nombre,
+            precio=producto.precio,
+            promo=_texto_promo(promo, final),
+        )
+    disponibilidad = _disponibilidad(producto)
+    return PLANTILLAS["producto"].format(
+        nombre=producto.nombre,
+        precio=producto.precio,
+        promo=_texto_promo(promo, final),
+        disponibilidad_frase=disponibilidad[0].upper() + disponibilidad[1:],
+    )
+
+
+def responder_categoria(catalogo, categoria, pregunta=None):
+    # Primero lo que hay en stock
+    productos = sorted(
+        (
+            catalogo.productos[pid]
+            for pid in categoria.productos
+            if pid in catalogo.productos
+        ),
+        key=lambda p: (not p.stock, p.nombre),
+    )
+    if pregunta == "promocion":
+        promociones = [
+            promo
+            for promo in catalogo.promociones_ordenadas()
+            if set(promo.productos) & set(categoria.productos)
+        ]
+        if not promociones:
+            return PLANTILLAS["sin_promociones_categoria"].format(
+                categoria=categoria.nombre
+            )
+        return PLANTILLAS["promociones_categoria"].format(
+            categoria=categoria.nombre,
+            lista="\n".join(_linea_promocion(catalogo, p) for p in promociones),
+        )
+    if not productos:
+        return PLANTILLAS["categoria_vacia"].format(categoria=categoria.nombre)
+    lineas = []
+    for p in productos[:RESPUESTAS_DIRECTAS_MAX_LISTA]:
+        if pregunta == "stock":
+            lineas.append(f"- {p.nombre}: {_disponibilidad(p)}")
+        elif p.precio is not None:
+            lineas.append(f"- {p.nombre}: Bs. {p.precio}")
+        else:
+            lineas.append(f"- {p.nombre}")
+    resto = len(productos) - RESPUESTAS_DIRECTAS_MAX_LISTA
+    if resto > 0:
+        lineas.append(PLANTILLAS["mas"].format(cantidad=resto))
+    return PLANTILLAS["categoria"].format(
+        categoria=categoria.nombre, lista="\n".join(lineas)
+    )
+
+
+def responder_categorias(catalogo):
+    lista = "\n".join(
+        f"- {c.nombre} ({len(c.productos)} productos)"
+        for c in catalogo.categorias_ordenadas()
+    )
+    return PLANTILLAS["categorias"].format(lista=lista)
+
+
+def responder_promociones(catalogo):
+    promociones = catalogo.promociones_ordenadas()
+    if not promociones:
+        return PLANTILLAS["sin_promociones"]
+    return PLANTILLAS["promociones"].format(
+        lista="\n".join(_linea_promocion(catalogo, p) for p in promociones)
+    )
+
+
+def respuesta_directa(intencion, catalogo=None, umbral=RESPUESTAS_DIRECTAS_UMBRAL):
+    """Respuesta armada con plantillas y el catálogo, o None.
+
+    Devuelve None si la intención no es de las que se responden sin el LLM o
+    si su confianza no llega a ``umbral``; en ese caso decide el modelo.
+    """
+    if intencion.tipo is None or intencion.confianza < umbral:
+        return None
+    if catalogo is None:
+        from catalogo import obtener_catalogo
+
+        catalogo = obtener_catalogo()
+
+    productos = [
+        catalogo.productos[pid]
+        for pid in intencion.productos
+        if pid in catalogo.productos
+    ]
+    if intencion.tipo == "producto" and productos:
+        respuestas = [
+            responder_producto(catalogo, p, intencion.pregunta) for p in productos
+        ]
+        if intencion.pregunta is None and any(p.stock for p in productos):
+            respuestas.append(PLANTILLAS["cierre_producto"])
+        return "\n".join(respuestas)
+
+    categoria = catalogo.categorias.get(intencion.categoria_id)
+    if intencion.tipo == "categoria" and categoria is not None:
+        return responder_categoria(catalogo, categoria, intencion.pregunta)
+    if intencion.tipo == "promociones":
+        if categoria is not None:
+            return responder_categoria(catalogo, categoria, "promocion")
+        return responder_promociones(catalogo)
+    if intencion.tipo in ("categorias", "productos"):
+        # El catálogo completo no cabe en un mensaje: se ofrecen las categorías
+        return responder_categorias(catalogo)
+    return None
@@ -0,0 +1,153 @@
+import argparse
+import os
+import sys
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# Una tabla es "grande" desde estas filas estimadas (pg_class.reltuples); en
+# las chicas un Seq Scan es lo más barato y no se marca
+REVISION_FILAS_MINIMAS = int(os.getenv("REVISION_FILAS_MINIMAS", 10000))
+
+# === CONSULTAS CALIENTES ===
+# (nombre, sql, parámetros de ejemplo). Copias de las consultas del webhook y
+# de los scripts diarios: si una cambia, actualizarla aquí también.
+_HOY = date.today()
+CONSULTAS = [
+    (
+        "chat_abierto",
+        """
+        SELECT c.id AS chat_id, cl.nombre
+        FROM Chat c
+        JOIN Cliente cl ON c.cliente_id = cl.id
+        WHERE cl.telefono = %s AND c.estado = 'abierto'
+        ORDER BY c.fecha_inicio DESC LIMIT 1;
+        """,
+        ("+59100000000",),
+    ),
+    (
+        "cliente_por_telefono",
+        "SELECT id, nombre FROM Cliente WHERE telefono = %s;",
+        ("+59100000000",),
+    ),
+    (
+        "cliente_sin_espacios",
+        "SELECT nombre, correo, telefono FROM Cliente "
+        "WHERE REPLACE(telefono, ' ', '') = %s;",
+        ("+59100000000",),
+    ),
+    (
+        "ultimo_mensaje_sistema",
+        """
+        SELECT contenido, fecha_envio::date
+        FROM Mensaje
+        WHERE chat_id = %s AND emisor = 'sistema'
+        ORDER BY fecha_envio DESC LIMIT 1;
+        """,
+        (1,),
+    ),
+    (
+        "historial_chat",
+        """
+        SELECT emisor, contenido FROM Mensaje
+        WHERE chat_id = %s ORDER BY fecha_envio ASC;
+        """,
+        (1,),
+    ),
+    (
+        "chats_del_dia",
+        """
+        SELECT DISTINCT c.id AS chat_id, cl.nombre, cl.telefono
+        FROM Chat c
+        JOIN Mensaje m ON m.chat_id = c.id
+        JOIN Cliente cl ON c.cliente_id = cl.id
+        WHERE m.fecha_envio >= %s::date AND m.fecha_envio < %s::date + 1;
+        """,
+        (_HOY, _HOY),
+    ),
+    (
+        "interes_del_dia",
+        """
+        SELECT 1 FROM InteresProductoChat
+        WHERE chat_id = %s AND producto_id = %s
+          AND fecha_registro >= CURRENT_DATE AND fecha_registro < CURRENT_DATE + 1;
+        """,
+        (1, 1),
+    ),
+    (
+        "producto_por_nombre",
+        "SELECT id FROM Producto WHERE LOWER(nombre) = LOWER(%s) LIMIT 1;",
+        ("cuaderno",),
+    ),
+]
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", ()):
+        yield from _nodos(hijo)
+
+
+def tablas_grandes(cur, minimo=REVISION_FILAS_MINIMAS):
+    cur.execute(
+        """
+        SELECT relname, reltuples::bigint AS filas
+        FROM pg_class
+        WHERE relkind = 'r'
+          AND relnamespace = current_schema()::regnamespace
+          AND reltuples >= %s;
+        """,
+        (minimo,),
+    )
+    return {fila["relname"]: fila["filas"] for fila in cur.fetchall()}
+
+
+def revisar(cur, consultas=CONSULTAS, minimo=REVISION_FILAS_MINIMAS):
+    """``[(consulta, tabla, filas)]`` con cada Seq Scan sobre una tabla grande.
+
+    Usa EXPLAIN sin ANALYZE: no ejecuta las consultas (ni los INSERT).
+    Las consultas sobre tablas que no existen en este esquema se saltan.
+    """
+    grandes = tablas_grandes(cur, minimo)
+    hallazgos = []
+    for nombre, sql, parametros in consultas:
+        cur.execute("SAVEPOINT revision;")
+        try:
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, parametros)
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT revision;")
+            print(f"⚠️ No se pudo revisar {nombre}:", str(e).strip())
+            continue
+        plan = cur.fetchone()["QUERY PLAN"][0]["Plan"]
+        for nodo in _nodos(plan):
+            tabla = (nodo.get("Relation Name") or "").lower()
+            if nodo["Node Type"] == "Seq Scan" and tabla in grandes:
+                hallazgos.append((nombre, tabla, grandes[tabla]))
+    return hallazgos
+
+
+def main():
+    from bd import cursor_bd
+
+    parser = argparse.ArgumentParser(
+        description="Marca los Seq Scan de las consultas calientes en tablas grandes."
+    )
+    parser.add_argument("--minimo", type=int, default=REVISION_FILAS_MINIMAS)
+    args = parser.parse_args()
+
+    with cursor_bd() as cur:
+        hallazgos = revisar(cur, minimo=args.minimo)
+    if not hallazgos:
+        print(f"✅ {len(CONSULTAS)} consultas sin Seq Scan en tablas grandes.")
+        return
+    for nombre, tabla, filas in hallazgos:
+        print(f"❌ {nombre}: Seq Scan sobre {tabla} (~{filas} filas)")
+    print("Revisar índices (migraciones.py) o reescribir el filtro como rango.")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
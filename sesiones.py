@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from cache_conversaciones import CONVERSACIONES_TTL, CacheConversaciones
+
+try:
+    import fcntl
+except ImportError:  # Windows: el bloqueo queda dentro del proceso
+    fcntl = None
+
+load_dotenv()
+
+# === CONFIGURACIÓN ===
+# memoria: un solo proceso (app.run); sqlite: varios workers en la misma
+# máquina; postgres: tabla UNLOGGED compartida por todas las máquinas
+SESIONES_BACKEND = os.getenv("SESIONES_BACKEND", "memoria")
+SESIONES_RUTA = os.getenv("SESIONES_RUTA", "sesiones.sqlite3")
+# Segundos que un mensaje espera a que termine el anterior del mismo número
+SESIONES_ESPERA_BLOQUEO = float(os.getenv("SESIONES_ESPERA_BLOQUEO", 30))
+SESIONES_FRANJAS = 256
+# Cada cuántas escrituras se borran las sesiones vencidas
+SESIONES_LIMPIEZA_CADA = 500
+
+
+def _sin_bloqueo(clave):
+    print(f"⚠️ Se esperó {SESIONES_ESPERA_BLOQUEO}s por la sesión {clave}; se sigue")
+
+
+class _BloqueosHilos:
+    """Un Lock por clave, creado a demanda y liberado cuando nadie lo usa."""
+
+    def __init__(self):
+        self._locks = {}  # clave -> [lock, usuarios]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def bloqueo(self, clave, espera=SESIONES_ESPERA_BLOQUEO):
+        with self._lock:
+            entrada = self._locks.setdefault(clave, [threading.Lock(), 0])
+            entrada[1] += 1
+        adquirido = entrada[0].acquire(timeout=espera)
+        if not adquirido:
+            _sin_bloqueo(clave)
+        try:
+            yield
+        finally:
+            if adquirido:
+                entrada[0].release()
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    del self._locks[clave]
+
+
+class SesionesMemoria(CacheConversaciones):
+    """Sesiones en el proceso (LRU + TTL); solo sirve con un único worker."""
+
+    backend = "memoria"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bloqueos = _BloqueosHilos()
+
+    def bloqueo(self, clave):
+        """Serializa los mensajes de un mismo número dentro del proceso."""
+        return self._bloqueos.bloqueo(clave)
+
+    def estadisticas(self):
+        return {"backend": self.backend, **super().estadisticas()}
+
+
+class _SesionesCompartidas:
+    """Interfaz tipo dict común a los almacenes fuera del proceso.
+
+    Los valores viajan como JSON, así que ``conversaciones[n]`` devuelve una
+    copia: para modificarla hay que volver a asignarla o usar ``agregar``.
+    """
+
+    def __init__(self, ttl=CONVERSACIONES_TTL):
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._escrituras = 0
+        self._contadores = threading.Lock()
+
+    def _contar(self, valor):
+        with self._contadores:
+            if valor is None:
+                self.fallos += 1
+            else:
+                self.aciertos += 1
+
+    def _escrito(self):
+        with self._contadores:
+            self._escrituras += 1
+            limpiar = self._escrituras % SESIONES_LIMPIEZA_CADA == 0
+        if limpiar:
+            self._limpiar()
+
+    def get(self, clave, defecto=None):
+        valor = self._leer(clave)
+        self._contar(valor)
+        return defecto if valor is None else valor
+
+    def obtener_o_cargar(self, clave, cargar):
+        valor = self.get(clave)
+        if valor is not None:
+            return valor, False
+        valor = cargar()
+        self[clave] = valor
+        return valor, True
+
+    def agregar(self, clave, mensaje):
+        self._agregar(clave, json.dumps([mensaje]))
+        self._escrito()
+
+    def __contains__(self, clave):
+        return self._leer(clave) is not None
+
+    def __getitem__(self, clave):
+        valor = self.get(clave)
+        if valor is None:
+            raise KeyError(clave)
+        return valor
+
+    def __setitem__(self, clave, valor):
+        self._escribir(clave, json.dumps(valor))
+        self._escrito()
+
+    def __delitem__(self, clave):
+        self._borrar(clave)
+
+    def estadisticas(self):
+        with self._contadores:
+            consultas = self.aciertos + self.fallos
+            return {
+                "backend": self.backend,
+                "entradas": self._contar_entradas(),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+            }
+
+
+class SesionesSQLite(_SesionesCompartidas):
+    """Sesiones en un SQLite local (WAL) compartido por los workers de la
+    máquina. El bloqueo por número usa ``flock`` sobre archivos de franja."""
+
+    backend = "sqlite"
+
+    def __init__(self, ruta=SESIONES_RUTA, ttl=CONVERSACIONES_TTL):
+        super().__init__(ttl)
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sesiones (
+                clave TEXT PRIMARY KEY,
+                datos TEXT NOT NULL,
+                actualizado REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._dir_bloqueos = ruta + ".bloqueos"
+        os.makedirs(self._dir_bloqueos, exist_ok=True)
+        self._bloqueos_hilos = _BloqueosHilos()
+
+    def _leer(self, clave):
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT datos FROM sesiones WHERE clave = ? AND actualizado > ?;",
+                (clave, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def _escribir(self, clave, datos):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sesiones (clave, datos, actualizado) "
+                "VALUES (?, ?, ?);",
+                (clave, datos, time.time()),
+            )
+
+    def _agregar(self, clave, datos):
+        ahora = time.time()
+        with self._lock, self._conn:
+            # Una sesión vencida vuelve a empezar desde este mensaje
+            self._conn.execute(
+                """
+                INSERT INTO sesiones (clave, datos, actualizado) VALUES (?, ?, ?)
+                ON CONFLICT (clave) DO UPDATE SET
+                    datos = CASE WHEN actualizado > ?
+                        THEN json_insert(datos, '$[#]', json(excluded.datos) -> 0)
+                        ELSE excluded.datos END,
+                    actualizado = excluded.actualizado;
+                """,
+                (clave, datos, ahora, ahora - self.ttl),
+            )
+
+    def _borrar(self, clave):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sesiones WHERE clave = ?;", (clave,))
+
+    def _limpiar(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM sesiones WHERE actualizado <= ?;",
+                (time.time() - self.ttl,),
+            )
+
+    def _contar_entradas(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sesiones;").fetchone()[0]
+
+    @contextmanager
+    def bloqueo(self, clave):
+        """Serializa los mensajes de un número entre procesos de la máquina."""
+        # Primero entre hilos del proceso (flock no distingue hilos)
+        with self._bloqueos_hilos.bloqueo(clave):
+            if fcntl is None:
+                yield
+                return
+            franja = int(hashlib.sha1(clave.encode()).hexdigest(), 16)
+            ruta = os.path.join(
+                self._dir_bloqueos, f"{franja % SESIONES_FRANJAS:03d}.lock"
+            )
+            with open(ruta, "a") as archivo:
+                limite = time.monotonic() + SESIONES_ESPERA_BLOQUEO
+                adquirido = False
+                while True:
+                    try:
+                        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        adquirido = True
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= limite:
+                            _sin_bloqueo(clave)
+                            break
+                        time.sleep(0.02)
+                try:
+                    yield
+                finally:
+                    if adquirido:
+                        fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+class SesionesPostgres(_SesionesCompartidas):
+    """Sesiones en la tabla UNLOGGED ``Sesion`` (migración 0004).
+
+    UNLOGGED evita escribir el WAL: si Postgres se cae las sesiones se
+    pierden, lo cual es aceptable porque se reconstruyen desde Mensaje.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, ttl=CONVERSACIONES_TTL):
+        super().__init__(ttl)
+        self._bloqueos_hilos = _BloqueosHilos()
+        # Una sola conexión por proceso para los advisory locks de todos los
+        # números: el Lock por número evita que dos hilos compartan uno
+        self._conexion_bloqueos = None
+        self._lock_conexion = threading.Lock()
+
+    def _leer(self, clave):
+        from bd import cursor_bd
+
+        with cursor_bd() as cur:
+            cur.execute(
+                """
+                SELECT datos FROM Sesion
+                WHERE clave = %s
+                  AND actualizado > NOW() - MAKE_INTERVAL(secs => %s);
+                """,
+                (clave, self.ttl),
+            )
+            fila = cur.fetchone()
+        return fila["datos"] if fila else None
+
+    def _escribir(self, clave, datos):
+        from bd import cursor_bd
+
+        with cursor_bd(commit=True) as cur:
+            cur.execute(
+                """
+                INSERT INTO Sesion (clave, datos, actualizado)
+                VALUES (%s, %s::jsonb, NOW())
+                ON CONFLICT (clave) DO UPDATE
+                SET datos = EXCLUDED.datos, actualizado = NOW();
+                """,
+                (clave, datos),
+            )
+
+    def _agregar(self, clave, datos):
+        from bd import cursor_bd
+
+        with cursor_bd(commit=True) as cur:
+            cur.execute(
+                """
+                INSERT INTO Sesion (clave, datos, actualizado)
+                VALUES (%s, %s::jsonb, NOW())
+                ON CONFLICT (clave) DO UPDATE
+                SET datos = CASE
+                        WHEN Sesion.actualizado > NOW() - MAKE_INTERVAL(secs => %s)
+                        THEN Sesion.datos || EXCLUDED.datos
+                        ELSE EXCLUDED.datos
+                    END,
+                    actualizado = NOW();
+                """,
+                (clave, datos, self.ttl),
+            )
+
+    def _borrar(self, clave):
+        from bd import cursor_bd
+
+        with cursor_bd(commit=True) as cur:
+            cur.execute("DELETE FROM Sesion WHERE clave = %s;", (clave,))
+
+    def _limpiar(self):
+        from bd import cursor_bd
+
+        with cursor_bd(commit=True) as cur:
+            cur.execute(
+                "DELETE FROM Sesion "
+                "WHERE actualizado <= NOW() - MAKE_INTERVAL(secs => %s);",
+                (self.ttl,),
+            )
+
+    def _contar_entradas(self):
+        from bd import cursor_bd
+
+        with cursor_bd() as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM Sesion;")
+            return cur.fetchone()["n"]
+
+    def _consultar_bloqueo(self, consulta, clave):
+        """Corre ``consulta`` en la conexión de bloqueos (fuera del pool)."""
+        import psycopg2
+
+        from bd import conectar_bd
+
+        with self._lock_conexion:
+            try:
+                if self._conexion_bloqueos is None or self._conexion_bloqueos.closed:
+                    self._conexion_bloqueos = conectar_bd()
+                    self._conexion_bloqueos.autocommit = True
+                with self._conexion_bloqueos.cursor() as cur:
+                    cur.execute(consulta, ("sesion:" + clave,))
+                    return cur.fetchone()["ok"]
+            except psycopg2.Error as e:
+                # Al caerse la conexión Postgres suelta sus advisory locks
+                print("⚠️ Conexión de bloqueos de sesión perdida:", e)
+                if self._conexion_bloqueos is not None:
+                    self._conexion_bloqueos.close()
+                self._conexion_bloqueos = None
+                return None
+
+    @contextmanager
+    def bloqueo(self, clave):
+        """Serializa los mensajes de un número entre todos los workers.
+
+        Dentro del proceso basta un Lock por número; entre procesos, un
+        advisory lock tomado en una conexión propia en autocommit, así
+        ninguna conexión del pool queda prestada mientras dura el bloque.
+        """
+        with self._bloqueos_hilos.bloqueo(clave):
+            limite = time.monotonic() + SESIONES_ESPERA_BLOQUEO
+            adquirido = False
+            while True:
+                adquirido = self._consultar_bloqueo(
+                    "SELECT pg_try_advisory_lock(hashtext(%s)) AS ok;", clave
+                )
+                if adquirido or adquirido is None:
+                    break
+                if time.monotonic() >= limite:
+                    _sin_bloqueo(clave)
+                    break
+                time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if adquirido:
+                    self._consultar_bloqueo(
+                        "SELECT pg_advisory_unlock(hashtext(%s)) AS ok;", clave
+                    )
+
+
+def crear_sesiones(backend=SESIONES_BACKEND):
+    """Almacén de sesiones según SESIONES_BACKEND."""
+    if backend == "memoria":
+        return SesionesMemoria()
+    if backend == "sqlite":
+        return SesionesSQLite()
+    if backend == "postgres":
+        return SesionesPostgres()
+    raise ValueError(f"Backend de sesiones desconocido: {backend}")
@@ -0,0 +1,85 @@
+import re
+import threading
+
+# === SINÓNIMOS ===
+# Tabla por defecto; la tabla Sinonimo de la base de datos la amplía o corrige.
+SINONIMOS = {
+    "libretas": "cuaderno",
+    "libreta": "cuaderno",
+    "adhesivos": "stickers",
+    "pegatinas": "stickers",
+    "adhesivo": "stickers",
+    "lapiceros": "lápices de colores",
+    "lapicero": "lápices de colores",
+    "respuesto de hojas": "hojas",
+    "respuestos": "hojas",
+    "respuesto": "hojas",
+    "hojitas": "hojas",
+    "marcador": "marcadores",
+    "marcadores stabilo": "bolígrafos",
+    "lapiceras": "bolígrafos",
+    "lapicera": "bolígrafos",
+    "corrector": "correctores",
+    "goma": "correctores",
+    "estuche": "estucheras",
+    "cartuchera": "estucheras",
+    "porta lápiz": "estucheras",
+    "porta lapiz": "estucheras",
+}
+
+
+def compilar_sinonimos(sinonimos):
+    """Compila la tabla en una sola alternancia, de la frase más larga a la
+    más corta, para que en cada posición gane la coincidencia más larga."""
+    tabla = {sin.lower(): real for sin, real in sinonimos.items() if sin.strip()}
+    if not tabla:
+        return None, tabla
+    alternativas = sorted(tabla, key=len, reverse=True)
+    patron = re.compile(
+        r"\b(?:" + "|".join(re.escape(sin) for sin in alternativas) + r")\b"
+    )
+    return patron, tabla
+
+
+class NormalizadorSinonimos:
+    """Reemplaza sinónimos en una sola pasada con un patrón precompilado."""
+
+    def __init__(self, sinonimos=SINONIMOS):
+        self._base = dict(sinonimos)
+        self._lock = threading.Lock()
+        # (patron, tabla) se reemplaza de una vez para que las lecturas
+        # concurrentes nunca vean un estado a medias
+        self._compilado = compilar_sinonimos(self._base)
+
+    def normalizar(self, texto):
+        texto = texto.lower()
+        patron, tabla = self._compilado
+        if patron is None:
+            return texto
+        return patron.sub(lambda m: tabla[m.group(0)], texto)
+
+    def actualizar(self, sinonimos):
+        with self._lock:
+            combinados = dict(self._base)
+            combinados.update(sinonimos)
+            self._compilado = compilar_sinonimos(combinados)
+
+    def recargar_desde_bd(self):
+        """Vuelve a leer la tabla Sinonimo y recompila el patrón."""
+        from bd import cursor_bd
+
+        with cursor_bd() as cur:
+            cur.execute("SELECT termino, reemplazo FROM Sinonimo WHERE activo;")
+            filas = cur.fetchall()
+        self.actualizar({f["termino"]: f["reemplazo"] for f in filas})
+        return len(filas)
+
+    def __len__(self):
+        return len(self._compilado[1])
+
+
+normalizador = NormalizadorSinonimos()
+
+
+def reemplazar_sinonimos(texto):
+    return normalizador.normalizar(texto)
@@ -0,0 +1,101 @@
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import bd
+from bd import PoolAgotado, PoolConexiones, sesion_bd
+
+
+class _ConexionFalsa:
+    def __init__(self, sana=True):
+        self.closed = False
+        self.sana = sana
+        self.info = self
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, consulta, parametros=None):
+        if not self.sana:
+            raise psycopg2.OperationalError("conexión cortada")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def conexiones(monkeypatch):
+    creadas = []
+
+    def connect(dsn, cursor_factory=None):
+        creadas.append(_ConexionFalsa())
+        return creadas[-1]
+
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    return creadas
+
+
+def _pool(**kwargs):
+    return PoolConexiones("dsn-falso", minimo=0, **kwargs)
+
+
+def test_sin_conexiones_libres_falla_tras_la_espera(conexiones):
+    pool = _pool(maximo=1, espera=0.05)
+    conn = pool.obtener()
+    inicio = time.monotonic()
+    with pytest.raises(PoolAgotado):
+        pool.obtener()
+    assert time.monotonic() - inicio >= 0.05
+    pool.devolver(conn)
+    assert pool.obtener() is conn
+
+
+def test_recicla_conexiones_inactivas(conexiones):
+    pool = _pool(max_inactiva=0.05)
+    vieja = pool.obtener()
+    pool.devolver(vieja)
+    time.sleep(0.1)
+    nueva = pool.obtener()
+    assert nueva is not vieja and vieja.closed
+    assert pool.estado()["creadas"] == 2
+
+
+def test_recicla_conexiones_demasiado_viejas(conexiones):
+    pool = _pool(max_vida=0.1)
+    vieja = pool.obtener()
+    pool.devolver(vieja)
+    assert pool.obtener() is vieja  # recién usada y aún joven
+    time.sleep(0.15)
+    pool.devolver(vieja)
+    assert pool.obtener() is not vieja and vieja.closed
+
+
+def test_reemplaza_la_conexion_que_no_responde(conexiones):
+    pool = _pool(verificar_tras=0)
+    caida = pool.obtener()
+    pool.devolver(caida)
+    caida.sana = False
+    assert pool.obtener() is not caida and caida.closed
+
+
+def test_sesion_anidada_reutiliza_la_conexion(conexiones, monkeypatch):
+    pool = _pool(maximo=1, espera=0.05)
+    monkeypatch.setattr(bd, "_pool", pool)
+    with sesion_bd() as externa:
+        with sesion_bd() as interna:
+            assert interna is externa
+            assert pool.estado()["prestadas"] == 1
+        assert pool.estado()["prestadas"] == 1
+    assert pool.estado() == {"libres": 1, "prestadas": 0, "maximo": 1, "creadas": 1}
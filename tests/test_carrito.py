@@ -0,0 +1,39 @@
+from carrito import _Cambios, aplicar
+
+
+def test_fijar_y_luego_sumar_se_compacta():
+    cambios = _Cambios()
+    cambios.sumar(1, 5)
+    cambios.fijar(1, 2)  # descarta la suma anterior
+    cambios.sumar(1, 1)
+    cambios.sumar(1, 3)
+    assert cambios.fijos == {"1": 2}
+    assert cambios.sumas == {"1": 4}
+    assert aplicar({"1": 10}, cambios) == {"1": 6}
+
+
+def test_quitar_y_volver_a_agregar():
+    cambios = _Cambios()
+    cambios.fijar(1, 0)
+    cambios.sumar(1, 2)
+    assert aplicar({"1": 7, "2": 1}, cambios) == {"1": 2, "2": 1}
+
+
+def test_cantidad_cero_o_negativa_borra_la_linea():
+    cambios = _Cambios()
+    cambios.fijar(1, 0)
+    cambios.sumar(2, -3)
+    cambios.sumar(3, -1)
+    assert aplicar({"1": 4, "2": 3, "3": 5}, cambios) == {"3": 4}
+
+
+def test_componer_aplica_los_cambios_posteriores_encima():
+    primeros = _Cambios()
+    primeros.sumar(1, 2)
+    primeros.sumar(2, 1)
+    posteriores = _Cambios()
+    posteriores.fijar(1, 1)
+    posteriores.sumar(1, 1)
+    posteriores.sumar(2, 1)
+    primeros.componer(posteriores)
+    assert aplicar({}, primeros) == {"1": 2, "2": 2}
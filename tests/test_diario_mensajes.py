@@ -0,0 +1,131 @@
+import json
+import threading
+from contextlib import contextmanager
+
+import psycopg2.extras
+import pytest
+
+import bd
+from diario_mensajes import DiarioMensajes
+
+
+class _Base:
+    """Tabla Mensaje falsa: guarda las filas que llegan por execute_values."""
+
+    def __init__(self):
+        self.filas = []
+        self.caida = False
+
+    @contextmanager
+    def cursor_bd(self, commit=False):
+        if self.caida:
+            raise ConnectionError("base caída")
+        cur = _Cursor()
+        yield cur
+        self.filas.extend(cur.filas)
+
+    def execute_values(self, cur, consulta, filas, template=None, page_size=100):
+        cur.filas.extend(filas)
+
+    def contenidos(self):
+        return [f[3] for f in self.filas]
+
+
+class _Cursor:
+    def __init__(self):
+        self.filas = []
+        self.connection = self
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def base(monkeypatch):
+    falsa = _Base()
+    monkeypatch.setattr(bd, "cursor_bd", falsa.cursor_bd, raising=False)
+    monkeypatch.setattr(psycopg2.extras, "execute_values", falsa.execute_values)
+    return falsa
+
+
+@pytest.fixture
+def crear(tmp_path):
+    diarios = []
+
+    def crear(**kwargs):
+        diario = DiarioMensajes(ruta=str(tmp_path), intervalo=60, **kwargs)
+        diarios.append(diario)
+        return diario
+
+    yield crear
+    for diario in diarios:
+        diario.detener()
+
+
+def test_segmento_de_proceso_muerto_se_inserta_una_vez(base, crear, tmp_path):
+    # Lo que dejó un proceso que murió sin vaciar su diario
+    (tmp_path / "999-muerto00.lock").write_text("")
+    with open(tmp_path / "999-muerto00-00000001.jsonl", "w") as archivo:
+        for i in range(3):
+            archivo.write(json.dumps([1, "cliente", "texto", f"viejo {i}", i]) + "\n")
+        archivo.write('[1, "cliente", "te')  # última línea a medio escribir
+
+    diario = crear()
+    diario.guardar(1, "nuevo")
+    assert diario.vaciar() == 4
+    assert base.contenidos() == ["viejo 0", "viejo 1", "viejo 2", "nuevo"]
+    assert diario.estadisticas()["recuperados"] == 3
+    assert not (tmp_path / "999-muerto00.lock").exists()
+
+    # El próximo proceso que arranca ya no encuentra nada que recuperar
+    otro = crear()
+    otro.guardar(1, "otro")
+    otro.vaciar()
+    assert base.contenidos().count("viejo 0") == 1
+    assert otro.estadisticas()["recuperados"] == 0
+
+
+def test_pendientes_en_orden_aunque_falle_la_base(base, crear):
+    diario = crear()
+    diario.guardar(1, "a")
+    diario.guardar(2, "otro chat")
+    diario.guardar(1, "b", emisor="sistema")
+    base.caida = True
+    with pytest.raises(ConnectionError):
+        diario.vaciar()
+    # El lote que falló vuelve delante de lo que llegó después
+    diario.guardar(1, "c")
+    pendientes = diario.pendientes(1)
+    assert [e.contenido for e in pendientes] == ["a", "b", "c"]
+    assert [e.ts for e in pendientes] == sorted(e.ts for e in pendientes)
+    assert diario.ultimo(1, "sistema").contenido == "b"
+
+    base.caida = False
+    diario.vaciar()
+    assert diario.pendientes(1) == []
+    assert base.contenidos() == ["a", "otro chat", "b", "c"]
+
+
+def test_cola_llena_falla_tras_la_espera(base, crear):
+    base.caida = True
+    diario = crear(max_pendientes=2, espera_max=0.05)
+    diario.guardar(1, "a")
+    diario.guardar(1, "b")
+    with pytest.raises(RuntimeError, match="llena"):
+        diario.guardar(1, "c")
+    assert diario.estadisticas()["esperas"] == 1
+    assert [e.contenido for e in diario.pendientes(1)] == ["a", "b"]
+    base.caida = False
+
+
+def test_cola_llena_espera_a_que_se_vacie(base, crear):
+    diario = crear(max_pendientes=2, espera_max=5)
+    diario.guardar(1, "a")
+    diario.guardar(1, "b")
+    # guardar despierta al hilo del diario, que vacía la cola y lo libera
+    hilo = threading.Thread(target=diario.guardar, args=(1, "c"))
+    hilo.start()
+    hilo.join(5)
+    assert not hilo.is_alive()
+    diario.vaciar()
+    assert base.contenidos() == ["a", "b", "c"]
@@ -0,0 +1,162 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import bd
+from idempotencia import MensajesProcesados
+
+
+class _CursorFalso:
+    """Entiende solo las consultas de idempotencia sobre MensajeProcesado."""
+
+    def __init__(self, filas):
+        self.filas = filas
+        self.resultado = None
+
+    def execute(self, consulta, parametros):
+        sid = parametros[-1] if "SET respuesta" in consulta else parametros[0]
+        fila = self.filas.get(sid)
+        self.resultado = None
+        if "INSERT INTO MensajeProcesado" in consulta:
+            vence = parametros[1]
+            if fila is None or (
+                fila["respuesta"] is None and fila["creado"] < time.monotonic() - vence
+            ):
+                self.filas[sid] = {
+                    "respuesta": None,
+                    "abandonado": False,
+                    "creado": time.monotonic(),
+                }
+                self.resultado = {"message_sid": sid}
+        elif "SET abandonado" in consulta:
+            if fila is not None and fila["respuesta"] is None:
+                fila["abandonado"] = True
+                self.resultado = {"message_sid": sid}
+        elif "SET respuesta" in consulta:
+            if fila is not None:
+                fila["respuesta"] = parametros[0]
+                self.resultado = {"abandonado": fila["abandonado"]}
+        elif "SELECT respuesta" in consulta:
+            if fila is not None:
+                self.resultado = {"respuesta": fila["respuesta"]}
+        elif "DELETE FROM MensajeProcesado" in consulta:
+            if fila is not None and fila["respuesta"] is None:
+                del self.filas[sid]
+
+    def fetchone(self):
+        return self.resultado
+
+
+@pytest.fixture
+def tabla(monkeypatch):
+    filas = {}
+    lock = threading.Lock()
+
+    @contextmanager
+    def cursor_bd(commit=False):
+        with lock:
+            yield _CursorFalso(filas)
+
+    monkeypatch.setattr(bd, "cursor_bd", cursor_bd, raising=False)
+    return filas
+
+
+def _calculo_lento(respuesta="hola", fallar=False):
+    """``calcular`` que no termina hasta que se suelta su Event."""
+    soltar = threading.Event()
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        soltar.wait(5)
+        if fallar:
+            raise ValueError("LLM caído")
+        return respuesta
+
+    return calcular, soltar, llamadas
+
+
+def _en_hilo(funcion, *args):
+    resultado = {}
+
+    def correr():
+        try:
+            resultado["valor"] = funcion(*args)
+        except Exception as e:
+            resultado["error"] = e
+
+    hilo = threading.Thread(target=correr)
+    hilo.start()
+    return hilo, resultado
+
+
+def test_reintento_en_curso_recibe_la_misma_respuesta(tabla):
+    procesados = MensajesProcesados(espera=5)
+    calcular, soltar, llamadas = _calculo_lento()
+    original, r1 = _en_hilo(procesados.procesar, "SM1", calcular)
+    while not llamadas:
+        time.sleep(0.01)
+    reintento, r2 = _en_hilo(procesados.procesar, "SM1", calcular)
+    time.sleep(0.05)
+    soltar.set()
+    original.join()
+    reintento.join()
+    assert r1["valor"] == r2["valor"] == "hola"
+    assert len(llamadas) == 1
+    assert procesados.estadisticas()["coalescidos"] == 1
+
+
+def test_reintento_tras_completar_no_recalcula(tabla):
+    procesados = MensajesProcesados()
+    assert procesados.procesar("SM1", lambda: "hola") == "hola"
+    assert procesados.procesar("SM1", lambda: pytest.fail("recalculó")) == "hola"
+    # Otro proceso (sin la memoria de este) la lee de MensajeProcesado
+    otro = MensajesProcesados()
+    assert otro.procesar("SM1", lambda: pytest.fail("recalculó")) == "hola"
+    assert tabla["SM1"]["respuesta"] == "hola"
+
+
+def test_fallo_se_libera_y_el_reintento_recalcula(tabla):
+    procesados = MensajesProcesados()
+
+    def falla():
+        raise ValueError("LLM caído")
+
+    with pytest.raises(ValueError):
+        procesados.procesar("SM1", falla)
+    assert "SM1" not in tabla
+    assert procesados.procesar("SM1", lambda: "hola") == "hola"
+
+
+def test_reintento_unido_a_un_fallo_recalcula(tabla):
+    procesados = MensajesProcesados(espera=5)
+    calcular, soltar, _ = _calculo_lento(fallar=True)
+    original, r1 = _en_hilo(procesados.procesar, "SM1", calcular)
+    while "SM1" not in tabla:
+        time.sleep(0.01)
+    reintento, r2 = _en_hilo(procesados.procesar, "SM1", lambda: "hola")
+    time.sleep(0.05)
+    soltar.set()
+    original.join()
+    reintento.join()
+    assert isinstance(r1["error"], ValueError)
+    assert r2 == {"valor": "hola"}
+
+
+def test_respuesta_abandonada_se_entrega_una_vez(tabla):
+    procesados = MensajesProcesados(espera=0.05)
+    calcular, soltar, _ = _calculo_lento()
+    entregadas = []
+    original, r1 = _en_hilo(procesados.procesar, "SM1", calcular, entregadas.append)
+    while "SM1" not in tabla:
+        time.sleep(0.01)
+    # El reintento se cansa de esperar: la petición original ya venció
+    assert procesados.procesar("SM1", calcular, entregadas.append) is None
+    soltar.set()
+    original.join()
+    assert r1["valor"] == "hola"
+    assert entregadas == ["hola"]
+    assert procesados.procesar("SM1", calcular, entregadas.append) == "hola"
+    assert entregadas == ["hola"]
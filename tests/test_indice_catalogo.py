@@ -0,0 +1,33 @@
+from catalogo import CategoriaCatalogo, ProductoCatalogo
+from indice_catalogo import IndiceCatalogo
+
+
+def _indice(*extra):
+    productos = [
+        ProductoCatalogo(1, "Cuaderno Rayado", "", 5, 1, "Cuadernos", 10, ()),
+        ProductoCatalogo(2, "Block Carta", "", 3, 2, "Hojas", 8, ()),
+        *extra,
+    ]
+    categorias = [
+        CategoriaCatalogo(1, "Cuadernos", (1,)),
+        CategoriaCatalogo(2, "Hojas", (2,)),
+        CategoriaCatalogo(3, "Marcadores", tuple(p.id for p in extra)),
+    ]
+    return IndiceCatalogo(productos, categorias)
+
+
+def test_palabra_comun_no_se_corrige_a_categoria():
+    # "rojas" está a distancia 1 de "hojas", pero es una palabra común
+    menciones = _indice().buscar_menciones("tienen lapiceros rojas?")
+    assert [(m.tipo, m.id) for m in menciones] == []
+
+
+def test_error_de_tipeo_sigue_corrigiendose():
+    menciones = _indice().buscar_menciones("quiero ver hojaz")
+    assert [(m.tipo, m.id, m.exacta) for m in menciones] == [("categoria", 2, False)]
+
+
+def test_palabra_comun_coincide_si_es_parte_del_nombre():
+    marcador = ProductoCatalogo(3, "Marcador Rojas", "", 2, 3, "Marcadores", 6, ())
+    menciones = _indice(marcador).buscar_menciones("marcador rojas")
+    assert [(m.tipo, m.id, m.exacta) for m in menciones] == [("producto", 3, True)]